@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Send rate of the socket transport over a socket pair: pack and write()
+per message, against packing into a SendBuffer and sending a window of
+messages with write_buffer().
+
+    python3 -m benchmarks.batch_send [--apidir DIR] [-n MESSAGES] [--window N]
+"""
+
+import argparse
+import socket
+import threading
+import time
+
+from vpp_papi import vpp_serializer
+from vpp_papi.vpp_papi import VPPApiJSONFiles
+from vpp_papi.vpp_transport_socket import VppTransport
+
+MESSAGES = {
+    "sw_interface_set_flags": lambda i: {"sw_if_index": i % 1024, "flags": 1},
+    "ip_route_add_del": lambda i: {
+        "is_add": True,
+        "route": {
+            "table_id": 0,
+            "prefix": "10.%d.%d.0/24" % (i // 256 % 256, i % 256),
+            "n_paths": 1,
+            "paths": [
+                {
+                    "sw_if_index": 1,
+                    "nh": {"address": {"ip4": "192.0.2.1"}},
+                    "label_stack": [{}] * 16,
+                }
+            ],
+        },
+    },
+}
+
+
+def drain(sock):
+    while sock.recv(1 << 20):
+        pass
+
+
+def run(msg, fields, n, window, buffered):
+    t = VppTransport(None, 0, None)
+    t.socket, peer = socket.socketpair()
+    t.connected = True
+    reader = threading.Thread(target=drain, args=(peer,))
+    reader.start()
+    start = time.perf_counter()
+    if buffered:
+        sb = t.send_buffer()
+        for f in fields:
+            sb.pack(msg, f)
+            if len(sb) == window:
+                t.write_buffer(sb)
+        t.write_buffer(sb)
+    else:
+        for f in fields:
+            t.write(msg.pack(f))
+    elapsed = time.perf_counter() - start
+    t.socket.close()
+    reader.join()
+    peer.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--apidir", action="append", help="API JSON directory")
+    parser.add_argument("-n", type=int, default=100000, help="messages per run")
+    parser.add_argument("--window", type=int, default=256, help="messages per send")
+    args = parser.parse_args()
+
+    _, messages, _ = VPPApiJSONFiles.load_api(apidir=args.apidir)
+    for compiled in (False, True):
+        vpp_serializer.set_compiled_codecs(compiled)
+        print("compiled codecs" if compiled else "interpreted codecs")
+        for name, make in MESSAGES.items():
+            msg = messages[name]
+            fields = [
+                dict(make(i), _vl_msg_id=1, context=i, client_index=1)
+                for i in range(args.n)
+            ]
+            for label, buffered in (("write", False), ("SendBuffer", True)):
+                elapsed = run(msg, fields, args.n, args.window, buffered)
+                print(
+                    "  {:24} {:10} {:6.2f} us/msg {:9.0f} msgs/s".format(
+                        name, label, elapsed / args.n * 1e6, args.n / elapsed
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Memory held by a retained dump: decoded namedtuples, LazyMessage objects
+(not counting the receive buffers they keep alive) and a MessageTable,
+for NAT session, interface and route details.
+
+    python3 -m benchmarks.compact_memory [--apidir DIR] [-n MESSAGES]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from vpp_papi.vpp_papi import VPPApiJSONFiles
+from vpp_papi.vpp_table import MessageTable
+
+MESSAGES = {
+    "nat44_user_session_v3_details": lambda i: {
+        "outside_ip_address": "192.0.2.1",
+        "outside_port": i % 65536,
+        "inside_ip_address": "10.0.%d.%d" % (i // 256 % 256, i % 256),
+        "inside_port": 1024 + i % 60000,
+        "protocol": 6,
+        "flags": 0,
+        "last_heard": 1000 + i,
+        "time_since_last_heard": 10,
+        "total_bytes": 123456 + i,
+        "total_pkts": 1000 + i,
+        "ext_host_address": "198.51.100.1",
+        "ext_host_port": 443,
+        "ext_host_nat_address": "203.0.113.1",
+        "ext_host_nat_port": 443,
+    },
+    "sw_interface_details": lambda i: {
+        "sw_if_index": i,
+        "sup_sw_if_index": i,
+        "l2_address": "02:00:00:00:%02x:%02x" % (i // 256 % 256, i % 256),
+        "flags": 3,
+        "link_speed": 10000000,
+        "link_mtu": 1500,
+        "mtu": [1500, 1500, 0, 0],
+        "interface_name": "GigabitEthernet0/%d/0" % i,
+        "interface_dev_type": "dpdk",
+        "tag": "",
+    },
+    "ip_route_details": lambda i: {
+        "route": {
+            "table_id": 0,
+            "prefix": "10.%d.%d.0/24" % (i // 256 % 256, i % 256),
+            "n_paths": 1,
+            "paths": [
+                {
+                    "sw_if_index": 1,
+                    "nh": {"address": {"ip4": "192.0.2.1"}},
+                    "label_stack": [{}] * 16,
+                }
+            ],
+        }
+    },
+}
+
+
+def measure(f):
+    """Bytes allocated and still held by the result of f(), and seconds."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    r = f()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return r, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--apidir", action="append", help="API JSON directory")
+    parser.add_argument("-n", type=int, default=100000, help="messages per dump")
+    args = parser.parse_args()
+
+    _, messages, _ = VPPApiJSONFiles.load_api(apidir=args.apidir)
+    for name, fields in MESSAGES.items():
+        msg = messages[name]
+        bufs = [msg.pack(dict(fields(i), _vl_msg_id=1)) for i in range(args.n)]
+        print("{} ({} bytes on the wire)".format(name, len(bufs[0])))
+
+        def table():
+            t = MessageTable(msg)
+            t.extend(bufs)
+            return t
+
+        for label, f in (
+            ("namedtuples", lambda: [msg.unpack(b)[0] for b in bufs]),
+            ("LazyMessage", lambda: [msg.unpack_lazy(b) for b in bufs]),
+            ("MessageTable", table),
+        ):
+            r, size, elapsed = measure(f)
+            print(
+                "  {:14} {:8.1f} MB {:7.0f} bytes/msg {:8.2f} us/msg".format(
+                    label, size / 1e6, size / args.n, elapsed / args.n * 1e6
+                )
+            )
+            del r
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Cost of the receive path for event-heavy workloads: classifying each
+message as reply or event (has_context), and classifying plus decoding
+handing events to the callback (msg_handler_async), for interface, BFD and
+neighbor events.
+
+    python3 -m benchmarks.event_decode [--apidir DIR] [-n MESSAGES]
+"""
+
+import argparse
+import time
+
+from vpp_papi import VPPApiClient
+
+EVENTS = {
+    "sw_interface_event": {"sw_if_index": 1, "flags": 3},
+    "bfd_udp_session_event": {
+        "sw_if_index": 1,
+        "local_addr": "10.0.0.1",
+        "peer_addr": "10.0.0.2",
+        "state": 3,
+        "desired_min_tx": 300000,
+        "required_min_rx": 300000,
+        "detect_mult": 3,
+    },
+    "ip_neighbor_event_v2": {
+        "flags": 1,
+        "neighbor": {
+            "sw_if_index": 1,
+            "mac_address": "01:02:03:04:05:06",
+            "ip_address": "10.0.0.2",
+        },
+    },
+}
+
+
+class Transport:
+    """Connects to nothing, numbers the messages in a message table."""
+
+    def __init__(self, client):
+        self.client = client
+        self.connected = False
+        self.socket_index = 1
+        self.message_table = {}
+
+    def connect(self, name, pfx, msg_handler, rx_qlen, do_async=False):
+        for i, (n, m) in enumerate(sorted(self.client.messages.items()), 1):
+            self.message_table[n + "_" + m.crc[2:]] = i
+        return 0
+
+    def get_callback(self, do_async):
+        return None
+
+    def get_msg_index(self, name):
+        return self.message_table.get(name, 0)
+
+    def msg_table_max_index(self):
+        return len(self.message_table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--apidir", action="append", help="API JSON directory")
+    parser.add_argument("-n", type=int, default=100000, help="messages per run")
+    args = parser.parse_args()
+
+    vpp = VPPApiClient(apidir=args.apidir, async_thread=False)
+    vpp.transport = Transport(vpp)
+    vpp.connect("bench")
+    events = []
+    vpp.register_event_callback(lambda name, r: events.append(r))
+
+    for name, fields in EVENTS.items():
+        msg = vpp.messages[name]
+        fields = dict(fields, _vl_msg_id=vpp._msg_index(name), client_index=0)
+        buf = msg.pack(fields)
+
+        start = time.perf_counter()
+        for _ in range(args.n):
+            vpp.has_context(buf)
+        classify = (time.perf_counter() - start) / args.n
+
+        start = time.perf_counter()
+        for _ in range(args.n):
+            if not vpp.has_context(buf):
+                vpp.msg_handler_async(buf)
+        dispatch = (time.perf_counter() - start) / args.n
+        del events[:]
+
+        print(
+            "{:24} has_context {:7.2f} us  classify+decode+callback {:7.2f} us "
+            "{:9.0f} events/s".format(
+                name, classify * 1e6, dispatch * 1e6, 1 / dispatch
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Decode time of a route dump with per-value type conversion, and with
+no conversion followed by vpp_format.convert_messages() in the
+"ipaddress" and "raw" modes.
+
+    python3 -m benchmarks.format_convert [--apidir DIR] [-n ROUTES]
+"""
+
+import argparse
+import gc
+import ipaddress
+import time
+
+from vpp_papi import vpp_format
+from vpp_papi.vpp_papi import VPPApiJSONFiles
+
+
+def routes(msg, n, nexthops):
+    path = {"sw_if_index": 1, "proto": 0, "label_stack": [{}] * 16}
+    base = int(ipaddress.IPv4Address("10.0.0.0"))
+    for i in range(n):
+        nh = str(ipaddress.IPv4Address(base + i % nexthops))
+        prefix = "%s/32" % ipaddress.IPv4Address(base + (1 << 24) + i)
+        paths = [dict(path, nh={"address": {"ip4": nh}})]
+        route = {"table_id": 0, "prefix": prefix, "n_paths": 1, "paths": paths}
+        yield msg.pack({"_vl_msg_id": 1, "route": route})
+
+
+def best(f, repeat=3):
+    """Shortest of repeat runs of f(), in seconds, and its result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        r = f()
+        times.append(time.perf_counter() - start)
+    return min(times), r
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--apidir", action="append", help="API JSON directory")
+    parser.add_argument("-n", type=int, default=100000, help="routes")
+    parser.add_argument("--nexthops", type=int, default=64, help="distinct next hops")
+    args = parser.parse_args()
+
+    _, messages, _ = VPPApiJSONFiles.load_api(apidir=args.apidir)
+    msg = messages["ip_route_details"]
+    bufs = list(routes(msg, args.n, args.nexthops))
+    gc.disable()
+
+    converted, _ = best(lambda: [msg.unpack(b)[0] for b in bufs])
+    plain, unconverted = best(lambda: [msg.unpack(b, ntc=True)[0] for b in bufs])
+    results = [
+        ("decode without conversion", plain),
+        ("conversion while decoding", converted - plain),
+    ]
+    for mode in ("ipaddress", "raw"):
+
+        def convert():
+            vpp_format.clear_caches()
+            return vpp_format.convert_messages(unconverted, mode)
+
+        results.append(("convert_messages " + mode, best(convert)[0]))
+
+    for name, elapsed in results:
+        print("{:28} {:8.2f} us/route".format(name, elapsed / args.n * 1e6))
+
+
+if __name__ == "__main__":
+    main()
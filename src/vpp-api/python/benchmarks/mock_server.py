@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Client throughput against MockVppServer: synchronous calls, pipelined
+batches, a dump, and connect / disconnect cycles.
+
+    python3 -m benchmarks.mock_server [--apidir DIR] [-n CALLS] [--latency S]
+"""
+
+import argparse
+import time
+
+from vpp_papi import VPPApiClient
+from vpp_papi.vpp_mock_server import MockVppServer
+from vpp_papi.vpp_papi import VPPApiJSONFiles
+
+
+def rate(f, n):
+    start = time.perf_counter()
+    f()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--apidir", action="append", help="API JSON directory")
+    parser.add_argument("-n", type=int, default=20000, help="calls per run")
+    parser.add_argument("--latency", type=float, default=0, help="server latency")
+    args = parser.parse_args()
+
+    _, messages, services = VPPApiJSONFiles.load_api(apidir=args.apidir)
+    definitions = (messages, services)
+    details = [
+        {"sw_if_index": i, "interface_name": "eth%d" % i, "mtu": [1500, 0, 0, 0]}
+        for i in range(1000)
+    ]
+
+    with MockVppServer(definitions=definitions, latency=args.latency) as server:
+        server.set_details("sw_interface_dump", details)
+        vpp = VPPApiClient(
+            definitions=definitions,
+            server_address=server.server_address,
+            async_thread=False,
+        )
+        vpp.connect("bench")
+        n = args.n
+
+        def sync():
+            for i in range(n):
+                vpp.api.sw_interface_set_flags(sw_if_index=i % 1000, flags=1)
+
+        results = [("sync calls", rate(sync, n), "calls/s")]
+        for window in (16, 256):
+
+            def batch():
+                with vpp.batch(window=window) as b:
+                    for i in range(n):
+                        b.sw_interface_set_flags(sw_if_index=i % 1000, flags=1)
+
+            results.append(("batch window %d" % window, rate(batch, n), "calls/s"))
+
+        dumps = max(1, n // 1000)
+
+        def dump():
+            for _ in range(dumps):
+                vpp.api.sw_interface_dump()
+
+        results.append(("sw_interface_dump", rate(dump, dumps * 1000), "details/s"))
+        vpp.disconnect()
+
+        cycles = max(1, n // 200)
+
+        def reconnect():
+            for _ in range(cycles):
+                vpp.connect("bench")
+                vpp.disconnect()
+
+        results.append(("connect+disconnect", rate(reconnect, cycles), "cycles/s"))
+
+    for name, value, unit in results:
+        print("{:20} {:10.0f} {}".format(name, value, unit))
+
+
+if __name__ == "__main__":
+    main()
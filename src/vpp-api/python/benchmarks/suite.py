@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmark suite of the vpp_papi hot paths, with results saved as JSON
+to compare commits.
+
+    python3 -m benchmarks.suite [--apidir DIR] [-k NAME] [-o RESULT.json]
+                                [--compare BASELINE.json]
+
+This and the other benchmarks are run as modules from src/vpp-api/python,
+so that the vpp_papi of the source tree is imported.
+
+Covers loading the API definitions, packing and unpacking a few
+representative messages with the interpreted and compiled codecs,
+vpp_format conversions, VPPStats counter reads on a MockStatsSegment,
+and request / reply round trips on a socket pair and MockVppServer.
+The benchmarks that need the API JSON files (from --apidir, or VPP's
+install location) are skipped if there are none.
+
+Every benchmark is calibrated to run for at least --min-time seconds
+per sample, and --repeat samples are taken. Times are per operation.
+With --compare, benchmarks whose median moved by more than
+--threshold are flagged, and the exit status is 1 if any got slower:
+
+    git checkout main && python3 -m benchmarks.suite -o main.json
+    git checkout topic && python3 -m benchmarks.suite --compare main.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import ipaddress
+import json
+import os
+import platform
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from vpp_papi import VPPApiClient, VPPRuntimeError
+from vpp_papi import vpp_format, vpp_serializer, vpp_stats
+from vpp_papi.vpp_mock_server import MockVppServer, memclnt_definitions
+from vpp_papi.vpp_mock_stats import MockStatsSegment
+from vpp_papi.vpp_papi import VPPApiJSONFiles
+from vpp_papi.vpp_transport_socket import RecvBuffer
+
+BENCHMARKS = {}
+
+
+class Skip(Exception):
+    """Raised by the setup of a benchmark that cannot run."""
+
+
+def benchmark(name):
+    """Register setup(ctx, stack) as benchmark name. setup returns the
+    function to time and the number of operations per call; resources
+    it enters on stack are released after the benchmark."""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class Context:
+    """State shared by the benchmarks of a run, built on first use."""
+
+    def __init__(self, args):
+        self.args = args
+        self.stack = contextlib.ExitStack()
+        self._api = None
+        self._api_error = None
+        self._memclnt = None
+        self._segment = None
+
+    @property
+    def api(self):
+        """(messages, services) of the API files. Raises Skip if there
+        are none."""
+        if self._api_error is not None:
+            raise Skip(self._api_error)
+        if self._api is None:
+            try:
+                _, messages, services = VPPApiJSONFiles.load_api(
+                    apidir=self.args.apidir
+                )
+            except VPPRuntimeError:
+                messages = None
+            if not messages:
+                self._api_error = "no API JSON files found, see --apidir"
+                raise Skip(self._api_error)
+            self._api = messages, services
+        return self._api
+
+    @property
+    def messages(self):
+        return self.api[0]
+
+    @property
+    def memclnt(self):
+        """(messages, services) of the memclnt API shipped with
+        vpp_papi, for the benchmarks that need no API files."""
+        if self._memclnt is None:
+            self._memclnt = memclnt_definitions()[:2]
+        return self._memclnt
+
+    @property
+    def segment(self):
+        """A stats segment with interface, error and node counters."""
+        if self._segment is None:
+            threads, n = self.args.threads, self.args.interfaces
+            seg = self.stack.enter_context(contextlib.closing(MockStatsSegment()))
+            seg.add_combined("/if/rx", threads, n)
+            seg.add_simple("/if/drops", threads, n)
+            seg.add_name("/if/names", ["eth%d" % i for i in range(n)])
+            for i in range(0, n, max(1, n // 100)):
+                seg.add_symlink("/interfaces/eth%d/rx" % i, "/if/rx", i)
+            for t in range(threads):
+                for i in range(n):
+                    seg.set_combined("/if/rx", t, i, i, 64 * i)
+            for node in range(self.args.nodes):
+                for err in range(10):
+                    seg.add_simple("/err/node%d/error%d" % (node, err), threads, 1)
+            self._segment = seg
+        return self._segment
+
+    def close(self):
+        self.stack.close()
+
+
+# Loading API definitions
+
+
+@benchmark("load_api")
+def load_api(ctx, stack):
+    ctx.api  # Skip without API files
+    return lambda: VPPApiJSONFiles.load_api(apidir=ctx.args.apidir), 1
+
+
+@benchmark("load_api.cached")
+def load_api_cached(ctx, stack):
+    ctx.api  # Skip without API files
+    cache = stack.enter_context(tempfile.TemporaryDirectory())
+
+    def load():
+        VPPApiJSONFiles.load_api(apidir=ctx.args.apidir, cache=cache)
+
+    load()
+    return load, 1
+
+
+# Message packing and unpacking
+
+
+def route(i):
+    base = int(ipaddress.IPv4Address("10.0.0.0"))
+    path = {
+        "sw_if_index": 1,
+        "proto": 0,
+        "label_stack": [{}] * 16,
+        "nh": {"address": {"ip4": str(ipaddress.IPv4Address(base + i % 64))}},
+    }
+    return {
+        "table_id": 0,
+        "prefix": "%s/32" % ipaddress.IPv4Address(base + (1 << 24) + i),
+        "n_paths": 2,
+        "paths": [path, path],
+    }
+
+
+MESSAGES = {
+    "ip_route_add_del": {"is_add": True, "route": route(1)},
+    "acl_add_replace": {
+        "acl_index": 0xFFFFFFFF,
+        "tag": "bench",
+        "count": 16,
+        "r": [
+            {
+                "is_permit": 1,
+                "src_prefix": "10.0.0.0/8",
+                "dst_prefix": "192.168.%d.0/24" % i,
+                "proto": 6,
+                "srcport_or_icmptype_first": 0,
+                "srcport_or_icmptype_last": 65535,
+                "dstport_or_icmpcode_first": 80,
+                "dstport_or_icmpcode_last": 80,
+            }
+            for i in range(16)
+        ],
+    },
+    "sw_interface_details": {
+        "sw_if_index": 1,
+        "l2_address": "aa:bb:cc:dd:ee:01",
+        "flags": 3,
+        "link_speed": 10000000,
+        "mtu": [1500, 0, 0, 0],
+        "interface_name": "TenGigabitEthernet0/0/0",
+        "interface_dev_type": "dpdk",
+    },
+    "nat44_user_session_v3_details": {
+        "outside_ip_address": "192.0.2.1",
+        "outside_port": 1024,
+        "inside_ip_address": "10.0.0.1",
+        "inside_port": 40000,
+        "protocol": 6,
+        "last_heard": 1000,
+        "total_bytes": 1 << 20,
+        "total_pkts": 1000,
+        "ext_host_address": "198.51.100.1",
+        "ext_host_port": 443,
+        "ext_host_nat_address": "192.0.2.1",
+        "ext_host_nat_port": 443,
+    },
+}
+
+
+def codec(stack, compiled):
+    previous = vpp_serializer.compiled_codecs_enabled()
+    vpp_serializer.set_compiled_codecs(compiled)
+    stack.callback(vpp_serializer.set_compiled_codecs, previous)
+
+
+def register_codecs(name, fields):
+    fields = dict(fields, _vl_msg_id=1)
+
+    for compiled, suffix in ((False, ""), (True, ".compiled")):
+
+        @benchmark("pack.%s%s" % (name, suffix))
+        def pack(ctx, stack, compiled=compiled):
+            codec(stack, compiled)
+            msg = ctx.messages[name]
+            return lambda: msg.pack(fields), 1
+
+        @benchmark("unpack.%s%s" % (name, suffix))
+        def unpack(ctx, stack, compiled=compiled):
+            codec(stack, compiled)
+            msg = ctx.messages[name]
+            b = msg.pack(fields)
+            return lambda: msg.unpack(b), 1
+
+
+for _name, _fields in MESSAGES.items():
+    register_codecs(_name, _fields)
+
+
+# vpp_format conversions
+
+
+@benchmark("format.prefix")
+def format_prefix(ctx, stack):
+    prefixes = [route(i)["prefix"] for i in range(1000)]
+
+    def run():
+        for p in prefixes:
+            vpp_format.format_vl_api_prefix_t(p)
+
+    return run, len(prefixes)
+
+
+@benchmark("format.unformat_prefix")
+def unformat_prefix(ctx, stack):
+    msg = ctx.messages["ip_route_add_del"]
+    prefixes = [
+        msg.unpack(msg.pack({"_vl_msg_id": 1, "route": route(i)}), ntc=True)[
+            0
+        ].route.prefix
+        for i in range(1000)
+    ]
+
+    def run():
+        for p in prefixes:
+            vpp_format.unformat_api_prefix_t(p)
+
+    return run, len(prefixes)
+
+
+def register_convert(mode):
+    @benchmark("format.convert_messages." + mode)
+    def convert(ctx, stack):
+        msg = ctx.messages["ip_route_details"]
+        routes = [
+            msg.unpack(msg.pack({"_vl_msg_id": 1, "route": route(i)}), ntc=True)[0]
+            for i in range(1000)
+        ]
+
+        def run():
+            vpp_format.clear_caches()
+            vpp_format.convert_messages(routes, mode)
+
+        return run, len(routes)
+
+
+for _mode in ("ipaddress", "raw"):
+    register_convert(_mode)
+
+
+# VPPStats counter reads
+
+
+def stats_client(ctx, stack, **kwargs):
+    stats = ctx.segment.client(**kwargs)
+    stack.callback(stats.disconnect)
+    return stats
+
+
+@benchmark("stats.combined")
+def stats_combined(ctx, stack):
+    stats = stats_client(ctx, stack)
+    return lambda: stats["/if/rx"], 1
+
+
+@benchmark("stats.simple")
+def stats_simple(ctx, stack):
+    stats = stats_client(ctx, stack)
+    return lambda: stats["/if/drops"], 1
+
+
+@benchmark("stats.combined.typed_arrays")
+def stats_combined_arrays(ctx, stack):
+    stats = stats_client(ctx, stack, typed_arrays=True)
+    return lambda: stats["/if/rx"].sum_packets(axis=0), 1
+
+
+@benchmark("stats.simple.typed_arrays")
+def stats_simple_arrays(ctx, stack):
+    stats = stats_client(ctx, stack, typed_arrays=True)
+    return lambda: stats["/if/drops"].sum(axis=0), 1
+
+
+@benchmark("stats.symlink")
+def stats_symlink(ctx, stack):
+    stats = stats_client(ctx, stack)
+    return lambda: stats["/interfaces/eth0/rx"], 1
+
+
+@benchmark("stats.errors")
+def stats_errors(ctx, stack):
+    stats = stats_client(ctx, stack)
+    names = stats.ls("^/err/")
+    return lambda: stats.dump(names), len(names)
+
+
+@benchmark("stats.snapshot")
+def stats_snapshot(ctx, stack):
+    stats = stats_client(ctx, stack, typed_arrays=True)
+    patterns = ["^/if/rx$", "^/if/drops$", "^/err/"]
+    return lambda: stats.snapshot(patterns), 1
+
+
+@benchmark("stats.poll")
+def stats_poll(ctx, stack):
+    stats = stats_client(ctx, stack)
+    poller = vpp_stats.StatsPoller(stats, ["^/if/rx$", "^/if/drops$", "^/err/"])
+    poller.poll()
+    return poller.poll, 1
+
+
+@benchmark("stats.ls")
+def stats_ls(ctx, stack):
+    stats = stats_client(ctx, stack)
+    patterns = ["^/err/node1/", "^/if/", "^/interfaces/eth0/"]
+    return lambda: stats.ls(patterns), 1
+
+
+@benchmark("stats.ls.uncached")
+def stats_ls_uncached(ctx, stack):
+    stats = stats_client(ctx, stack)
+    patterns = ["^/err/node1/", "^/if/", "^/interfaces/eth0/", "^/err/.*/error1$"]
+
+    def run():
+        stats._ls_cache.clear()
+        return stats.ls(patterns)
+
+    return run, 1
+
+
+@benchmark("stats.connect")
+def stats_connect(ctx, stack):
+    """Connect and read the whole directory"""
+    seg = ctx.segment
+
+    def run():
+        seg.client().disconnect()
+
+    return run, 1
+
+
+@benchmark("stats.refresh")
+def stats_refresh(ctx, stack):
+    stats = stats_client(ctx, stack)
+    return stats.refresh, 1
+
+
+@benchmark("stats.refresh.changed")
+def stats_refresh_changed(ctx, stack):
+    """Refresh after a directory entry changed"""
+    seg = ctx.segment
+    if "/bench/scalar" not in seg.index:
+        seg.add_scalar("/bench/scalar")
+    stats = stats_client(ctx, stack)
+    values = iter(range(1 << 62))
+
+    def run():
+        with seg.lock():
+            seg.set_scalar("/bench/scalar", next(values))
+        stats.refresh()
+
+    return run, 1
+
+
+# Request / reply round trips
+
+
+def echo(sock, header):
+    rxbuf = RecvBuffer(header)
+    while True:
+        msgs = rxbuf.recv(sock)
+        if msgs is None:
+            return
+        for msg in msgs:
+            sock.sendall(header.pack(0, len(msg), 0) + msg)
+
+
+@benchmark("socket.roundtrip")
+def socket_roundtrip(ctx, stack):
+    header = struct.Struct(">QII")
+    a, b = socket.socketpair()
+    stack.callback(b.close)
+    stack.callback(a.close)
+    server = threading.Thread(target=echo, args=(b, header), daemon=True)
+    server.start()
+    stack.callback(server.join)
+    stack.callback(a.shutdown, socket.SHUT_WR)
+    msg = ctx.memclnt[0]["control_ping"]
+    body = msg.pack({"_vl_msg_id": 1})
+    frame = header.pack(0, len(body), 0) + body
+    rxbuf = RecvBuffer(header)
+
+    def run():
+        a.sendall(frame)
+        while not rxbuf.recv(a):
+            pass
+
+    return run, 1
+
+
+@benchmark("mock.sync_call")
+def mock_sync_call(ctx, stack):
+    server = stack.enter_context(MockVppServer(definitions=ctx.api))
+    vpp = VPPApiClient(
+        definitions=ctx.api,
+        server_address=server.server_address,
+        async_thread=False,
+    )
+    vpp.connect("bench")
+    stack.callback(vpp.disconnect)
+    return vpp.api.control_ping, 1
+
+
+# Running and comparing
+
+
+def sample(f, loops):
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            f()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def calibrate(f, min_time):
+    """Loops per sample for a sample to take at least min_time."""
+    loops = 1
+    while True:
+        elapsed = sample(f, loops)
+        if elapsed >= min_time:
+            return loops
+        if elapsed >= min_time / 100:
+            return max(loops + 1, int(loops * min_time / elapsed * 1.1))
+        loops *= 10
+
+
+def run_benchmark(ctx, setup):
+    args = ctx.args
+    with contextlib.ExitStack() as stack:
+        f, ops = setup(ctx, stack)
+        f()  # warm up: codecs and caches are built on first use
+        loops = calibrate(f, args.min_time)
+        times = [sample(f, loops) / loops / ops for _ in range(args.repeat)]
+    return {
+        "loops": loops,
+        "ops": ops,
+        "times": times,
+        "median": statistics.median(times),
+        "min": min(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(args):
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "min_time": args.min_time,
+        "repeat": args.repeat,
+    }
+
+
+def fmt_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:8.2f} {:2}".format(seconds / scale, unit)
+    return "{:8.2f} {:2}".format(seconds / 1e-9, "ns")
+
+
+def compare(old, new, threshold):
+    """Print the benchmarks of both runs, return the number that got
+    slower by more than threshold."""
+    slower = 0
+    print("\n{:44} {:>11} {:>11} {:>7}".format("benchmark", "baseline", "new", ""))
+    for name, result in new["benchmarks"].items():
+        base = old["benchmarks"].get(name)
+        if base is None:
+            continue
+        ratio = result["median"] / base["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "slower"
+            slower += 1
+        elif ratio < 1 - threshold:
+            flag = "faster"
+        print(
+            "{:44} {} {} {:6.2f}x {}".format(
+                name, fmt_time(base["median"]), fmt_time(result["median"]), ratio, flag
+            )
+        )
+    return slower
+
+
+def selected(names, keywords):
+    if not keywords:
+        return list(names)
+    return [n for n in names if any(k in n for k in keywords)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--apidir", action="append", help="API JSON directory")
+    parser.add_argument(
+        "-k", action="append", dest="keywords", help="run benchmarks matching"
+    )
+    parser.add_argument("-l", "--list", action="store_true", help="list benchmarks")
+    parser.add_argument("-o", "--output", help="write results to JSON file")
+    parser.add_argument("--compare", help="compare with the results of a JSON file")
+    parser.add_argument(
+        "--input", help="compare the results of a JSON file instead of running"
+    )
+    parser.add_argument("--threshold", type=float, default=0.1, help="change to flag")
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds/sample")
+    parser.add_argument("--repeat", type=int, default=5, help="samples")
+    parser.add_argument("--threads", type=int, default=4, help="stats threads")
+    parser.add_argument("--interfaces", type=int, default=10000, help="stats entries")
+    parser.add_argument("--nodes", type=int, default=200, help="error counter nodes")
+    args = parser.parse_args()
+
+    names = selected(BENCHMARKS, args.keywords)
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    if args.input:
+        with open(args.input) as f:
+            results = json.load(f)
+    else:
+        results = {"metadata": metadata(args), "benchmarks": {}}
+        ctx = Context(args)
+        try:
+            for name in names:
+                try:
+                    result = run_benchmark(ctx, BENCHMARKS[name])
+                except Skip as e:
+                    print("{:44} skipped: {}".format(name, e))
+                    continue
+                results["benchmarks"][name] = result
+                print(
+                    "{:44} {} +- {}  ({} loops)".format(
+                        name,
+                        fmt_time(result["median"]),
+                        fmt_time(result["stdev"]).strip(),
+                        result["loops"],
+                    )
+                )
+        finally:
+            ctx.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
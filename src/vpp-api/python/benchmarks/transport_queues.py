@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Per-message latency of the socket transport reader thread -> read() path,
+with multiprocessing queues and with the in-process queues.
+
+    python3 -m benchmarks.transport_queues [-n MESSAGES]
+"""
+
+import argparse
+import socket
+import struct
+import threading
+import time
+
+from vpp_papi.vpp_transport_socket import VppTransport
+
+
+class Parent:
+    def has_context(self, msg):
+        return True
+
+
+def run(mp_queues, n, size):
+    t = VppTransport(Parent(), read_timeout=5, server_address=None, mp_queues=mp_queues)
+    t.socket, peer = socket.socketpair()
+    t.connected = True
+    t.do_async = False
+    t.message_thread = threading.Thread(target=t.msg_thread_func, daemon=True)
+    t.message_thread.start()
+
+    body = struct.pack(">H", 1) + bytes(size - 2)
+    frame = t.header.pack(0, len(body), 0) + body
+
+    # Ping-pong: one message in flight, measures latency
+    start = time.perf_counter()
+    for _ in range(n):
+        peer.sendall(frame)
+        t.read()
+    latency = (time.perf_counter() - start) / n
+
+    # Streamed: all messages in flight, measures throughput
+    sender = threading.Thread(target=peer.sendall, args=(frame * n,))
+    start = time.perf_counter()
+    sender.start()
+    for _ in range(n):
+        t.read()
+    rate = n / (time.perf_counter() - start)
+    sender.join()
+
+    t.sque.put(True)
+    t.message_thread.join()
+    t.socket.close()
+    peer.close()
+    return latency, rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-n", type=int, default=20000, help="messages per run")
+    parser.add_argument("-s", "--size", type=int, default=64, help="message size")
+    args = parser.parse_args()
+
+    for name, mp_queues in (("multiprocessing", True), ("in-process", False)):
+        latency, rate = run(mp_queues, args.n, args.size)
+        print(
+            "{:16} {:8.2f} us/msg round trip {:10.0f} msg/s streamed".format(
+                name, latency * 1e6, rate
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
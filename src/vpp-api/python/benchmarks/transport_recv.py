@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Receive rate of framed messages on a socket pair: reading header and
+body with one recv_into() each into new buffers, against the
+RecvBuffer ring of the socket transport.
+
+    python3 -m benchmarks.transport_recv [-n MESSAGES] [-s SIZE ...]
+"""
+
+import argparse
+import socket
+import struct
+import threading
+import time
+
+from vpp_papi.vpp_transport_socket import RecvBuffer
+
+header = struct.Struct(">QII")
+
+
+def read_fixed(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while view:
+        got = sock.recv_into(view)
+        if got <= 0:
+            return None
+        view = view[got:]
+    return buf
+
+
+def per_message(sock, n):
+    for _ in range(n):
+        _, length, _ = header.unpack(read_fixed(sock, header.size))
+        read_fixed(sock, length)
+
+
+def ring(sock, n):
+    rxbuf = RecvBuffer(header)
+    while n > 0:
+        n -= len(rxbuf.recv(sock))
+
+
+def send(sock, frame, n):
+    chunk = frame * 1000
+    for _ in range(n // 1000):
+        sock.sendall(chunk)
+    sock.sendall(frame * (n % 1000))
+
+
+def run(receive, n, size):
+    a, b = socket.socketpair()
+    body = struct.pack(">H", 1) + bytes(size - 2)
+    frame = header.pack(0, len(body), 0) + body
+    sender = threading.Thread(target=send, args=(a, frame, n))
+    start = time.perf_counter()
+    sender.start()
+    receive(b, n)
+    elapsed = time.perf_counter() - start
+    sender.join()
+    a.close()
+    b.close()
+    return n / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-n", type=int, default=200000, help="messages per run")
+    parser.add_argument(
+        "-s", "--size", type=int, nargs="+", default=[64, 512, 4096], help="sizes"
+    )
+    args = parser.parse_args()
+
+    for size in args.size:
+        for name, receive in (("per message", per_message), ("RecvBuffer", ring)):
+            rate = run(receive, args.n, size)
+            print("{:5} bytes {:12} {:10.0f} msg/s".format(size, name, rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -128,3 +128,105 @@ class TestVppFormat(unittest.TestCase):
         # PY3: raises OSError
         with self.assertRaises((socket.error, OSError)):
             res = vpp_format.format_vl_api_ip4_prefix_t(ip6_prefix)
+
+
+class TestVppFormatConvertMessages(unittest.TestCase):
+    def setUp(self):
+        from vpp_papi.vpp_serializer import (
+            VPPEnumType,
+            VPPMessage,
+            VPPType,
+            VPPTypeAlias,
+            VPPUnionType,
+        )
+
+        VPPEnumType(
+            "vl_api_address_family_t",
+            [["ADDRESS_IP4", 0], ["ADDRESS_IP6", 1], {"enumtype": "u8"}],
+        )
+        VPPTypeAlias("vl_api_ip4_address_t", {"type": "u8", "length": 4})
+        VPPTypeAlias("vl_api_ip6_address_t", {"type": "u8", "length": 16})
+        VPPUnionType(
+            "vl_api_address_union_t",
+            [["vl_api_ip4_address_t", "ip4"], ["vl_api_ip6_address_t", "ip6"]],
+        )
+        VPPType(
+            "vl_api_address_t",
+            [["vl_api_address_family_t", "af"], ["vl_api_address_union_t", "un"]],
+        )
+        VPPType("vl_api_prefix_t", [["vl_api_address_t", "address"], ["u8", "len"]])
+        VPPType(
+            "vl_api_ip4_prefix_t", [["vl_api_ip4_address_t", "address"], ["u8", "len"]]
+        )
+        VPPType("test_rule_t", [["vl_api_prefix_t", "src"], ["u32", "id"]])
+        self.msg = VPPMessage(
+            "test_convert_details",
+            [
+                ["u16", "_vl_msg_id"],
+                ["u32", "context"],
+                ["vl_api_ip4_prefix_t", "prefix"],
+                ["vl_api_address_union_t", "nh"],
+                ["u8", "count"],
+                ["test_rule_t", "rules", 0, "count"],
+            ],
+        )
+        vpp_format.clear_caches()
+
+    def pack(self, prefix, nh, sources):
+        return self.msg.pack(
+            {
+                "prefix": prefix,
+                "nh": {"ip4": nh},
+                "count": len(sources),
+                "rules": [{"src": s, "id": i} for i, s in enumerate(sources)],
+            }
+        )
+
+    def test_ipaddress(self):
+        bufs = [
+            self.pack("10.0.0.0/8", "1.1.1.1", ["2.2.2.0/24", "dead::/64"]),
+            self.pack("10.0.0.0/8", "1.1.1.1", []),
+            self.pack("11.0.0.0/8", "1.1.1.2", ["2.2.2.0/24"]),
+        ]
+        expected = [self.msg.unpack(b)[0] for b in bufs]
+        raw = [self.msg.unpack(b, ntc=True)[0] for b in bufs]
+        converted = vpp_format.convert_messages(raw)
+        self.assertEqual(converted, expected)
+        self.assertEqual(type(converted[0]), type(expected[0]))
+        self.assertEqual(
+            converted[0].rules[1].src, ipaddress.IPv6Network(text_type("dead::/64"))
+        )
+        # Repeated values are interned
+        self.assertIs(converted[0].prefix, converted[1].prefix)
+        self.assertIs(converted[0].rules[0].src, converted[2].rules[0].src)
+
+    def test_raw(self):
+        b = self.pack("10.0.0.0/8", "1.1.1.1", ["dead::/64"])
+        (m,) = vpp_format.convert_messages([self.msg.unpack(b, ntc=True)[0]], "raw")
+        self.assertIsInstance(m.prefix, vpp_format.RawPrefix)
+        self.assertEqual(str(m.prefix), "10.0.0.0/8")
+        self.assertEqual(m.prefix.address, b"\x0a\x00\x00\x00")
+        self.assertEqual(str(m.nh.ip4), "1.1.1.1")
+        src = m.rules[0].src
+        self.assertEqual((str(src), src.address.version), ("dead::/64", 6))
+        self.assertEqual(src.ip_network(), ipaddress.ip_network(text_type("dead::/64")))
+        self.assertEqual(
+            m.nh.ip4.ip_address(), ipaddress.ip_address(text_type("1.1.1.1"))
+        )
+        # Raw values can be passed back in
+        self.assertEqual(self.pack(m.prefix, m.nh.ip4, [src]), b)
+
+    def test_register_mode(self):
+        vpp_format.register_unpacker_mode("str", {"vl_api_prefix_t": lambda o: "p"})
+        b = self.pack("10.0.0.0/8", "1.1.1.1", ["dead::/64"])
+        (m,) = vpp_format.convert_messages([self.msg.unpack(b, ntc=True)[0]], "str")
+        self.assertEqual(m.rules[0].src, "p")
+        self.assertEqual(m.prefix.address, b"\x0a\x00\x00\x00")
+        with self.assertRaises(ValueError):
+            vpp_format.convert_messages([m], "nosuchmode")
+
+    def test_interned(self):
+        calls = []
+        f = vpp_format.interned(lambda o: calls.append(o) or len(calls), maxsize=2)
+        self.assertEqual([f(b"a"), f(b"a"), f(b"b"), f(b"c"), f(b"a")], [1, 1, 2, 3, 4])
+        self.assertEqual(f([1]), 5)
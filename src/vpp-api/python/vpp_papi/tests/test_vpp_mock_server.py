@@ -0,0 +1,136 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import struct
+import time
+import unittest
+
+from vpp_papi import vpp_papi
+from vpp_papi.tests.test_vpp_papi import fake_definitions
+from vpp_papi.vpp_mock_server import MockVppServer
+
+
+class TestMockVppServer(unittest.TestCase):
+    def setUp(self):
+        self.server = MockVppServer(definitions=fake_definitions()).start()
+        self.addCleanup(self.server.stop)
+
+    def client(self, **kwargs):
+        c = vpp_papi.VPPApiClient(
+            apifiles=[],
+            testmode=True,
+            definitions=fake_definitions(),
+            server_address=self.server.server_address,
+            **kwargs,
+        )
+        c.connect("mock")
+        self.addCleanup(self.disconnect, c)
+        return c
+
+    def disconnect(self, c):
+        if c.transport.connected:
+            c.disconnect()
+
+    def test_message_table(self):
+        self.assertEqual(self.server.ids["sockclnt_create"], 15)
+        self.assertEqual(self.server.ids["sockclnt_create_reply"], 16)
+        c = self.client(async_thread=False)
+        self.assertGreater(c._msg_index("test_add"), 0)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_replies(self):
+        c = self.client(async_thread=False)
+        self.assertEqual(c.api.test_add(value=1).retval, 0)
+        self.server.set_reply("test_add", retval=0, value=42)
+        self.assertEqual(c.api.test_add(value=1).value, 42)
+        self.server.set_handler(
+            "test_add", lambda r, i: [("test_add_reply", {"value": r.value * 2})]
+        )
+        self.assertEqual(c.api.test_add(value=21).value, 42)
+        self.assertEqual(self.server.counts["test_add"], 3)
+        self.assertEqual(self.server.requests[-1].value, 21)
+
+    def test_streams(self):
+        c = self.client(async_thread=False)
+        details = [{"value": i} for i in range(5)]
+        self.server.set_details("test_dump", details)
+        self.server.set_details("test_get", details[:2])
+        self.server.set_reply("test_get", cursor=2)
+        # Old style dump, ended by control ping
+        self.assertEqual([d.value for d in c.api.test_dump(count=5)], list(range(5)))
+        # Reply after the details
+        r, d = c.api.test_get(cursor=0, count=2)
+        self.assertEqual(r.cursor, 2)
+        self.assertEqual([x.value for x in d], [0, 1])
+
+    def test_events(self):
+        c = self.client()
+        events = []
+        c.register_event_callback(lambda name, r: events.append((name, r.value)))
+        self.server.send_event("test_event", pid=1, value=7)
+        deadline = time.monotonic() + 5
+        while not events and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(events, [("test_event", 7)])
+
+    def test_latency(self):
+        c = self.client(async_thread=False)
+        self.server.set_latency("test_add", 0.05)
+        start = time.monotonic()
+        c.api.test_add(value=1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_batch(self):
+        c = self.client(async_thread=False)
+        self.server.set_handler(
+            "test_add", lambda r, i: [("test_add_reply", {"value": r.value + 1})]
+        )
+        with c.batch(window=16) as b:
+            for v in range(100):
+                b.test_add(value=v)
+        self.assertEqual([r.value for r in b.results], list(range(1, 101)))
+
+    def test_reconnect(self):
+        c = self.client(async_thread=False)
+        self.server.disconnect_clients()
+        self.assertEqual(self.server.clients, {})
+        with self.assertRaises(IOError):
+            c.api.test_add(value=1)
+        c.disconnect()
+        c.connect("mock")
+        self.assertEqual(c.api.test_add(value=1).retval, 0)
+
+    def test_unknown_message(self):
+        c = self.client(async_thread=False)
+        with self.assertRaises(ValueError):
+            self.server.handle(struct.pack(">HII", 9999, 0, 1), 1)
+        # The connection is closed instead of leaving the call to time out
+        start = time.monotonic()
+        with self.assertLogs("vpp_papi.mock_server", "ERROR"):
+            c.transport.write(struct.pack(">HII", 9999, 0, 1))
+            with self.assertRaises(IOError):
+                c.api.test_add(value=1)
+        self.assertLess(time.monotonic() - start, c.read_timeout)
+        self.assertEqual(self.server.clients, {})
+
+    def test_stop(self):
+        path = self.server.server_address
+        self.server.stop()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,14 +12,243 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import collections
 import ctypes
+import json
+import logging
 import multiprocessing as mp
+import os
+import select
+import socket
+import struct
 import sys
+import tempfile
+import threading
+import time
 import unittest
 from unittest import mock
 
+import pkg_resources
+
+from vpp_papi import vpp_api_cache
+from vpp_papi import vpp_instrument
 from vpp_papi import vpp_papi
+from vpp_papi import vpp_papi_pool
+from vpp_papi import vpp_serializer
+from vpp_papi import vpp_table
 from vpp_papi import vpp_transport_shmem
+from vpp_papi import vpp_transport_socket
+
+TEST_API = {
+    "enums": [
+        [
+            "address_family",
+            ["ADDRESS_IP4", 0],
+            ["ADDRESS_IP6", 1],
+            {"enumtype": "u8"},
+        ]
+    ],
+    "messages": [
+        [
+            "test_add",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "context"],
+            ["u32", "value"],
+            {"crc": "0x00000001"},
+        ],
+        [
+            "test_add_reply",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["i32", "retval"],
+            ["u32", "value"],
+            {"crc": "0x00000002"},
+        ],
+        [
+            "test_dump",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "context"],
+            ["u32", "count"],
+            {"crc": "0x00000003"},
+        ],
+        [
+            "test_details",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["u32", "value"],
+            {"crc": "0x00000004"},
+        ],
+        [
+            "test_get",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "context"],
+            ["u32", "cursor"],
+            ["u32", "count"],
+            {"crc": "0x00000005"},
+        ],
+        [
+            "test_get_reply",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["i32", "retval"],
+            ["u32", "cursor"],
+            {"crc": "0x00000006"},
+        ],
+        [
+            "test_event",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "pid"],
+            ["u32", "value"],
+            {"crc": "0x00000007"},
+        ],
+    ],
+    "services": {
+        "test_add": {"reply": "test_add_reply"},
+        "test_dump": {"reply": "test_details", "stream": True},
+        "test_get": {
+            "reply": "test_get_reply",
+            "stream": True,
+            "stream_msg": "test_details",
+        },
+    },
+}
+
+
+def handle_test_add(r):
+    retval = -1 if r.value == 0 else 0
+    return [("test_add_reply", {"retval": retval, "value": r.value + 1})]
+
+
+def handle_test_dump(r):
+    return [("test_details", {"value": i}) for i in range(r.count)]
+
+
+def handle_test_get(r):
+    # Two details per page, cursor based paging
+    end = min(r.cursor + 2, r.count)
+    details = [("test_details", {"value": i}) for i in range(r.cursor, end)]
+    retval = -165 if end < r.count else 0
+    return details + [("test_get_reply", {"retval": retval, "cursor": end})]
+
+
+class FakeTransport:
+    """In-process stand-in for VppTransport. Requests are decoded and
+    answered by handlers returning [(reply_name, fields), ...]."""
+
+    def __init__(self, client, handlers=None, lifo=False):
+        self.client = client
+        self.handlers = {
+            "control_ping": lambda r: [("control_ping_reply", {})],
+            "sockclnt_delete": lambda r: [("sockclnt_delete_reply", {})],
+            "test_add": handle_test_add,
+            "test_dump": handle_test_dump,
+            "test_get": handle_test_get,
+        }
+        self.handlers.update(handlers or {})
+        self.lifo = lifo
+        self.connected = False
+        self.socket_index = 1
+        self.message_table = {}
+        self.replies = collections.deque()
+        self.requests = []
+
+    def connect(self, name, pfx, msg_handler, rx_qlen, do_async=False):
+        for i, (n, m) in enumerate(sorted(self.client.messages.items()), 1):
+            self.message_table[n + "_" + m.crc[2:]] = i
+        self.connected = True
+        return 0
+
+    def disconnect(self):
+        self.connected = False
+        return 0
+
+    def suspend(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def get_callback(self, do_async):
+        return None
+
+    def get_msg_index(self, name):
+        return self.message_table.get(name, 0)
+
+    def msg_table_max_index(self):
+        return len(self.message_table)
+
+    def reply(self, name, context, **fields):
+        msg = self.client.messages[name]
+        fields["_vl_msg_id"] = self.get_msg_index(name + "_" + msg.crc[2:])
+        fields["context"] = context
+        self.replies.append(msg.pack(fields))
+
+    def write(self, buf):
+        (i,) = struct.unpack_from(">H", buf)
+        name = self.client.id_names[i]
+        r, _ = self.client.messages[name].unpack(buf)
+        self.requests.append(r)
+        for reply, fields in self.handlers[name](r):
+            self.reply(reply, r.context, **fields)
+
+    def read(self, timeout=None):
+        if not self.replies:
+            return None
+        return self.replies.pop() if self.lifo else self.replies.popleft()
+
+
+class BufferedFakeTransport(FakeTransport):
+    """FakeTransport with the send buffer interface of VppTransport."""
+
+    header = struct.Struct(">QII")
+
+    def __init__(self, client, **kwargs):
+        super().__init__(client, **kwargs)
+        self.flushes = []
+
+    def send_buffer(self, size=64):
+        return vpp_transport_socket.SendBuffer(self.header, size)
+
+    def write_buffer(self, sendbuf):
+        data = bytes(sendbuf.getbuffer())
+        self.flushes.append(sendbuf.count)
+        offset = 0
+        while offset < len(data):
+            _, length, _ = self.header.unpack_from(data, offset)
+            offset += self.header.size
+            self.write(data[offset : offset + length])
+            offset += length
+        sendbuf.clear()
+
+
+def fake_definitions():
+    """Return (messages, services) of memclnt and TEST_API."""
+    memclnt = pkg_resources.resource_string(
+        "vpp_papi", "/".join(("data", "memclnt.api.json"))
+    )
+    m, s = vpp_papi.VPPApiJSONFiles.process_json_str(memclnt)
+    m2, s2 = vpp_papi.VPPApiJSONFiles.process_json_str(json.dumps(TEST_API))
+    m.update(m2)
+    s.update(s2)
+    return m, s
+
+
+def fake_client(**kwargs):
+    """Return a VPPApiClient connected to a FakeTransport."""
+    c = vpp_papi.VPPApiClient(
+        apifiles=[],
+        testmode=True,
+        async_thread=False,
+        definitions=fake_definitions(),
+        **kwargs,
+    )
+    c.transport = FakeTransport(c)
+    c.connect("fake")
+    return c
 
 
 class TestVppPapiVPPApiClient(unittest.TestCase):
@@ -249,3 +478,683 @@ class TestVppPapiLogging(unittest.TestCase):
             with self.assertLogs("vpp_papi.serializer", level="DEBUG") as cm:
                 vpp_papi.vpp_atexit(client)
         self.assertEqual(cm.output, [])
+
+
+class TestVppPapiBatch(unittest.TestCase):
+    def test_batch(self):
+        c = fake_client()
+        c.transport.lifo = True
+        with c.batch(window=4) as b:
+            for v in range(10):
+                self.assertEqual(b.test_add(value=v), v)
+                self.assertLessEqual(len(b.pending), 4)
+        self.assertEqual(len(b.pending), 0)
+        self.assertEqual([r.value for r in b.results], list(range(1, 11)))
+        self.assertEqual([i for i, r in b.errors], [0])
+
+    def test_batch_stream(self):
+        c = fake_client()
+        with c.batch(window=8) as b:
+            b.test_dump(count=3)
+            b.test_add(value=1)
+            b.test_get(cursor=0, count=2)
+        details, reply, page = b.results
+        self.assertEqual([d.value for d in details], [0, 1, 2])
+        self.assertEqual(reply.value, 2)
+        self.assertEqual(page[0].retval, 0)
+        self.assertEqual([d.value for d in page[1]], [0, 1])
+
+    def test_batch_read_failure(self):
+        c = fake_client()
+        c.transport.handlers["test_add"] = lambda r: []
+        b = c.batch(window=8)
+        b.test_add(value=1)
+        b.test_add(value=2)
+        with self.assertRaises(vpp_papi.VPPIOError):
+            b.flush()
+        self.assertEqual(len(b.errors), 2)
+        self.assertIsInstance(b.results[0], vpp_papi.VPPIOError)
+
+    def test_batch_exception(self):
+        c = fake_client()
+        with self.assertRaises(ZeroDivisionError):
+            with c.batch(window=8) as b:
+                b.test_add(value=1)
+                b.test_dump(count=2)
+                1 / 0
+        # Replies to the calls made are drained, not left for later.
+        self.assertEqual(len(b.pending), 0)
+        self.assertEqual(b.results[0].value, 2)
+        self.assertEqual([d.value for d in b.results[1]], [0, 1])
+        self.assertTrue(c.message_queue.empty())
+        self.assertEqual(c.api.test_add(value=5).value, 6)
+
+    def test_batch_send_buffer(self):
+        c = fake_client()
+        message_table = c.transport.message_table
+        c.transport = BufferedFakeTransport(c)
+        c.transport.message_table = message_table
+        with c.batch(window=4) as b:
+            for v in range(10):
+                b.test_add(value=v)
+                self.assertLessEqual(len(b.pending), 4)
+            b.test_dump(count=2)
+        # Sent when the window fills, refilled half a window at a time.
+        # The dump goes out with its control ping.
+        self.assertEqual(c.transport.flushes, [4, 2, 2, 2, 2])
+        self.assertEqual([r.value for r in b.results[:10]], list(range(1, 11)))
+        self.assertEqual([d.value for d in b.results[10]], [0, 1])
+        self.assertEqual(c.transport.requests[-1].__class__.__name__, "control_ping")
+
+        c.transport.flushes = []
+        with c.batch(window=100, flush_bytes=1) as b:
+            for v in range(3):
+                b.test_add(value=v)
+        self.assertEqual(c.transport.flushes, [1, 1, 1])
+
+
+class TestVppTransportSendBuffer(unittest.TestCase):
+    def setUp(self):
+        self.messages, _ = fake_definitions()
+        self.header = struct.Struct(">QII")
+
+    def frames(self, data):
+        frames = []
+        offset = 0
+        while offset < len(data):
+            _, length, _ = self.header.unpack_from(data, offset)
+            offset += self.header.size
+            frames.append(bytes(data[offset : offset + length]))
+            offset += length
+        return frames
+
+    def test_pack(self):
+        msg = self.messages["test_add"]
+        sb = vpp_transport_socket.SendBuffer(self.header, size=32)
+        expected = []
+        for v in range(100):
+            fields = {"_vl_msg_id": 1, "context": v, "value": v}
+            self.assertEqual(sb.pack(msg, fields), msg.size)
+            expected.append(msg.pack(fields))
+        sb.add(b"\x00\x01")
+        expected.append(b"\x00\x01")
+        self.assertEqual(len(sb), 101)
+        self.assertEqual(self.frames(sb.getbuffer()), expected)
+        sb.clear()
+        self.assertEqual(len(sb.getbuffer()), 0)
+
+    def test_pack_variable_size(self):
+        msg = self.messages["sockclnt_create_reply"]
+        self.assertFalse(msg.fixed_size)
+        sb = vpp_transport_socket.SendBuffer(self.header, size=16)
+        table = [{"index": i, "name": "m%d" % i} for i in range(3)]
+        fields = {"_vl_msg_id": 16, "count": 3, "message_table": table}
+        sb.pack(msg, fields)
+        self.assertEqual(self.frames(sb.getbuffer()), [msg.pack(fields)])
+
+    def test_compiled_pack_into(self):
+        msg = self.messages["test_add"]
+        fields = {"_vl_msg_id": 1, "context": 2, "value": 3}
+        vpp_serializer.set_compiled_codecs(True)
+        try:
+            buf = bytearray(msg.size + 4)
+            self.assertEqual(msg.pack_into(buf, 4, fields), msg.size)
+            self.assertEqual(bytes(buf[4:]), msg.pack(fields))
+        finally:
+            vpp_serializer.set_compiled_codecs(False)
+
+    def test_write(self):
+        t = vpp_transport_socket.VppTransport(None, 1, None)
+        t.socket, peer = socket.socketpair()
+        t.connected = True
+        try:
+            t.write(b"\x01\x02\x03")
+            sb = t.send_buffer()
+            for i in range(3):
+                sb.add(struct.pack(">HI", 1, i))
+            t.write_buffer(sb)
+            self.assertEqual(len(sb), 0)
+            expected = [b"\x01\x02\x03"]
+            expected += [struct.pack(">HI", 1, i) for i in range(3)]
+            size = sum(self.header.size + len(b) for b in expected)
+            data = b""
+            while len(data) < size:
+                data += peer.recv(size - len(data))
+            self.assertEqual(self.frames(data), expected)
+        finally:
+            t.socket.close()
+            peer.close()
+
+
+class TestVppTransportRecvBuffer(unittest.TestCase):
+    def setUp(self):
+        self.header = struct.Struct(">QII")
+        self.a, self.b = socket.socketpair()
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def frame(self, body):
+        return self.header.pack(0, len(body), 0) + body
+
+    def test_split_frames(self):
+        rxbuf = vpp_transport_socket.RecvBuffer(self.header, size=8192)
+        bodies = [bytes([i]) * (i * 100 + 1) for i in range(20)]
+        data = b"".join(self.frame(b) for b in bodies)
+        received = []
+        # Messages cut at arbitrary points, across buffer switches
+        for i in range(0, len(data), 777):
+            self.a.sendall(data[i : i + 777])
+            received += [bytes(m) for m in rxbuf.recv(self.b)]
+        self.assertEqual(received, bodies)
+        self.a.close()
+        self.assertIsNone(rxbuf.recv(self.b))
+
+    def test_large_message(self):
+        rxbuf = vpp_transport_socket.RecvBuffer(self.header, size=8192)
+        body = b"x" * 100000
+        sender = threading.Thread(target=self.a.sendall, args=(self.frame(body),))
+        sender.start()
+        received = []
+        while not received:
+            received = rxbuf.recv(self.b)
+        sender.join()
+        self.assertEqual(bytes(received[0]), body)
+
+    def test_reuse(self):
+        rxbuf = vpp_transport_socket.RecvBuffer(self.header, size=8192)
+        body = b"y" * 5000
+        self.a.sendall(self.frame(body))
+        (held,) = rxbuf.recv(self.b)
+        first = rxbuf._buf
+        # The next message does not fit, the first buffer is retired
+        # and not reused while a message in it is alive.
+        for _ in range(2):
+            self.a.sendall(self.frame(body))
+            self.assertEqual(len(rxbuf.recv(self.b)), 1)
+        self.assertIsNot(rxbuf._buf, first)
+        self.assertEqual(bytes(held), body)
+        del held
+        self.a.sendall(self.frame(body))
+        self.assertEqual(len(rxbuf.recv(self.b)), 1)
+        self.assertIs(rxbuf._buf, first)
+
+    def test_transport_read(self):
+        t = vpp_transport_socket.VppTransport(None, 1, None)
+        t.socket = self.b
+        self.a.sendall(self.frame(b"one") + self.frame(b"two"))
+        self.assertEqual(bytes(t._read()), b"one")
+        self.assertEqual(len(t.frames), 1)
+        self.assertEqual(bytes(t._read()), b"two")
+        self.a.close()
+        self.assertIsNone(t._read())
+
+
+class TestVppTransportSocketQueues(unittest.TestCase):
+    def start(self, mp_queues):
+        class Parent:
+            def has_context(self, msg):
+                return True
+
+        t = vpp_transport_socket.VppTransport(
+            Parent(), read_timeout=1, server_address=None, mp_queues=mp_queues
+        )
+        t.socket, self.peer = socket.socketpair()
+        t.connected = True
+        t.do_async = False
+        t.message_thread = threading.Thread(target=t.msg_thread_func, daemon=True)
+        t.message_thread.start()
+        return t
+
+    def check_queues(self, mp_queues):
+        t = self.start(mp_queues)
+        for i in range(3):
+            b = struct.pack(">HI", 1, i)
+            self.peer.sendall(t.header.pack(0, len(b), 0) + b)
+        for i in range(3):
+            self.assertEqual(bytes(t.read()), struct.pack(">HI", 1, i))
+        self.assertIsNone(t.read(timeout=0.01))
+        # Shutdown
+        t.sque.put(True)
+        t.message_thread.join(1)
+        self.assertFalse(t.message_thread.is_alive())
+        self.assertIsNone(t.read())
+        t.socket.close()
+        self.peer.close()
+
+    def test_local_queues(self):
+        self.check_queues(False)
+
+    def test_events_copied(self):
+        events = []
+        t = self.start(False)
+        t.parent.has_context = lambda msg: False
+        t.parent.msg_handler_async = events.append
+        b = struct.pack(">HI", 1, 0)
+        self.peer.sendall(t.header.pack(0, len(b), 0) + b)
+        deadline = time.monotonic() + 1
+        while not events and time.monotonic() < deadline:
+            time.sleep(0.001)
+        t.sque.put(True)
+        t.message_thread.join(1)
+        self.assertEqual(events, [b])
+        self.assertIs(type(events[0]), bytes)
+        t.socket.close()
+        self.peer.close()
+
+    def test_mp_queues(self):
+        self.check_queues(True)
+
+    def test_wakeup(self):
+        w = vpp_transport_socket.Wakeup()
+        rlist, _, _ = select.select([w], [], [], 0)
+        self.assertEqual(rlist, [])
+        w.put(True)
+        rlist, _, _ = select.select([w], [], [], 0)
+        self.assertEqual(rlist, [w])
+        w.close()
+        w.close()
+
+
+class TestVppApiCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.apifile = os.path.join(self.tmpdir.name, "test.api.json")
+        with open(self.apifile, "w") as f:
+            json.dump(TEST_API, f)
+        self.cachedir = os.path.join(self.tmpdir.name, "cache")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def load(self):
+        return vpp_papi.VPPApiJSONFiles.load_api([self.apifile], cache=self.cachedir)
+
+    def test_cache(self):
+        _, m1, s1 = self.load()
+        self.assertIsInstance(m1, dict)
+        self.assertEqual(len(os.listdir(self.cachedir)), 1)
+
+        _, m2, s2 = self.load()
+        self.assertIsInstance(m2, vpp_api_cache.MessageDefinitions)
+        self.assertEqual(s1, s2)
+        self.assertEqual(list(m1), list(m2))
+        self.assertEqual(m2.built(), 0)
+        b = m1["test_add"].pack({"_vl_msg_id": 1, "context": 2, "value": 3})
+        self.assertEqual(
+            m2["test_add"].pack({"_vl_msg_id": 1, "context": 2, "value": 3}), b
+        )
+        self.assertEqual(m2["test_add"].crc, "0x00000001")
+        self.assertEqual(m2.built(), 1)
+
+    def test_invalidate(self):
+        self.load()
+        # Same content, newer mtime
+        st = os.stat(self.apifile)
+        os.utime(self.apifile, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        _, m, _ = self.load()
+        self.assertIsInstance(m, vpp_api_cache.MessageDefinitions)
+        # New CRC, same size and mtime
+        with open(self.apifile) as f:
+            content = f.read()
+        with open(self.apifile, "w") as f:
+            f.write(content.replace("0x00000001", "0x0000000a"))
+        os.utime(self.apifile, ns=(st.st_atime_ns, st.st_mtime_ns))
+        _, m, _ = self.load()
+        self.assertIsInstance(m, dict)
+        self.assertEqual(m["test_add"].crc, "0x0000000a")
+        _, m, _ = self.load()
+        self.assertIsInstance(m, vpp_api_cache.MessageDefinitions)
+
+    def test_unwritable(self):
+        with open(self.cachedir, "w"):
+            pass
+        with self.assertLogs("vpp_papi.cache", level="WARNING"):
+            _, m, _ = self.load()
+        self.assertIn("test_add", m)
+
+
+class TestVppPapiLazyFunctions(unittest.TestCase):
+    def test_lazy_functions(self):
+        c = fake_client()
+        self.assertNotIn("test_add", vars(c.api))
+        self.assertIn("test_add", dir(c.api))
+        self.assertIn("test_add_pack", dir(c.api))
+
+        rv = c.api.test_add(value=1)
+        self.assertEqual(rv.value, 2)
+        self.assertIn("test_add", vars(c.api))
+        self.assertIs(c.api.test_add, c.api.test_add)
+        # Reply id resolved from the message table when received
+        i = c.transport.get_msg_index("test_add_reply_00000002")
+        self.assertEqual(c.id_names[i], "test_add_reply")
+
+        self.assertEqual(len(c.api.test_add_pack(value=1)), 14)
+        with self.assertRaises(AttributeError):
+            c.api.test_details
+        with self.assertRaises(AttributeError):
+            c.api.no_such_function
+
+
+class TestVppPapiHasContext(unittest.TestCase):
+    def test_has_context(self):
+        c = fake_client()
+        c.transport.reply("test_add_reply", 5, value=1)
+        c.transport.reply("test_event", 0, pid=1, value=2)
+        reply, event = c.transport.replies
+        ntypes = len(vpp_serializer.types)
+        for _ in range(2):
+            self.assertTrue(c.has_context(reply))
+            self.assertFalse(c.has_context(event))
+        self.assertFalse(c.has_context(b"\x00\x01"))
+        # Classification is cached per message id, without creating types
+        self.assertEqual(len(vpp_serializer.types), ntypes)
+        i = c._msg_index("test_event")
+        self.assertIs(c.id_context[i], False)
+
+        events = []
+        c.register_event_callback(lambda name, r: events.append((name, r.value)))
+        c.msg_handler_async(event)
+        self.assertEqual(events, [("test_event", 2)])
+
+
+class TestVppPapiStream(unittest.TestCase):
+    def test_stream(self):
+        c = fake_client()
+        it = c.api.test_dump.iter(count=3)
+        self.assertEqual(c.transport.requests, [])
+        self.assertEqual(next(it).value, 0)
+        self.assertEqual([d.value for d in it], [1, 2])
+
+        details = []
+        it = c.api.test_get(_stream=True, cursor=0, count=1)
+        while True:
+            try:
+                details.append(next(it))
+            except StopIteration as e:
+                rv = e.value
+                break
+        self.assertEqual(rv.retval, 0)
+        self.assertEqual([d.value for d in details], [0])
+
+        with self.assertRaises(vpp_papi.VPPValueError):
+            c.api.test_add(_stream=True, value=1)
+
+    def test_stream_closed_early(self):
+        c = fake_client()
+        it = c.api.test_dump.iter(count=5)
+        self.assertEqual(next(it).value, 0)
+        it.close()
+        # The rest of the dump was drained, not left for the next call
+        self.assertEqual(c.api.test_add(value=1).value, 2)
+        self.assertTrue(c.message_queue.empty())
+
+    def test_details_iter_stream(self):
+        c = fake_client()
+        paged = list(c.details_iter(c.api.test_get, count=5))
+        streamed = list(c.details_iter(c.api.test_get, count=5, _stream=True))
+        self.assertEqual([d.value for d in streamed], list(range(5)))
+        self.assertEqual([d.value for d in paged], list(range(5)))
+
+
+class TestVppPapiCompact(unittest.TestCase):
+    def test_decode_copies_retained_views(self):
+        c = fake_client()
+        msg = c.messages["test_add_reply"]
+        i = c.transport.message_table["test_add_reply_00000002"]
+        b = memoryview(bytearray(msg.pack({"_vl_msg_id": i, "context": 2, "value": 3})))
+        self.assertIs(type(c.decode_incoming_msg(b, lazy=True)._data), bytes)
+        self.assertEqual(c.decode_incoming_msg(b).value, 3)
+
+    def test_compact_dump(self):
+        c = fake_client()
+        table = c.api.test_dump(count=5, _compact=True)
+        self.assertIsInstance(table, vpp_papi.MessageTable)
+        self.assertEqual(len(table), 5)
+        self.assertEqual([d.value for d in table], list(range(5)))
+        self.assertEqual(table[-1].value, 4)
+        rows = table.materialize()
+        self.assertIs(type(rows[0]), c.messages["test_details"].tuple)
+        self.assertEqual(
+            rows,
+            [r._replace(context=rows[0].context) for r in c.api.test_dump(count=5)],
+        )
+        self.assertEqual(table.column("value"), list(range(5)))
+        self.assertEqual(table.nbytes, 5 * (10 + 8))
+        # Rows hold a copy, the table can still grow
+        last = table[-1]
+        self.assertIs(type(last._data), bytes)
+        table.append(last._data)
+        self.assertEqual((len(table), table[5].value, last.value), (6, 4, 4))
+
+        reply, table = c.api.test_get(cursor=0, count=2, _compact=True)
+        self.assertEqual((reply.retval, table.column("value")), (0, [0, 1]))
+
+        with self.assertRaises(vpp_papi.VPPValueError):
+            c.api.test_add(value=1, _compact=True)
+
+    def test_compact_other_messages(self):
+        c = fake_client(typed_arrays=True)
+
+        def dump_with_event(r):
+            c.transport.reply("test_event", 0, pid=1, value=9)
+            return handle_test_dump(r)
+
+        c.transport.handlers["test_dump"] = dump_with_event
+        table = c.api.test_dump(count=3, _compact=True)
+        self.assertEqual(list(table.column("value")), [0, 1, 2])
+        self.assertNotIsInstance(table.column("value"), list)
+        event = c.message_queue.get_nowait()
+        self.assertEqual((type(event).__name__, event.value), ("test_event", 9))
+
+    def test_column(self):
+        messages, _ = fake_definitions()
+        msg = messages["test_details"]
+        rows = [msg.pack({"_vl_msg_id": 4, "context": 1, "value": v}) for v in range(5)]
+        uniform = vpp_papi.MessageTable(msg)
+        uniform.extend(rows)
+        # Rows of different sizes are read one by one
+        mixed = vpp_papi.MessageTable(msg)
+        mixed.extend(r + b"\0" * i for i, r in enumerate(rows))
+        typed = vpp_papi.MessageTable(msg, arrays=True)
+        typed.extend(rows)
+        saved = vpp_table.numpy
+        try:
+            for numpy in {saved, None}:
+                vpp_table.numpy = numpy
+                for table in (uniform, mixed):
+                    self.assertEqual(table.column("value"), list(range(5)))
+                    self.assertEqual(table.column("_vl_msg_id"), [4] * 5)
+                self.assertEqual(list(typed.column("value")), list(range(5)))
+                self.assertNotIsInstance(typed.column("value"), list)
+        finally:
+            vpp_table.numpy = saved
+
+
+class TestVppPapiClientPool(unittest.TestCase):
+    def fake_pool(self, size):
+        pool = vpp_papi_pool.VPPApiClientPool(
+            size=size,
+            timeout=5,
+            apifiles=[],
+            testmode=True,
+            async_thread=False,
+            definitions=fake_definitions(),
+        )
+        for c in pool.clients:
+            c.transport = FakeTransport(c)
+        pool.connect("pool")
+        return pool
+
+    def test_shared_definitions(self):
+        pool = self.fake_pool(3)
+        messages = pool.clients[0].messages
+        self.assertTrue(all(c.messages is messages for c in pool.clients))
+        self.assertEqual(
+            [c.transport.connected for c in pool.clients], [True, True, True]
+        )
+
+    def test_threads(self):
+        pool = self.fake_pool(4)
+
+        def slow_add(r):
+            time.sleep(0.001)
+            return handle_test_add(r)
+
+        for c in pool.clients:
+            c.transport.handlers["test_add"] = slow_add
+        results = collections.defaultdict(list)
+
+        def worker(n):
+            for v in range(1, 21):
+                results[n].append(pool.api.test_add(value=v).value)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for n in range(8):
+            self.assertEqual(results[n], list(range(2, 22)))
+        stats = pool.get_stats()
+        self.assertEqual(sum(s["calls"] for s in stats), 160)
+        self.assertGreater(sum(s["calls"] > 0 for s in stats), 1)
+        self.assertEqual(sum(s["api"]["test_add"]["count"] for s in stats), 160)
+
+    def test_reconnect(self):
+        pool = self.fake_pool(1)
+        c = pool.clients[0]
+        c.transport.handlers["test_add"] = lambda r: []
+        with self.assertRaises(vpp_papi.VPPIOError):
+            pool.api.test_add(value=1)
+        stats = pool.get_stats()[0]
+        self.assertEqual((stats["errors"], stats["reconnects"]), (1, 1))
+        self.assertTrue(stats["connected"])
+        c.transport.handlers["test_add"] = handle_test_add
+        self.assertEqual(pool.api.test_add(value=1).value, 2)
+
+    def test_stream(self):
+        pool = self.fake_pool(2)
+        it = pool.api.test_dump(count=3, _stream=True)
+        self.assertEqual(next(it).value, 0)
+        # The stream holds its connection until it is done
+        self.assertEqual(pool._idle.qsize(), 1)
+        self.assertEqual([d.value for d in it], [1, 2])
+        self.assertEqual(pool._idle.qsize(), 2)
+
+        it = pool.api.test_dump(count=3, _stream=True)
+        next(it)
+        it.close()
+        self.assertEqual(pool._idle.qsize(), 2)
+        self.assertEqual(len(pool.api.test_dump(count=2)), 2)
+        pool.disconnect()
+        self.assertFalse(any(c.transport.connected for c in pool.clients))
+
+
+class TestVppInstrumentation(unittest.TestCase):
+    def test_histogram(self):
+        h = vpp_instrument.LatencyHistogram(precision=5)
+        values = list(range(1, 100001, 7))
+        for v in values:
+            h.record(v)
+        # Buckets are contiguous and cover every value
+        for v in (0, 1, 31, 32, 33, 1000, 123456, 2**40 + 5):
+            i = h.index(v)
+            self.assertLessEqual(h.lower(i), v)
+            self.assertLess(v, h.upper(i))
+            self.assertEqual(h.upper(i), h.lower(i + 1))
+        self.assertEqual((h.count, h.min, h.max), (len(values), 1, values[-1]))
+        for q in (50, 90, 99):
+            exact = values[int(round(q / 100 * len(values))) - 1]
+            self.assertAlmostEqual(h.percentile(q) / exact, 1, delta=1 / 16)
+        self.assertEqual(h.buckets()[-1][1], len(values))
+        # 1000 is in bucket [992, 1023], counted under the next bound
+        self.assertEqual(h.cumulative([0, 1, 8, 1000, 10**6]), [0, 1, 2, 142, 14286])
+
+    def test_client(self):
+        spans = []
+
+        class Span:
+            def __init__(self, name):
+                self.name = name
+                self.attributes = {}
+                self.exc = "open"
+
+            def __enter__(self):
+                spans.append(self)
+                return self
+
+            def __exit__(self, exc_type, exc_value, tb):
+                self.exc = exc_type
+
+            def set_attribute(self, k, v):
+                self.attributes[k] = v
+
+        inst = vpp_instrument.Instrumentation(span_hook=Span)
+        c = fake_client(instrumentation=inst)
+        for v in range(3):
+            c.api.test_add(value=v)
+        c.api.test_dump(count=4)
+        self.assertEqual(len(list(c.api.test_get.iter(cursor=0, count=2))), 2)
+        c.transport.handlers["test_add"] = lambda r: []
+        with self.assertRaises(vpp_papi.VPPIOError):
+            c.api.test_add(value=1)
+
+        d = inst.to_dict()
+        add = d["test_add"]
+        self.assertEqual((add["calls"], add["errors"], add["replies"]), (4, 1, 3))
+        self.assertEqual(add["bytes_out"], 4 * spans[-1].attributes["vpp.bytes_out"])
+        self.assertGreater(add["bytes_in"], 0)
+        self.assertEqual(add["latency"]["wait"]["count"], 4)
+        total = add["latency"]["total"]
+        self.assertGreaterEqual(total["max"], add["latency"]["decode"]["max"])
+        # 4 details and the control ping reply
+        self.assertEqual(d["test_dump"]["replies"], 5)
+        self.assertEqual(d["test_get"]["replies"], 3)
+
+        self.assertEqual(
+            [s.name for s in spans][-3:], ["test_dump", "test_get", "test_add"]
+        )
+        self.assertIsNone(spans[0].exc)
+        self.assertIs(spans[-1].exc, vpp_papi.VPPIOError)
+        self.assertIn("vpp.wait_ns", spans[0].attributes)
+
+        text = inst.prometheus()
+        self.assertIn('vpp_papi_calls_total{message="test_add"} 4', text)
+        self.assertIn(
+            'vpp_papi_call_duration_seconds_count{message="test_add",phase="pack"} 4',
+            text,
+        )
+        self.assertIn(
+            'vpp_papi_call_duration_seconds_bucket{message="test_add",'
+            'phase="total",le="+Inf"} 4',
+            text,
+        )
+        # Every bound is exposed, empty buckets too
+        bounds = [
+            line
+            for line in text.splitlines()
+            if line.startswith(
+                'vpp_papi_call_duration_seconds_bucket{message="test_add",'
+                'phase="pack"'
+            )
+        ]
+        self.assertEqual(len(bounds), len(vpp_instrument.PROMETHEUS_BUCKETS) + 1)
+        self.assertIn('le="1e-05"', bounds[0])
+        self.assertIn('le="10"', bounds[-2])
+
+    def test_disabled(self):
+        c = fake_client()
+        self.assertIsNone(c.instrumentation)
+        c.logger.setLevel(logging.INFO)
+
+        class Arg:
+            def __repr__(self):
+                raise AssertionError("debug message formatted")
+
+        with mock.patch.object(c, "validate_args"):
+            c.transport.handlers["test_add"] = lambda r: [
+                ("test_add_reply", {"value": 1})
+            ]
+            c.api.test_add(value=1, extra=Arg())
@@ -0,0 +1,314 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+import pkg_resources
+
+from vpp_papi import vpp_papi
+from vpp_papi.vpp_papi_async import AsyncVPPApiClient
+
+TEST_API = {
+    "messages": [
+        [
+            "test_add",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "context"],
+            ["u32", "value"],
+            {"crc": "0x00000001"},
+        ],
+        [
+            "test_add_reply",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["i32", "retval"],
+            ["u32", "value"],
+            {"crc": "0x00000002"},
+        ],
+        [
+            "test_dump",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "context"],
+            ["u32", "count"],
+            {"crc": "0x00000003"},
+        ],
+        [
+            "test_details",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["u32", "value"],
+            {"crc": "0x00000004"},
+        ],
+        [
+            "test_get",
+            ["u16", "_vl_msg_id"],
+            ["u32", "client_index"],
+            ["u32", "context"],
+            ["u32", "count"],
+            {"crc": "0x00000005"},
+        ],
+        [
+            "test_get_reply",
+            ["u16", "_vl_msg_id"],
+            ["u32", "context"],
+            ["i32", "retval"],
+            {"crc": "0x00000006"},
+        ],
+    ],
+    "services": {
+        "test_add": {"reply": "test_add_reply"},
+        "test_dump": {"reply": "test_details", "stream": True},
+        "test_get": {
+            "reply": "test_get_reply",
+            "stream": True,
+            "stream_msg": "test_details",
+        },
+    },
+}
+
+header = struct.Struct(">QII")
+
+
+def load_messages():
+    memclnt = pkg_resources.resource_string(
+        "vpp_papi", "/".join(("data", "memclnt.api.json"))
+    )
+    m, s = vpp_papi.VPPApiJSONFiles.process_json_str(memclnt)
+    m2, s2 = vpp_papi.VPPApiJSONFiles.process_json_str(json.dumps(TEST_API))
+    m.update(m2)
+    s.update(s2)
+    return m, s
+
+
+class Server:
+    """Minimal VPP API socket server. Replies to test_add are delayed by
+    value milliseconds so they can be answered out of order."""
+
+    def __init__(self, messages, path):
+        self.messages = messages
+        self.path = path
+        self.table = {}
+        self.names = {}
+        for i, (n, m) in enumerate(sorted(messages.items()), 1):
+            self.table[n] = i
+            self.names[i] = n
+        self.writer = None
+        self.delay = 0
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.handle, self.path)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def send(self, name, msg_id=None, **fields):
+        if msg_id is None:
+            msg_id = self.table[name]
+        fields["_vl_msg_id"] = msg_id
+        b = self.messages[name].pack(fields)
+        self.writer.write(header.pack(0, len(b), 0) + b)
+
+    async def handle(self, reader, writer):
+        self.writer = writer
+        try:
+            while True:
+                _, length, _ = header.unpack(await reader.readexactly(16))
+                msg = await reader.readexactly(length)
+                (i,) = struct.unpack_from(">H", msg)
+                if i == 15:
+                    self.send(
+                        "sockclnt_create_reply",
+                        msg_id=16,
+                        index=7,
+                        count=len(self.table),
+                        message_table=[
+                            {"index": i, "name": n + "_" + self.messages[n].crc[2:]}
+                            for n, i in self.table.items()
+                        ],
+                    )
+                    continue
+                name = self.names[i]
+                r, _ = self.messages[name].unpack(msg)
+                await getattr(self, "handle_" + name)(r)
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+    async def handle_sockclnt_delete(self, r):
+        self.send("sockclnt_delete_reply", context=r.context)
+
+    async def handle_control_ping(self, r):
+        self.send("control_ping_reply", context=r.context)
+
+    async def handle_test_add(self, r):
+        async def reply():
+            await asyncio.sleep(r.value / 1000)
+            self.send("test_add_reply", context=r.context, value=r.value + 1)
+
+        asyncio.ensure_future(reply())
+
+    async def handle_test_dump(self, r):
+        for i in range(r.count):
+            self.send("test_details", context=r.context, value=i)
+        # Unsolicited message on the same connection
+        self.send("test_details", context=0, value=99)
+
+    async def handle_test_get(self, r):
+        for i in range(r.count):
+            self.send("test_details", context=r.context, value=i)
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        self.send("test_get_reply", context=r.context, retval=0)
+
+
+class TestAsyncVPPApiClient(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "api.sock")
+        self.messages, self.services = load_messages()
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmpdir.cleanup()
+
+    def run_client(self, coro):
+        async def run():
+            server = self.server = Server(self.messages, self.path)
+            await server.start()
+            vpp = AsyncVPPApiClient(
+                apifiles=[], testmode=True, server_address=self.path
+            )
+            vpp.messages, vpp.services = self.messages, self.services
+            await vpp.connect("test")
+            try:
+                return await coro(vpp)
+            finally:
+                await vpp.disconnect()
+                await server.stop()
+
+        return self.loop.run_until_complete(run())
+
+    def test_call(self):
+        async def run(vpp):
+            self.assertEqual(vpp.socket_index, 7)
+            return await vpp.api.test_add(value=1)
+
+        rv = self.run_client(run)
+        self.assertEqual(rv.value, 2)
+
+    def test_concurrent_calls(self):
+        async def run(vpp):
+            # Slowest first, replies arrive in reverse order
+            return await asyncio.gather(
+                *[vpp.api.test_add(value=v) for v in (30, 20, 10, 0)]
+            )
+
+        rv = self.run_client(run)
+        self.assertEqual([r.value for r in rv], [31, 21, 11, 1])
+
+    def test_dump(self):
+        async def run(vpp):
+            values = [d.value async for d in vpp.api.test_dump(count=3)]
+            collected = await vpp.api.test_dump(count=2)
+            event = await vpp.events().__anext__()
+            return values, collected, event
+
+        values, collected, event = self.run_client(run)
+        self.assertEqual(values, [0, 1, 2])
+        self.assertEqual([d.value for d in collected], [0, 1])
+        self.assertEqual(event.value, 99)
+
+    def test_stream_msg(self):
+        async def run(vpp):
+            return await vpp.api.test_get(count=3)
+
+        reply, details = self.run_client(run)
+        self.assertEqual(reply.retval, 0)
+        self.assertEqual([d.value for d in details], [0, 1, 2])
+
+    def test_stream_close(self):
+        async def run(vpp):
+            async with vpp.api.test_dump(count=5) as stream:
+                async for first in stream:
+                    break
+            self.assertNotIn(stream.context, vpp._pending)
+            self.assertEqual([d.value async for d in stream], [])
+            # The reader waits for a full queue to be consumed
+            stream = vpp.api.test_get(count=10)
+            stream.maxsize = 2
+            values = []
+            async for d in stream:
+                await asyncio.sleep(0)
+                values.append(d.value)
+            return first, values
+
+        first, values = self.run_client(run)
+        self.assertEqual(first.value, 0)
+        self.assertEqual(values, list(range(10)))
+
+    def test_stream_abandoned(self):
+        async def run(vpp):
+            rv = []
+            # Rest of the stream already received, or still to come
+            for delay in (0, 0.01):
+                self.server.delay = delay
+                async with vpp.api.test_get(count=5) as stream:
+                    async for first in stream:
+                        break
+                # Replied after the stream on the same connection
+                r = await vpp.api.test_add(value=1)
+                rv.append((first.value, r.value, vpp._events.qsize()))
+            self.assertEqual(vpp._pending, {})
+            return rv
+
+        rv = self.run_client(run)
+        self.assertEqual(rv, [(0, 2, 0), (0, 2, 0)])
+
+    def test_undecodable_message(self):
+        async def run(vpp):
+            # A truncated test_add_reply
+            i = vpp.message_table["test_add_reply_00000002"]
+            msg = struct.pack(">HI", i, 1)
+            self.server.writer.write(header.pack(0, len(msg), 0) + msg)
+            with self.assertLogs(vpp.logger, "WARNING"):
+                rv = await vpp.api.test_add(value=1)
+            self.assertTrue(vpp.connected)
+            return rv
+
+        rv = self.run_client(run)
+        self.assertEqual(rv.value, 2)
+
+    def test_disconnect_fails_pending(self):
+        async def run(vpp):
+            f = asyncio.ensure_future(vpp.api.test_add(value=1000))
+            await asyncio.sleep(0.01)
+            await vpp.disconnect()
+            with self.assertRaises(vpp.VPPIOError):
+                await f
+
+        self.run_client(run)
+
+
+if __name__ == "__main__":
+    unittest.main()
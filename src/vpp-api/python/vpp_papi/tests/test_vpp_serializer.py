@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 
+import array
 import unittest
 from vpp_papi.vpp_serializer import VPPType, VPPEnumType, VPPEnumFlagType
 from vpp_papi.vpp_serializer import VPPUnionType, VPPMessage
 from vpp_papi.vpp_serializer import VPPTypeAlias, VPPSerializerValueError
+from vpp_papi import vpp_serializer
 from vpp_papi import MACAddress
 from socket import inet_pton, AF_INET, AF_INET6
 import logging
 import sys
+import threading
 from ipaddress import *
 
 
@@ -674,5 +677,280 @@ class TestVppSerializerLogging(unittest.TestCase):
         )
 
 
+class CompiledCodecsMixin:
+    """Re-run a test case with the compiled codecs enabled."""
+
+    def setUp(self):
+        vpp_serializer.set_compiled_codecs(True)
+
+    def tearDown(self):
+        vpp_serializer.set_compiled_codecs(False)
+
+
+class TestLimitsCompiled(CompiledCodecsMixin, TestLimits):
+    pass
+
+
+class TestDefaultsCompiled(CompiledCodecsMixin, TestDefaults):
+    pass
+
+
+class TestAddTypeCompiled(CompiledCodecsMixin, TestAddType):
+    pass
+
+
+class TestCompiledCodec(unittest.TestCase):
+    def test_same_bytes_and_tuples(self):
+        VPPEnumType(
+            "vl_api_codec_enum_t",
+            [["CODEC_A", 0], ["CODEC_B", 7], {"enumtype": "u16"}],
+        )
+        msg = VPPMessage(
+            "codec_msg",
+            [
+                ["u16", "_vl_msg_id"],
+                ["u32", "context"],
+                ["vl_api_codec_enum_t", "e"],
+                ["f64", "rate"],
+                ["u8", "mac", 6],
+                ["u32", "labels", 3],
+                ["u16", "mtu", {"default": 1500}],
+                ["string", "tag", 8],
+                ["u32", "n"],
+                ["u64", "counters", 0, "n"],
+                ["string", "name", 0],
+            ],
+        )
+        args = {
+            "_vl_msg_id": 10,
+            "context": 0xFFFFFFFF,
+            "e": 7,
+            "rate": 2.5,
+            "mac": b"\x01\x02",
+            "labels": [1, 2, 3],
+            "tag": "foo",
+            "n": 2,
+            "counters": [1 << 40, 5],
+            "name": "barbaz",
+        }
+        b = msg._pack(args)
+        nt, size = msg._unpack(b)
+        self.assertEqual(msg.codec.pack(args), b)
+        self.assertEqual(msg.codec.unpack(b), (nt, size))
+        self.assertEqual(nt.mtu, 1500)
+        self.assertEqual(msg.codec.unpack(b)[0].e, 7)
+
+        # Errors are reported by the interpreted path
+        with self.assertRaises(VPPSerializerValueError):
+            msg.codec.pack({"labels": [1, 2]})
+        with self.assertRaises(VPPSerializerValueError):
+            msg.codec.pack({"n": 3, "counters": [1]})
+        with self.assertRaises(VPPSerializerValueError):
+            msg.codec.pack({"mac": b"\x00" * 7})
+
+    def test_one_struct_per_fixed_run(self):
+        msg = VPPMessage(
+            "codec_fixed",
+            [["u16", "_vl_msg_id"], ["u32", "context"], ["u8", "data", 4]],
+        )
+        self.assertEqual([s.format for s in msg.codec.structs], [">HI4s"])
+
+
+class TestTypedArrays(unittest.TestCase):
+    def setUp(self):
+        VPPTypeAlias("vl_api_interface_index_t", {"type": "u32"})
+        self.msg = VPPMessage(
+            "typed_arrays",
+            [
+                ["u32", "n"],
+                ["vl_api_interface_index_t", "sw_if_indexes", 0, "n"],
+                ["u64", "counters", 4],
+                ["f64", "rates", 0, "n"],
+            ],
+        )
+        self.args = {
+            "n": 3,
+            "sw_if_indexes": [1, 2, 0xFFFFFFFF],
+            "counters": [0, 1, 1 << 40, 3],
+            "rates": [0.5, 1.5, -2.0],
+        }
+
+    def test_bulk_pack(self):
+        b = self.msg.pack(self.args)
+        self.assertEqual(len(b), 4 + 3 * 4 + 4 * 8 + 3 * 8)
+        self.assertEqual(b[4:8], b"\x00\x00\x00\x01")
+        nt, size = self.msg.unpack(b)
+        self.assertEqual(size, len(b))
+        self.assertEqual(nt.sw_if_indexes, [1, 2, 0xFFFFFFFF])
+        self.assertEqual(nt.counters, [0, 1, 1 << 40, 3])
+        self.assertEqual(nt.rates, [0.5, 1.5, -2.0])
+
+        # Missing elements still default to zero
+        args = dict(self.args, sw_if_indexes=[1, None, 3])
+        nt, size = self.msg.unpack(self.msg.pack(args))
+        self.assertEqual(nt.sw_if_indexes, [1, 0, 3])
+
+    def check_typed(self):
+        b = bytearray(self.msg.pack(self.args))
+        nt, size = self.msg.unpack(b, arrays=True)
+        self.assertEqual(size, len(b))
+        self.assertEqual(list(nt.sw_if_indexes), [1, 2, 0xFFFFFFFF])
+        self.assertEqual(list(nt.counters), [0, 1, 1 << 40, 3])
+        self.assertEqual(list(nt.rates), [0.5, 1.5, -2.0])
+        # Typed buffers pack back to the same bytes
+        args = dict(nt._asdict(), n=3)
+        self.assertEqual(self.msg.pack(args), b)
+        return nt
+
+    @unittest.skipIf(vpp_serializer.numpy is None, "NumPy not installed")
+    def test_numpy(self):
+        nt = self.check_typed()
+        self.assertIsInstance(nt.sw_if_indexes, vpp_serializer.numpy.ndarray)
+        self.assertEqual(nt.sw_if_indexes.dtype.str, ">u4")
+
+    def test_array(self):
+        saved = vpp_serializer.numpy
+        vpp_serializer.numpy = None
+        try:
+            nt = self.check_typed()
+        finally:
+            vpp_serializer.numpy = saved
+        self.assertIsInstance(nt.sw_if_indexes, array.array)
+
+
+class TestTypedArraysCompiled(CompiledCodecsMixin, TestTypedArrays):
+    def setUp(self):
+        CompiledCodecsMixin.setUp(self)
+        TestTypedArrays.setUp(self)
+
+
+class TestLazyMessage(unittest.TestCase):
+    def test_lazy(self):
+        VPPTypeAlias("vl_api_ip4_address_t", {"type": "u8", "length": 4})
+        details = VPPMessage(
+            "lazy_details",
+            [
+                ["u16", "_vl_msg_id"],
+                ["u32", "context"],
+                ["vl_api_ip4_address_t", "address"],
+                ["string", "tag", 0],
+                ["u8", "n"],
+                ["u32", "labels", 0, "n"],
+                ["u8", "last"],
+            ],
+        )
+        b = details.pack(
+            {
+                "_vl_msg_id": 1,
+                "context": 42,
+                "address": "10.0.0.1",
+                "tag": "foo",
+                "n": 2,
+                "labels": [16, 17],
+                "last": 9,
+            }
+        )
+        eager, size = details.unpack(b)
+        lazy = details.unpack_lazy(b)
+
+        self.assertEqual(type(lazy).__name__, "lazy_details")
+        self.assertEqual(details.offsets, [0, 2, 6, 10, None, None, None])
+        self.assertEqual(lazy.context, 42)
+        self.assertEqual(sum(v is not vpp_serializer._NOTSET for v in lazy._values), 1)
+        # Variable offsets are found by decoding the preceding fields
+        self.assertEqual(lazy.last, 9)
+        self.assertEqual(lazy.labels, [16, 17])
+        self.assertEqual(str(lazy.address), "10.0.0.1")
+        self.assertEqual(lazy._size(), size)
+        self.assertEqual(lazy, eager)
+        self.assertEqual(lazy._materialize(), eager)
+        self.assertEqual(lazy._asdict(), eager._asdict())
+        self.assertEqual(list(lazy), list(eager))
+        self.assertEqual(lazy[-1], 9)
+
+        lazy = details.unpack_lazy(b, ntc=True)
+        self.assertEqual(lazy.address, b"\x0a\x00\x00\x01")
+
+    def test_lazy_union(self):
+        VPPTypeAlias("vl_api_ip4_address_t", {"type": "u8", "length": 4})
+        VPPTypeAlias("vl_api_ip6_address_t", {"type": "u8", "length": 16})
+        union = VPPUnionType(
+            "vl_api_address_union_t",
+            [["vl_api_ip4_address_t", "ip4"], ["vl_api_ip6_address_t", "ip6"]],
+        )
+        details = VPPMessage(
+            "lazy_union_details",
+            [["u32", "context"], ["vl_api_address_union_t", "nh"], ["u8", "last"]],
+        )
+        b = details.pack({"context": 1, "nh": {"ip4": "10.0.0.1"}, "last": 7})
+        eager, _ = details.unpack(b)
+        lazy = details.unpack_lazy(b)
+
+        nh = lazy.nh
+        self.assertIsInstance(nh, vpp_serializer.LazyUnion)
+        self.assertEqual(type(nh).__name__, "vl_api_address_union_t")
+        self.assertEqual(str(nh.ip4), "10.0.0.1")
+        # Only the accessed arm is decoded
+        self.assertIs(nh._values[1], vpp_serializer._NOTSET)
+        self.assertEqual(lazy.last, 7)
+        self.assertEqual(nh, eager.nh)
+        self.assertEqual(lazy, eager)
+        self.assertEqual(hash(lazy), hash(eager))
+        self.assertEqual(repr(lazy), repr(eager))
+        m = lazy._materialize()
+        self.assertIs(type(m.nh), union.tuple)
+        self.assertEqual(m, eager)
+
+
+class TestConcurrentDecode(unittest.TestCase):
+    def test_threads(self):
+        VPPEnumType(
+            "vl_api_address_family_t",
+            [["ADDRESS_IP4", 0], ["ADDRESS_IP6", 1], {"enumtype": "u32"}],
+        )
+        VPPTypeAlias("vl_api_ip4_address_t", {"type": "u8", "length": 4})
+        VPPTypeAlias("vl_api_ip6_address_t", {"type": "u8", "length": 16})
+        VPPUnionType(
+            "vl_api_address_union_t",
+            [["vl_api_ip4_address_t", "ip4"], ["vl_api_ip6_address_t", "ip6"]],
+        )
+        VPPType(
+            "vl_api_address_t",
+            [["vl_api_address_family_t", "af"], ["vl_api_address_union_t", "un"]],
+        )
+        VPPType("vl_api_prefix_t", [["vl_api_address_t", "address"], ["u8", "len"]])
+        message = VPPMessage(
+            "threaded",
+            [["vl_api_prefix_t", "prefix"], ["vl_api_ip4_address_t", "nh"]],
+        )
+        b = message.pack({"prefix": "10.0.0.0/8", "nh": "10.0.0.1"})
+        converted, _ = message.unpack(b)
+        raw, _ = message.unpack(b, ntc=True)
+
+        errors = []
+
+        def decode(ntc, expected):
+            for _ in range(2000):
+                r, _ = message.unpack(b, ntc=ntc)
+                if r != expected:
+                    errors.append(r)
+                    return
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [
+                threading.Thread(target=decode, args=args)
+                for args in [(False, converted), (True, raw)] * 4
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+
 if __name__ == "__main__":
     unittest.main()
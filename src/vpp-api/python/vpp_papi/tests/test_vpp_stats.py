@@ -0,0 +1,508 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import array
+import re
+import threading
+import time
+import unittest
+from unittest import mock
+
+from vpp_papi import vpp_stats
+from vpp_papi.vpp_mock_stats import MockStatsSegment
+
+
+def interfaces_segment(threads=2, n=4):
+    """A segment with interface, error and node counters."""
+    seg = MockStatsSegment(size=1 << 22)
+    seg.add_combined("/if/rx", threads, n)
+    seg.add_combined("/if/tx", threads, n)
+    seg.add_simple("/if/drops", threads, n)
+    seg.add_name("/if/names", ["if%d" % i for i in range(n)])
+    seg.add_scalar("/sys/heartbeat", 1)
+    for i in range(n):
+        seg.add_symlink("/interfaces/if%d/rx" % i, "/if/rx", i)
+    for node in ("ip4-input", "ip6-input"):
+        for err in ("no_error", "ttl_expired"):
+            seg.add_simple("/err/%s/%s" % (node, err), threads, 1)
+        seg.add_simple("/nodes/%s/calls" % node, threads, 1)
+    for t in range(threads):
+        for i in range(n):
+            seg.set_combined("/if/rx", t, i, 10 * i + t, 1000 * i + t)
+            seg.set_simple("/if/drops", t, i, i)
+    return seg
+
+
+class TestVppStats(unittest.TestCase):
+    def setUp(self):
+        self.seg = interfaces_segment()
+        self.addCleanup(self.seg.close)
+        self.stats = self.seg.client()
+        self.addCleanup(self.stats.disconnect)
+
+    def test_counters(self):
+        rx = self.stats["/if/rx"]
+        self.assertEqual(len(rx), 2)
+        self.assertEqual(rx[1][3]["packets"], 31)
+        self.assertEqual(rx[:, 3].sum_packets(), 61)
+        self.assertEqual(rx[:, 3].octets(), [3000, 3001])
+        self.assertEqual(self.stats["/if/drops"][:, 2].sum(), 4)
+        self.assertEqual(self.stats["/if/names"], ["if0", "if1", "if2", "if3"])
+        self.assertEqual(self.stats["/sys/heartbeat"], 1)
+        self.assertEqual(self.stats["/interfaces/if2/rx"].packets(), [20, 21])
+        with self.assertRaises(KeyError):
+            self.stats["/no/such/counter"]
+
+    def test_ls(self):
+        self.assertEqual(
+            sorted(self.stats.ls("^/if/")),
+            ["/if/drops", "/if/names", "/if/rx", "/if/tx"],
+        )
+        self.assertEqual(
+            sorted(self.stats.ls(["^/err/ip4-", ".*/calls$"])),
+            [
+                "/err/ip4-input/no_error",
+                "/err/ip4-input/ttl_expired",
+                "/nodes/ip4-input/calls",
+                "/nodes/ip6-input/calls",
+            ],
+        )
+        self.assertEqual(self.stats.ls("^/foobar"), [])
+
+    def test_dump(self):
+        data = self.stats.dump(["/if/drops", "/sys/heartbeat"])
+        self.assertEqual(data["/if/drops"][0], [0, 1, 2, 3])
+        self.assertEqual(data["/sys/heartbeat"], 1)
+        self.seg.set_simple("/err/ip6-input/ttl_expired", 1, 0, 5)
+        self.assertEqual(self.stats["/err/ip6-input/ttl_expired"][:, 0].sum(), 5)
+
+    def test_epoch(self):
+        self.seg.resize("/if/rx", 6)
+        self.seg.add_symlink("/interfaces/if5/rx", "/if/rx", 5)
+        self.seg.set_combined("/if/rx", 0, 5, 7, 700)
+        self.assertEqual(self.stats["/interfaces/if5/rx"].sum_packets(), 7)
+        self.assertEqual(self.stats["/if/rx"][1][3]["packets"], 31)
+        self.seg.remove("/err/ip4-input/no_error")
+        self.assertNotIn("/err/ip4-input/no_error", self.stats.ls("^/err/"))
+        with self.assertRaises(KeyError):
+            self.stats["/err/ip4-input/no_error"]
+
+    def test_refresh(self):
+        rx = self.stats.directory["/if/rx"]
+        tx = self.stats.directory["/if/tx"]
+        self.seg.resize("/if/rx", 6)
+        self.seg.remove("/err/ip4-input/no_error")
+        self.seg.add_simple("/err/ip4-input/new", 2, 1)
+        self.stats.refresh()
+        # Only the changed slots are decoded again
+        self.assertIs(self.stats.directory["/if/tx"], tx)
+        self.assertIsNot(self.stats.directory["/if/rx"], rx)
+        self.assertNotIn("/err/ip4-input/no_error", self.stats.directory)
+        self.assertEqual(self.stats["/err/ip4-input/new"], [[0], [0]])
+        self.assertEqual(
+            self.stats.directory_by_idx[self.seg.index["/err/ip4-input/new"]],
+            "/err/ip4-input/new",
+        )
+        self.assertEqual(
+            sorted(self.stats._trie.prefixed("")), sorted(self.stats.directory)
+        )
+
+    def test_refresh_threads(self):
+        self.seg.resize("/if/rx", 6)
+        self.seg.remove("/err/ip4-input/no_error")
+        update = self.stats._update_directory
+        active = []
+        overlap = []
+
+        def slow_update(raw):
+            active.append(True)
+            overlap.append(len(active))
+            time.sleep(0.01)
+            update(raw)
+            active.pop()
+
+        threads = [threading.Thread(target=self.stats.refresh) for _ in range(2)]
+        with mock.patch.object(self.stats, "_update_directory", slow_update):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(overlap, [1, 1])
+        self.assertNotIn("/err/ip4-input/no_error", self.stats.directory)
+        self.assertEqual(
+            sorted(self.stats._trie.prefixed("")), sorted(self.stats.directory)
+        )
+
+    def test_ls_index(self):
+        for i in range(100):
+            self.seg.add_scalar("/sys/node/n%03d" % i)
+        patterns = [
+            "^/err/ip4-",
+            "/if/.x",
+            "^/if/r?x",
+            "^/sys/node/n0[1-3]",
+            "^/interfaces/if1|^/if/names",
+            ".*/calls$",
+            "^/nodes/ip4-input/calls$",
+            "^/if/rx+",
+            "^/if/tx$",
+            "/nothing",
+        ]
+        for pattern in patterns:
+            regex = re.compile(pattern)
+            self.assertEqual(
+                self.stats.ls(pattern),
+                [k for k in self.stats.directory if regex.match(k)],
+                pattern,
+            )
+        self.assertEqual(self.stats.ls(re.compile("^/IF/RX$", re.I)), ["/if/rx"])
+
+    def test_ls_cache(self):
+        names = self.stats.ls("^/err/ip4-")
+        names.append("/mutated")
+        # Unchanged queries are answered from the cache
+        with mock.patch.object(
+            self.stats._trie, "prefixed", side_effect=AssertionError
+        ):
+            self.assertEqual(
+                self.stats.ls("^/err/ip4-"),
+                ["/err/ip4-input/no_error", "/err/ip4-input/ttl_expired"],
+            )
+            # Counters resized, names unchanged
+            self.seg.resize("/err/ip4-input/no_error", 2)
+            self.assertEqual(len(self.stats.ls(["^/err/ip4-", "^/err/ip4-"])), 2)
+        # The slot of a removed counter is reused by a new name
+        self.seg.remove("/err/ip4-input/no_error")
+        self.seg.add_simple("/err/ip4-input/reused", 2, 1)
+        self.assertEqual(
+            self.stats.ls("^/err/ip4-"),
+            ["/err/ip4-input/reused", "/err/ip4-input/ttl_expired"],
+        )
+
+    def test_literal_prefix(self):
+        cases = {
+            "^/err/ip4-": "/err/ip4-",
+            "/if/rx": "/if/rx",
+            "^/if/r?x": "/if/",
+            "^/if/rx*": "/if/r",
+            "^/if/rx+": "/if/rx",
+            "^/nodes/.*/calls": "/nodes/",
+            "^/if/rx|^/if/tx": "",
+            "(?i)/if": "",
+            "^/if/\\.": "/if/",
+        }
+        for pattern, prefix in cases.items():
+            self.assertEqual(vpp_stats.literal_prefix(pattern), prefix, pattern)
+
+    def test_snapshot(self):
+        before = time.time()
+        snap = self.stats.snapshot(["^/if/rx$", "^/if/drops$", "^/err/ip4-"])
+        self.assertIsInstance(snap, vpp_stats.StatsSnapshot)
+        self.assertEqual(
+            sorted(snap),
+            [
+                "/err/ip4-input/no_error",
+                "/err/ip4-input/ttl_expired",
+                "/if/drops",
+                "/if/rx",
+            ],
+        )
+        self.assertEqual(snap["/if/rx"][:, 1].sum_packets(), 21)
+        self.assertEqual(snap.epoch, self.seg.epoch)
+        self.assertGreaterEqual(snap.timestamp, before)
+        self.assertLessEqual(snap.monotonic, time.monotonic())
+        snap = self.stats.snapshot("^/if/rx$", typed_arrays=True)
+        self.assertIsInstance(snap["/if/rx"], vpp_stats.StatsCombinedArray)
+
+    def racing_reads(self):
+        """Patch counter reads to update the segment under the second,
+        as VPP could while the client reads."""
+        calls = []
+        counter_matrix = vpp_stats.counter_matrix
+
+        def read(stats, ptr, width):
+            calls.append(ptr)
+            if len(calls) == 2:
+                with self.seg.lock():
+                    self.seg.set_combined("/if/rx", 0, 0, 99, 9900)
+            return counter_matrix(stats, ptr, width)
+
+        return calls, mock.patch.object(vpp_stats, "counter_matrix", read)
+
+    def test_snapshot_retry(self):
+        calls, patcher = self.racing_reads()
+        with patcher:
+            snap = self.stats.snapshot(["^/if/rx$", "^/if/drops$"])
+        # Both counters are read again, in the new epoch
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(snap["/if/rx"][0][0]["packets"], 99)
+        self.assertEqual(snap.epoch, self.seg.epoch)
+
+        calls, patcher = self.racing_reads()
+        with patcher, self.assertRaises(IOError):
+            self.stats.snapshot(["^/if/rx$", "^/if/drops$"], blocking=False)
+
+    def test_lock_threads(self):
+        lock = self.stats.lock
+        lock.acquire()
+        with self.seg.lock():
+            self.seg.set_combined("/if/rx", 0, 0, 99, 9900)
+        seen = []
+
+        def read():
+            # Not nested in the main thread's acquire
+            with lock:
+                seen.append((lock.depth, lock.epoch))
+
+        t = threading.Thread(target=read)
+        t.start()
+        t.join()
+        self.assertEqual(seen, [(1, self.seg.epoch)])
+        self.assertEqual(lock.depth, 1)
+        with self.assertRaises(IOError):
+            lock.release()
+        self.assertEqual(lock.depth, 0)
+
+    def test_set_errors(self):
+        self.assertEqual(self.stats.set_errors(), {})
+        self.seg.set_simple("/err/ip6-input/ttl_expired", 1, 0, 5)
+        self.seg.set_simple("/err/ip4-input/no_error", 0, 0, 2)
+        self.assertEqual(
+            self.stats.set_errors(),
+            {"/err/ip6-input/ttl_expired": 5, "/err/ip4-input/no_error": 2},
+        )
+
+
+class TestPathTrie(unittest.TestCase):
+    def test_trie(self):
+        trie = vpp_stats.PathTrie()
+        names = ["/if/rx", "/if/rx-miss", "/if/rx/x", "/if/tx", "/err/a/b", "/sys"]
+        for name in names:
+            trie.add(name)
+        self.assertEqual(sorted(trie.prefixed("")), sorted(names))
+        self.assertEqual(
+            sorted(trie.prefixed("/if/rx")), ["/if/rx", "/if/rx-miss", "/if/rx/x"]
+        )
+        self.assertEqual(list(trie.prefixed("/if/rx/")), ["/if/rx/x"])
+        self.assertEqual(list(trie.prefixed("/e")), ["/err/a/b"])
+        self.assertEqual(list(trie.prefixed("/nothing/here")), [])
+        trie.remove("/if/rx")
+        trie.remove("/err/a/b")
+        trie.remove("/not/there")
+        self.assertEqual(
+            sorted(trie.prefixed("/")), ["/if/rx-miss", "/if/rx/x", "/if/tx", "/sys"]
+        )
+        # Emptied branches are pruned
+        self.assertNotIn("err", trie.root[""])
+        for name in ["/if/rx-miss", "/if/rx/x", "/if/tx", "/sys"]:
+            trie.remove(name)
+        self.assertEqual(trie.root, {})
+
+
+class TestVppStatsArrays(unittest.TestCase):
+    def setUp(self):
+        self.seg = interfaces_segment(threads=3, n=5)
+        self.addCleanup(self.seg.close)
+        self.stats = self.seg.client(typed_arrays=True)
+        self.addCleanup(self.stats.disconnect)
+
+    def test_combined(self):
+        rx = self.stats["/if/rx"]
+        self.assertIsInstance(rx, vpp_stats.StatsCombinedArray)
+        self.assertEqual(len(rx), 3)
+        self.assertEqual(
+            rx.sum_packets(), sum(10 * i + t for t in range(3) for i in range(5))
+        )
+        self.assertEqual(list(rx.sum_packets(axis=0)), [3, 33, 63, 93, 123])
+        self.assertEqual(list(rx.sum_octets(axis=1)), [10000, 10005, 10010])
+        self.assertEqual(list(rx.packets()[2]), [2, 12, 22, 32, 42])
+        self.assertEqual(rx[:, 3].sum_packets(), 93)
+        self.assertEqual(rx[:, 3].octets(), [3000, 3001, 3002])
+        self.assertEqual(rx.tolist()[1][3]["packets"], 31)
+        self.stats.typed_arrays = False
+        self.assertEqual(self.stats["/if/rx"], rx.tolist())
+
+    def test_simple(self):
+        drops = self.stats["/if/drops"]
+        self.assertIsInstance(drops, vpp_stats.StatsSimpleArray)
+        self.assertEqual(drops.sum(), 30)
+        self.assertEqual(list(drops.sum(axis=0)), [0, 3, 6, 9, 12])
+        self.assertEqual(list(drops.sum(axis=1)), [10, 10, 10])
+        self.assertEqual(list(drops[1]), [0, 1, 2, 3, 4])
+        self.assertEqual(drops[:, 4].sum(), 12)
+        self.assertEqual(drops.tolist(), [[0, 1, 2, 3, 4]] * 3)
+
+    def test_symlink(self):
+        # Symlinks read one index, not the whole matrix
+        self.assertEqual(self.stats["/interfaces/if4/rx"].packets(), [40, 41, 42])
+        self.seg.set_combined("/if/rx", 2, 4, 100, 200)
+        self.assertEqual(
+            self.stats["/interfaces/if4/rx"].sum_octets(), 4001 + 4000 + 200
+        )
+
+    def test_resize(self):
+        self.seg.resize("/if/rx", 8)
+        rx = self.stats["/if/rx"]
+        self.assertEqual(len(rx.sum_packets(axis=0)), 8)
+        self.assertEqual(rx[:, 7].sum_packets(), 0)
+        self.assertEqual(rx[:, 4].sum_packets(), 123)
+
+
+@unittest.skipIf(vpp_stats.numpy is None, "NumPy not installed")
+class TestVppStatsNumpy(unittest.TestCase):
+    setUp = TestVppStatsArrays.setUp
+
+    def test_numpy(self):
+        rx = self.stats["/if/rx"]
+        self.assertIsInstance(rx.array, vpp_stats.numpy.ndarray)
+        self.assertEqual(rx.array.shape, (3, 5, 2))
+        self.assertEqual(self.stats["/if/drops"].array.shape, (3, 5))
+        # Copied out of the segment
+        self.seg.set_combined("/if/rx", 0, 0, 1, 1)
+        self.assertEqual(rx.array[0, 0, 0], 0)
+
+
+class NoNumpy:
+    """Run the tests of a TestCase with the array.array fallbacks"""
+
+    def setUp(self):
+        saved = vpp_stats.numpy
+        vpp_stats.numpy = None
+        self.addCleanup(setattr, vpp_stats, "numpy", saved)
+        super().setUp()
+
+
+class TestVppStatsNoNumpy(NoNumpy, TestVppStats):
+    pass
+
+
+class TestVppStatsArraysNoNumpy(NoNumpy, TestVppStatsArrays):
+
+    def test_array(self):
+        rx = self.stats["/if/rx"]
+        self.assertIsInstance(rx.array[0], array.array)
+        self.assertEqual(len(rx.array[0]), 10)
+
+
+def plain(changes):
+    """StatsChanges as {name: (index, delta)} of ints"""
+
+    def value(d):
+        try:
+            return tuple(int(v) for v in d)
+        except TypeError:
+            return int(d)
+
+    return {
+        name: ([int(i) for i in c.index], [value(d) for d in c.delta])
+        for name, c in changes.items()
+    }
+
+
+class TestStatsPoller(unittest.TestCase):
+    def setUp(self):
+        self.seg = interfaces_segment()
+        self.addCleanup(self.seg.close)
+        self.stats = self.seg.client()
+        self.addCleanup(self.stats.disconnect)
+        self.poller = vpp_stats.StatsPoller(
+            self.stats, ["^/if/", "^/err/", "^/interfaces/"], history=3
+        )
+
+    def test_deltas(self):
+        first = self.poller.poll()
+        self.assertEqual(first, {})
+        self.assertIsNone(first.interval)
+        self.assertEqual(self.poller.poll(), {})
+        self.seg.set_combined("/if/rx", 1, 1, 11 + 5, 1001 + 500)
+        self.seg.set_simple("/if/drops", 0, 2, 2 + 3)
+        self.seg.set_simple("/err/ip4-input/no_error", 1, 0, 7)
+        changes = self.poller.poll()
+        self.assertEqual(
+            plain(changes),
+            {
+                "/if/rx": ([1], [(5, 500)]),
+                "/interfaces/if1/rx": ([0], [(5, 500)]),
+                "/if/drops": ([2], [3]),
+                "/err/ip4-input/no_error": ([0], [7]),
+            },
+        )
+        self.assertGreater(changes.interval, 0)
+        self.assertAlmostEqual(
+            float(changes["/if/drops"].rate[0]), 3 / changes.interval
+        )
+        self.assertEqual(self.poller.poll(), {})
+
+    def test_reset(self):
+        self.poller.poll()
+        self.seg.set_simple("/if/drops", 0, 3, 1)
+        self.seg.set_simple("/if/drops", 1, 3, 0)
+        # 6 -> 1 is a reset, with 1 counted since
+        self.assertEqual(plain(self.poller.poll()), {"/if/drops": ([3], [1])})
+
+    def test_epoch(self):
+        self.poller.poll()
+        self.seg.resize("/if/drops", 6)
+        self.seg.set_simple("/if/drops", 0, 5, 100)
+        self.seg.remove("/err/ip4-input/no_error")
+        self.seg.add_simple("/err/ip4-input/new", 2, 1)
+        # New indexes and counters start from their current values
+        self.assertEqual(self.poller.poll(), {})
+        self.assertNotIn("/err/ip4-input/no_error", self.poller.counters)
+        self.assertIn("/err/ip4-input/new", self.poller.counters)
+        self.seg.set_simple("/if/drops", 0, 5, 101)
+        self.seg.set_simple("/if/drops", 1, 1, 2)
+        self.seg.set_simple("/err/ip4-input/new", 1, 0, 4)
+        self.assertEqual(
+            plain(self.poller.poll()),
+            {"/if/drops": ([1, 5], [1, 1]), "/err/ip4-input/new": ([0], [4])},
+        )
+
+    def test_samples(self):
+        for value in range(1, 6):
+            self.seg.set_simple("/if/drops", 0, 0, value)
+            self.poller.poll()
+        times, totals = self.poller.samples("/if/drops")
+        self.assertEqual(len(times), 3)
+        self.assertEqual(times, sorted(times))
+        self.assertEqual([int(t[0]) for t in totals], [3, 4, 5])
+        times, totals = self.poller.samples("/if/rx")
+        self.assertEqual(int(totals[-1][3][1]), 6001)
+
+    def test_missing(self):
+        self.seg.set_simple("/err/ip4-input/no_error", 0, 0, 1)
+        self.poller.poll()
+        # Not returned by a poll of the same epoch
+        self.poller.patterns = ["^/if/", "^/interfaces/"]
+        self.seg.set_simple("/err/ip4-input/no_error", 0, 0, 2)
+        self.poller.poll()
+        self.assertNotIn("/err/ip4-input/no_error", self.poller.counters)
+        with self.assertRaises(KeyError):
+            self.poller.samples("/err/ip4-input/no_error")
+        # and back, without the totals of the first poll
+        self.poller.patterns = ["^/if/", "^/err/", "^/interfaces/"]
+        self.seg.set_simple("/err/ip4-input/no_error", 0, 0, 3)
+        self.assertEqual(self.poller.poll(), {})
+        times, totals = self.poller.samples("/err/ip4-input/no_error")
+        self.assertEqual(len(times), 1)
+        self.assertEqual([int(t[0]) for t in totals], [3])
+
+
+class TestStatsPollerNoNumpy(NoNumpy, TestStatsPoller):
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import ctypes
+import struct
+import threading
+import time
+import unittest
+from unittest import mock
+
+from vpp_papi import vpp_papi
+from vpp_papi import vpp_transport_shmem
+from vpp_papi import vpp_transport_socket
+from vpp_papi.tests.test_vpp_papi import (
+    fake_definitions,
+    handle_test_add,
+    handle_test_dump,
+)
+from vpp_papi.vpp_mock_server import MockVppServer
+from vpp_papi.vpp_transport_shmem import VppTransportShmemIOError
+
+# Tests in test_vpp_papi replace the transport class with a mock.
+ShmemTransport = vpp_transport_shmem.VppTransport
+
+header = struct.Struct(">QII")
+
+
+class FakeVac:
+    """Stand-in for libvppapiclient. Requests are answered in process
+    by a MockVppServer, and the replies queued for vac_read() or, while
+    the receive thread runs, passed to the callback, as by the svm
+    queue of the client."""
+
+    def __init__(self, server):
+        self.server = server
+        self.ids = {m["name"]: m["index"] for m in server.message_table}
+        self.cond = threading.Condition()
+        self.queue = collections.deque()
+        self.buffers = {}
+        self.connected = False
+        self.rx_running = False
+        self.rx_thread = None
+        self.callback = None
+
+    def enqueue(self, framed):
+        offset = 0
+        with self.cond:
+            while offset < len(framed):
+                _, length, _ = header.unpack_from(framed, offset)
+                offset += header.size
+                self.queue.append(framed[offset : offset + length])
+                offset += length
+            self.cond.notify_all()
+
+    def event(self, name, **fields):
+        self.enqueue(self.server.pack(name, **fields))
+
+    def rx(self):
+        with self.cond:
+            while True:
+                self.cond.wait_for(
+                    lambda: not self.connected or (self.rx_running and self.queue)
+                )
+                if not self.connected:
+                    return
+                msg = self.queue.popleft()
+                buf = ctypes.create_string_buffer(msg, len(msg))
+                self.callback(ctypes.addressof(buf), len(msg))
+
+    def vac_connect(self, name, pfx, cb, rx_qlen):
+        self.connected = True
+        if cb:
+            self.callback = cb
+            self.rx_running = True
+            self.rx_thread = threading.Thread(target=self.rx, daemon=True)
+            self.rx_thread.start()
+        return 0
+
+    def vac_disconnect(self):
+        with self.cond:
+            self.connected = False
+            self.cond.notify_all()
+        if self.rx_thread is not None:
+            self.rx_thread.join()
+            self.rx_thread = None
+        return 0
+
+    def vac_rx_suspend(self):
+        with self.cond:
+            self.rx_running = False
+
+    def vac_rx_resume(self):
+        with self.cond:
+            self.rx_running = True
+            self.cond.notify_all()
+
+    def vac_write(self, data, length):
+        out, _ = self.server.handle(data[:length], 7)
+        self.enqueue(out)
+        return 0
+
+    def vac_read(self, p, length, timeout):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.queue, timeout or None):
+                return vpp_transport_shmem.VAC_TIMEOUT
+            msg = self.queue.popleft()
+        buf = ctypes.create_string_buffer(msg, len(msg))
+        self.buffers[ctypes.addressof(buf)] = buf
+        p._obj.value = ctypes.addressof(buf)
+        length._obj.value = len(msg)
+        return 0
+
+    def vac_free(self, data):
+        del self.buffers[data]
+
+    def vac_get_msg_index(self, name):
+        return self.ids.get(name.decode(), -1)
+
+    def vac_msg_table_max_index(self):
+        return max(self.ids.values())
+
+
+class TestVppTransportShmem(unittest.TestCase):
+    def setUp(self):
+        self.server = MockVppServer(definitions=fake_definitions())
+        self.server.set_handler("test_add", lambda r, i: handle_test_add(r))
+        self.server.set_handler("test_dump", lambda r, i: handle_test_dump(r))
+        self.vac = FakeVac(self.server)
+        for patcher in (
+            mock.patch.object(vpp_transport_shmem, "VppTransport", ShmemTransport),
+            mock.patch.object(vpp_transport_shmem, "_lib", self.vac),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def client(self, **kwargs):
+        return vpp_papi.VPPApiClient(
+            apifiles=[],
+            testmode=True,
+            transport="shmem",
+            definitions=fake_definitions(),
+            **kwargs,
+        )
+
+    def test_transport(self):
+        c = self.client(async_thread=False)
+        self.assertIsInstance(c.transport, ShmemTransport)
+        self.assertEqual(c.connect("shmem"), 0)
+        self.assertIsNotNone(self.vac.rx_thread)
+        self.assertEqual(c.api.test_add(value=41).value, 42)
+        details = c.api.test_dump(count=100)
+        self.assertEqual([d.value for d in details], list(range(100)))
+        # The receive thread is resumed after each call
+        self.assertTrue(self.vac.rx_running)
+        self.assertEqual(self.vac.buffers, {})
+        self.assertEqual(c.transport.get_msg_index("no_such_message_1234"), 0)
+        c.disconnect()
+        self.assertFalse(c.transport.connected)
+        self.assertFalse(self.vac.connected)
+        self.assertIsNone(vpp_transport_shmem._transport)
+
+    def test_connect_sync(self):
+        c = self.client(async_thread=False)
+        c.connect_sync("shmem")
+        self.assertIsNone(self.vac.rx_thread)
+        self.assertEqual(c.api.test_add(value=1).value, 2)
+        self.vac.event("test_event", pid=1, value=3)
+        r = c.read_blocking()
+        self.assertEqual((type(r).__name__, r.value), ("test_event", 3))
+        c.disconnect()
+
+    def test_events(self):
+        c = self.client()
+        events = []
+        c.register_event_callback(lambda name, r: events.append((name, r.value)))
+        c.connect("shmem")
+        self.assertEqual(c.api.test_add(value=1).value, 2)
+        self.vac.event("test_event", pid=1, value=3)
+        deadline = time.monotonic() + 5
+        while not events and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(events, [("test_event", 3)])
+        c.disconnect()
+
+    def test_single_client(self):
+        c1 = self.client(async_thread=False)
+        c1.connect("one")
+        c2 = self.client(async_thread=False)
+        with self.assertRaises(VppTransportShmemIOError):
+            c2.connect("two")
+        c1.disconnect()
+        c2.connect("two")
+        c2.disconnect()
+
+    def test_errors(self):
+        c = self.client(async_thread=False)
+        with self.assertRaises(VppTransportShmemIOError):
+            c.transport.write(b"\0\0")
+        c.connect("shmem")
+        with mock.patch.object(self.vac, "vac_write", return_value=-1):
+            with self.assertRaises(VppTransportShmemIOError):
+                c.transport.write(b"\0\0")
+        c.disconnect()
+        with mock.patch.object(vpp_transport_shmem, "_lib", None):
+            with self.assertRaises(VppTransportShmemIOError):
+                vpp_transport_shmem.load_library("libvppapiclient-missing.so")
+
+    def test_select(self):
+        # use_socket is ignored, as it always was
+        c = vpp_papi.VPPApiClient(apifiles=[], testmode=True, use_socket=False)
+        self.assertIsInstance(c.transport, vpp_transport_socket.VppTransport)
+        with self.assertRaises(vpp_papi.VPPValueError):
+            vpp_papi.VPPApiClient(apifiles=[], testmode=True, transport="carrier")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+On-disk cache of pre-processed API definitions.
+
+Loading the API definitions parses every .api.json file, resolves the
+types in up to four passes and builds a VPPMessage (and its namedtuple
+class) for each of the ~2000 messages. The cache stores the definitions
+in resolution order for a set of API files, so a later load just
+replays the types and builds messages on first access.
+
+A cache entry is valid as long as every file still has the same path
+and content, compared by SHA-1 digest: hashing the files is cheap next
+to parsing them, and unlike mtime and size it neither misses a file
+rewritten within the mtime granularity nor rebuilds the cache for one
+replaced with the same content. Entries are written with marshal,
+which only handles plain data and cannot run code on load. Message
+CRCs are part of the cached definitions and are still checked against
+VPP's message table on connect.
+"""
+
+import collections.abc
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import threading
+
+from .vpp_serializer import VPPMessage
+
+logger = logging.getLogger("vpp_papi.cache")
+logger.addHandler(logging.NullHandler())
+
+# Bump when the layout of cached records changes
+CACHE_VERSION = 2
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "vpp_papi")
+
+
+class MessageDefinitions(collections.abc.MutableMapping):
+    """Message name -> VPPMessage mapping, built on first access.
+
+    Holds the raw message definitions and only creates the VPPMessage
+    when a message is looked up. Iterating over items() builds all of
+    them; iterate over the keys to avoid that.
+    """
+
+    def __init__(self, defs=()):
+        self._data = {}
+        self._lock = threading.Lock()
+        for d in defs:
+            self.define(d)
+
+    def define(self, d):
+        """Add message definition d, [name, field, ..., options]."""
+        self._data[d[0]] = d
+
+    def __getitem__(self, name):
+        v = self._data[name]
+        if type(v) is list:
+            with self._lock:
+                v = self._data[name]
+                if type(v) is list:
+                    v = VPPMessage(v[0], v[1:])
+                    self._data[name] = v
+        return v
+
+    def __setitem__(self, name, msg):
+        self._data[name] = msg
+
+    def __delitem__(self, name):
+        del self._data[name]
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def built(self):
+        """Number of messages materialized so far."""
+        return sum(type(v) is not list for v in self._data.values())
+
+    def __repr__(self):
+        return "<MessageDefinitions %d messages, %d built>" % (
+            len(self._data),
+            self.built(),
+        )
+
+
+class ApiCache:
+    """Cache of processed API definitions in directory 'path'."""
+
+    def __init__(self, path=None):
+        self.path = path or default_cache_dir()
+
+    @staticmethod
+    def _digest(apifiles):
+        files = []
+        for f in sorted(os.path.abspath(f) for f in apifiles):
+            with open(f, "rb") as fp:
+                files.append([f, hashlib.sha1(fp.read()).hexdigest()])
+        return files
+
+    def filename(self, apifiles):
+        # The file list comes from os.walk, its order is not stable.
+        h = hashlib.sha1(sys.version.encode())
+        for f in sorted(os.path.abspath(f) for f in apifiles):
+            h.update(b"\0" + f.encode())
+        return os.path.join(self.path, "api-%s.cache" % h.hexdigest()[:20])
+
+    def load(self, apifiles):
+        """Return the cached records for apifiles, or None on a miss."""
+        try:
+            with open(self.filename(apifiles), "rb") as f:
+                entry = marshal.load(f)
+            if entry["version"] != CACHE_VERSION:
+                return None
+            if entry["files"] == self._digest(apifiles):
+                return entry["records"]
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+        return None
+
+    def store(self, apifiles, records):
+        """Write records for apifiles. Failures are logged and ignored."""
+        entry = {
+            "version": CACHE_VERSION,
+            "files": self._digest(apifiles),
+            "records": records,
+        }
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".api-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    marshal.dump(entry, f)
+                os.replace(tmp, self.filename(apifiles))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot write API cache in %s: %s", self.path, e)
@@ -0,0 +1,385 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Compiled pack / unpack codecs for VPP API types.
+
+The interpreted serializer walks the field list of a type for every
+message it packs or unpacks. The codec compiler flattens each run of
+fixed-size fields (scalars, enums, u8 arrays, fixed arrays of scalars
+and aliases of those) into a single struct.Struct and generates a small
+Python function per type that only calls out to the original packers
+for strings, VLAs, unions and nested types.
+
+The generated functions produce the same bytes and tuples as the
+interpreted path. Whenever they hit something unexpected (missing
+VLA length, wrong list length, a value struct refuses, ...), they fall
+back to the interpreted implementation so errors are reported exactly
+as before.
+
+Enable with vpp_serializer.set_compiled_codecs(True).
+"""
+
+import logging
+import struct
+
+from . import vpp_format
+from .vpp_serializer import (
+    BaseTypes,
+    FixedList,
+    FixedList_u8,
+    VLAList,
+    VPPEnumType,
+    VPPType,
+    VPPTypeAlias,
+    logger,
+)
+
+_EMPTY = {}
+
+
+class CodecFallback(Exception):
+    """Raised by generated code to defer to the interpreted path."""
+
+
+class _Leaf:
+    """A field that can be folded into a struct run."""
+
+    def __init__(self, prefix, code, kind, default=0, num=1, enum=None, scalar=None):
+        self.prefix = prefix
+        self.code = code
+        self.kind = kind  # scalar, bytes or array
+        self.default = default
+        self.num = num
+        self.enum = enum
+        self.scalar = scalar
+        self.alias_default = None
+
+
+def _options_default(p):
+    options = getattr(p, "options", None)
+    if options and "default" in options:
+        return options["default"]
+    return 0
+
+
+def _scalar_format(p):
+    if type(p) is BaseTypes and p._elements == 0 and p._type != "string":
+        fmt = p.packer.format
+        return fmt[0], fmt[1:]
+    return None
+
+
+def _leaf(p):
+    """Classify packer p, return a _Leaf or None if it must be called."""
+    t = type(p)
+    if t is BaseTypes:
+        fmt = _scalar_format(p)
+        if fmt:
+            return _Leaf(fmt[0], fmt[1], "scalar", _options_default(p))
+        return None
+    if isinstance(p, VPPEnumType):
+        fmt = _scalar_format(BaseTypes(p.enumtype))
+        return _Leaf(fmt[0], fmt[1], "scalar", _options_default(p), enum=p.enum)
+    if t is FixedList_u8:
+        return _Leaf(">", "%ds" % p.num, "bytes", num=p.num)
+    if t is FixedList:
+        fmt = _scalar_format(p.scalar)
+        if fmt and fmt[0] == ">":
+            code = "%d%s" % (p.num, fmt[1])
+            return _Leaf(">", code, "array", num=p.num, scalar=p.scalar)
+        return None
+    if t is VPPTypeAlias:
+        if (
+            p.name in vpp_format.conversion_table
+            or p.name in vpp_format.conversion_unpacker_table
+        ):
+            return None
+        leaf = _leaf(p.packer)
+        if leaf is None or leaf.enum is not None:
+            return None
+        leaf.alias_default = _options_default(p)
+        return leaf
+    return None
+
+
+def _tuple_expr(items):
+    items = list(items)
+    if not items:
+        return "()"
+    return "(%s,)" % ", ".join(items)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+
+    def __call__(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def source(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _copy_into(pack):
+    """pack_into() in terms of pack(), for types that are not a single
+    struct run."""
+
+    def pack_into(buf, offset, data, kwargs=None):
+        b = pack(data, kwargs)
+        buf[offset : offset + len(b)] = b
+        return len(b)
+
+    return pack_into
+
+
+class CompiledCodec:
+    """Generated pack/unpack functions for one type."""
+
+    def __init__(self, name, pack, unpack, source, structs, pack_into=None):
+        self.name = name
+        self.pack = pack
+        self.pack_into = pack_into or _copy_into(pack)
+        self.unpack = unpack
+        self.source = source
+        self.structs = structs
+
+    def __repr__(self):
+        return "CompiledCodec(name=%s, structs=%s)" % (
+            self.name,
+            [s.format for s in self.structs],
+        )
+
+
+def _segments(t):
+    """Split the fields of t into struct runs and called fields."""
+    segments = []
+    run = None
+    for i, p in enumerate(t.packers):
+        leaf = _leaf(p)
+        if leaf is None:
+            run = None
+            segments.append(("call", i, p))
+            continue
+        if run is None or run[1] != leaf.prefix:
+            run = ["run", leaf.prefix, []]
+            segments.append(run)
+        run[2].append((i, leaf))
+    return segments
+
+
+def _compile(name, ns, w, structs):
+    source = w.source()
+    code = compile(source, "<vpp_codec %s>" % name, "exec")
+    exec(code, ns)
+    return CompiledCodec(
+        name, ns["pack"], ns["unpack"], source, structs, ns.get("pack_into")
+    )
+
+
+def compile_type(t):
+    """Generate a CompiledCodec for a VPPType / VPPMessage."""
+    ns = {
+        "_T": t.tuple,
+        "_new": tuple.__new__,
+        "_EMPTY": _EMPTY,
+        "_Fallback": CodecFallback,
+        "_slow_pack": t._pack,
+        "_slow_pack_into": _copy_into(t._pack),
+        "_slow_unpack": t._unpack,
+        "_conv_get": vpp_format.conversion_unpacker_table.get,
+    }
+    structs = []
+    segments = _segments(t)
+    names = t.fields
+
+    # Pack
+    w = _Writer()
+    start = len(w.lines)
+    w("def pack(data, kwargs=None):")
+    w.indent += 1
+    w("if data is None:")
+    w("    data = _EMPTY")
+    w("elif type(data) is not dict:")
+    w("    return _slow_pack(data, kwargs)")
+    w("if not kwargs:")
+    w("    kwargs = data")
+    w("try:")
+    w.indent += 1
+    w("get = data.get")
+    parts = []
+    for seg in segments:
+        if seg[0] == "call":
+            _, i, p = seg
+            ns["_p%d" % i] = p
+            n = repr(names[i])
+            if isinstance(p, VPPType):
+                w("kw%d = kwargs.get(%s) if %s in data else None" % (i, n, n))
+                parts.append("_p%d.pack(get(%s), kw%d)" % (i, n, i))
+            else:
+                parts.append("_p%d.pack(get(%s), kwargs)" % (i, n))
+            continue
+        _, prefix, fields = seg
+        s = struct.Struct(prefix + "".join(leaf.code for _, leaf in fields))
+        k = len(structs)
+        structs.append(s)
+        ns["_s%d" % k] = s
+        args = []
+        for i, leaf in fields:
+            v = "v%d" % i
+            w("%s = get(%r)" % (v, names[i]))
+            if leaf.alias_default is not None:
+                ns["_ad%d" % i] = leaf.alias_default
+                w("if %s is None:" % v)
+                w("    %s = _ad%d" % (v, i))
+            if leaf.kind == "scalar":
+                ns["_d%d" % i] = leaf.default
+                w("if %s is None:" % v)
+                w("    %s = _d%d" % (v, i))
+                args.append(v)
+            elif leaf.kind == "bytes":
+                w("if not %s:" % v)
+                w('    %s = b""' % v)
+                w("elif len(%s) > %d:" % (v, leaf.num))
+                w("    raise _Fallback")
+                args.append(v)
+            else:
+                w("if len(%s) != %d:" % (v, leaf.num))
+                w("    raise _Fallback")
+                args.append("*" + v)
+        parts.append("_s%d.pack(%s)" % (k, ", ".join(args)))
+    if not parts:
+        w('return b""')
+    elif len(parts) == 1 and parts[0].startswith("_s"):
+        w("return %s" % parts[0])
+    else:
+        w('return b"".join(%s)' % _tuple_expr(parts))
+    w.indent -= 1
+    w("except Exception:")
+    w("    return _slow_pack(data, kwargs)")
+    w.indent -= 1
+    w("")
+
+    # Pack into a buffer: a type packed by a single struct is written
+    # in place with pack_into, anything else is packed and copied.
+    if len(parts) == 1 and parts[0].startswith("_s"):
+        ret = "return " + parts[0]
+        for line in w.lines[start:]:
+            indent = line[: len(line) - len(line.lstrip())]
+            if line.startswith("def pack("):
+                w("def pack_into(buf, offset, data, kwargs=None):")
+            elif line.strip() == ret:
+                w(indent + "_s0.pack_into(buf, offset, " + parts[0][9:])
+                w(indent + "return %d" % structs[0].size)
+            else:
+                w(line.replace("_slow_pack(", "_slow_pack_into(buf, offset, "))
+
+    # Unpack
+    w("def unpack(data, offset=0, result=None, ntc=False, arrays=False):")
+    w.indent += 1
+    w("start = offset")
+    w("ntc0 = ntc")
+    w("conv = None")
+    w("if ntc is False:")
+    w("    conv = _conv_get(%r)" % t.name)
+    w("    if conv is not None:")
+    w("        ntc = True")
+    w("try:")
+    w.indent += 1
+    k = 0
+    for seg in segments:
+        if seg[0] == "call":
+            _, i, p = seg
+            prior = "None"
+            if isinstance(p, VLAList):
+                prior = _tuple_expr("v%d" % j for j in range(i))
+            w("v%d, size = _p%d.unpack(data, offset, %s, ntc, arrays)" % (i, i, prior))
+            w("if type(v%d) is tuple and len(v%d) == 1:" % (i, i))
+            w("    v%d = v%d[0]" % (i, i))
+            w("offset += size")
+            continue
+        _, prefix, fields = seg
+        s = structs[k]
+        w("t = _s%d.unpack_from(data, offset)" % k)
+        k += 1
+        j = 0
+        fmt = prefix
+        for i, leaf in fields:
+            if leaf.enum is not None:
+                ns["_e%d" % i] = leaf.enum
+                w("v%d = _e%d(t[%d])" % (i, i, j))
+                j += 1
+            elif leaf.kind == "array":
+                ns["_a%d" % i] = leaf.scalar
+                w("if arrays:")
+                w(
+                    "    v%d = _a%d.unpack_array(data, offset + %d, %d, True)[0]"
+                    % (i, i, struct.calcsize(fmt), leaf.num)
+                )
+                w("else:")
+                w("    v%d = list(t[%d:%d])" % (i, j, j + leaf.num))
+                j += leaf.num
+            else:
+                w("v%d = t[%d]" % (i, j))
+                j += 1
+            fmt += leaf.code
+        w("offset += %d" % s.size)
+    w.indent -= 1
+    w("except Exception:")
+    w("    return _slow_unpack(data, start, result, ntc0, arrays)")
+    w("r = _new(_T, %s)" % _tuple_expr("v%d" % i for i in range(len(names))))
+    w("if conv is not None:")
+    w("    r = conv(r)")
+    w("return r, offset - start")
+
+    return _compile(t.name, ns, w, structs)
+
+
+def compile_union(u):
+    """Generate a CompiledCodec for a VPPUnionType."""
+    ns = {
+        "_T": u.tuple,
+        "_new": tuple.__new__,
+        "_packers": u.packers,
+        "_zeros": b"\x00" * u.size,
+        "_logger": logger,
+        "_DEBUG": logging.DEBUG,
+    }
+    w = _Writer()
+    w("def pack(data, kwargs=None):")
+    w("    if not data:")
+    w("        return _zeros")
+    w("    for k, v in data.items():")
+    w("        if _logger.isEnabledFor(_DEBUG):")
+    w('            _logger.debug("Key: {} Value: {}".format(k, v))')
+    w("        b = _packers[k].pack(v, kwargs)")
+    w("        break")
+    w("    return bytes(b) + _zeros[len(b):]")
+    w("")
+    w("def unpack(data, offset=0, result=None, ntc=False, arrays=False):")
+    w.indent += 1
+    for i, p in enumerate(u.packers.values()):
+        ns["_p%d" % i] = p
+        w("x%d, s%d = _p%d.unpack(data, offset, ntc=ntc, arrays=arrays)" % (i, i, i))
+    n = len(u.packers)
+    w(
+        "return _new(_T, %s), max(0, %s)"
+        % (
+            _tuple_expr("x%d" % i for i in range(n)),
+            ", ".join("s%d" % i for i in range(n)) or "0",
+        )
+    )
+    return _compile(u.name, ns, w, [])
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import collections
 import datetime
 from socket import inet_pton, AF_INET6, AF_INET
 import socket
@@ -216,3 +217,277 @@ conversion_unpacker_table = {
     "vl_api_timestamp_t": lambda o: datetime.datetime.fromtimestamp(o),
     "vl_api_timedelta_t": lambda o: datetime.timedelta(seconds=o),
 }
+
+
+#
+# Bulk conversion of messages decoded without type conversion
+#
+# Decoding a dump with _no_type_conversion=True and converting all the
+# messages with convert_messages() is faster than converting each value
+# while decoding: the fields to convert are found once per message type,
+# and addresses and prefixes are interned, so a prefix seen in 10k
+# routes is only converted once. The "raw" mode keeps addresses packed.
+#
+
+
+def interned(convert, maxsize=65536):
+    """Wrap convert in a bounded cache keyed on the unconverted value.
+
+    Converted values are shared, so convert must return immutable
+    objects. The cache is cleared when it reaches maxsize; unhashable
+    values are converted every time.
+    """
+    values = {}
+    get = values.get
+
+    def convert_interned(o):
+        try:
+            v = get(o)
+        except TypeError:
+            return convert(o)
+        if v is None:
+            v = convert(o)
+            if len(values) >= maxsize:
+                values.clear()
+            values[o] = v
+        return v
+
+    convert_interned.values = values
+    return convert_interned
+
+
+class RawAddress(bytes):
+    """Packed IPv4 or IPv6 address, formatted only when asked for."""
+
+    __slots__ = ()
+
+    @property
+    def packed(self):
+        return bytes(self)
+
+    @property
+    def version(self):
+        return 4 if len(self) == 4 else 6
+
+    def ip_address(self):
+        return ipaddress.ip_address(bytes(self))
+
+    def __str__(self):
+        return socket.inet_ntop(AF_INET if len(self) == 4 else AF_INET6, self)
+
+    def __repr__(self):
+        return "RawAddress(%s)" % self
+
+
+class RawPrefix(collections.namedtuple("RawPrefix", ["address", "len"])):
+    """(RawAddress, prefix length), formatted only when asked for."""
+
+    __slots__ = ()
+
+    def ip_network(self):
+        return ipaddress.ip_network((self.address.packed, self.len), False)
+
+    def ip_interface(self):
+        return ipaddress.ip_interface((self.address.packed, self.len))
+
+    def __str__(self):
+        return "%s/%d" % (self.address, self.len)
+
+
+def format_raw_address_t(o):
+    if len(o) == 4:
+        return {"af": ADDRESS_IP4, "un": {"ip4": o.packed}}
+    return {"af": ADDRESS_IP6, "un": {"ip6": o.packed}}
+
+
+def unformat_raw_address_t(o):
+    if o.af == ADDRESS_IP6:
+        return RawAddress(o.un.ip6)
+    return RawAddress(o.un.ip4)
+
+
+def _raw_prefix(o):
+    return {"address": o.address.packed, "len": o.len}
+
+
+def _raw_address_prefix(o):
+    return {"address": format_raw_address_t(o.address), "len": o.len}
+
+
+# Packing of RawAddress and RawPrefix, added to conversion_table when
+# the raw mode is first used.
+raw_conversion_table = {
+    "vl_api_ip4_address_t": {"RawAddress": lambda o: o.packed},
+    "vl_api_ip6_address_t": {"RawAddress": lambda o: o.packed},
+    "vl_api_address_t": {"RawAddress": format_raw_address_t},
+    "vl_api_ip4_prefix_t": {"RawPrefix": _raw_prefix},
+    "vl_api_ip6_prefix_t": {"RawPrefix": _raw_prefix},
+    "vl_api_ip4_address_with_prefix_t": {"RawPrefix": _raw_prefix},
+    "vl_api_ip6_address_with_prefix_t": {"RawPrefix": _raw_prefix},
+    "vl_api_prefix_t": {"RawPrefix": _raw_address_prefix},
+    "vl_api_address_with_prefix_t": {"RawPrefix": _raw_address_prefix},
+}
+
+raw_unpacker_table = {
+    "vl_api_ip6_address_t": RawAddress,
+    "vl_api_ip4_address_t": RawAddress,
+    "vl_api_address_t": unformat_raw_address_t,
+    "vl_api_ip6_prefix_t": lambda o: RawPrefix(RawAddress(o.address), o.len),
+    "vl_api_ip4_prefix_t": lambda o: RawPrefix(RawAddress(o.address), o.len),
+    "vl_api_prefix_t": lambda o: RawPrefix(unformat_raw_address_t(o.address), o.len),
+    "vl_api_address_with_prefix_t": lambda o: RawPrefix(
+        unformat_raw_address_t(o.address), o.len
+    ),
+    "vl_api_ip4_address_with_prefix_t": lambda o: RawPrefix(
+        RawAddress(o.address), o.len
+    ),
+    "vl_api_ip6_address_with_prefix_t": lambda o: RawPrefix(
+        RawAddress(o.address), o.len
+    ),
+}
+
+# Types whose converted values are immutable and worth interning
+interned_types = frozenset(raw_unpacker_table)
+
+
+def _ipaddress_table():
+    table = dict(conversion_unpacker_table)
+    for t in interned_types:
+        if t in table:
+            table[t] = interned(table[t])
+    return table
+
+
+def _raw_table():
+    for t, conversions in raw_conversion_table.items():
+        conversion_table[t].update(conversions)
+    table = dict(conversion_unpacker_table)
+    for t, f in raw_unpacker_table.items():
+        table[t] = interned(f)
+    return table
+
+
+# Conversion modes of convert_messages(): name -> function returning the
+# unpacker table to use, built on first use. See register_unpacker_mode().
+unpacker_modes = {
+    "ipaddress": _ipaddress_table,
+    "raw": _raw_table,
+}
+_mode_tables = {}
+_converters = {}
+
+
+def register_unpacker_mode(mode, table):
+    """Add or replace conversion mode 'mode' of convert_messages().
+
+    table maps type names to conversion functions, like
+    conversion_unpacker_table, or is a function returning such a table.
+    Types not in the table are left unconverted.
+    """
+    unpacker_modes[mode] = table if callable(table) else (lambda: table)
+    _mode_tables.pop(mode, None)
+    for k in [k for k in _converters if k[1] == mode]:
+        del _converters[k]
+
+
+def _mode_table(mode):
+    table = _mode_tables.get(mode)
+    if table is None:
+        try:
+            table = _mode_tables[mode] = unpacker_modes[mode]()
+        except KeyError:
+            raise ValueError("Unknown conversion mode {!r}".format(mode))
+    return table
+
+
+def _each(f):
+    def convert_list(lst):
+        return [f(x) for x in lst]
+
+    return convert_list
+
+
+def _field_converter(ftype, mode, table):
+    """Function converting a field of type ftype, or None."""
+    from . import vpp_serializer as s
+
+    if ftype in table:
+        return table[ftype]
+    t = s.types.get(ftype)
+    if isinstance(t, s.VPPTypeAlias):
+        f = _field_converter(t.msgdef["type"], mode, table)
+        if f is not None and "length" in t.msgdef:
+            f = _each(f)
+        return f
+    if isinstance(t, (s.VPPType, s.VPPUnionType)):
+        return type_converter(t, mode)
+    return None
+
+
+def type_converter(t, mode="ipaddress"):
+    """Function converting a tuple of VPPType or VPPUnionType t, decoded
+    with ntc=True, as in mode 'mode', or None if nothing needs it."""
+    from . import vpp_serializer as s
+
+    key = (t, mode)
+    try:
+        return _converters[key]
+    except KeyError:
+        pass
+    table = _mode_table(mode)
+    if t.name in table:
+        convert = table[t.name]
+    else:
+        if isinstance(t, s.VPPUnionType):
+            fields = ((p, getattr(p, "name", None)) for p in t.packers.values())
+        else:
+            fields = zip(t.packers, t.fieldtypes)
+        # Generate a function rebuilding the tuple in one go:
+        # return _new(_T, (o[0], _f1(o[1]), o[2], ...))
+        ns = {"_T": t.tuple, "_new": tuple.__new__}
+        args = []
+        for i, (p, ftype) in enumerate(fields):
+            f = _field_converter(ftype, mode, table)
+            if f is None:
+                args.append("o[%d]" % i)
+                continue
+            if isinstance(p, (s.FixedList, s.VLAList, s.VLAList_legacy)):
+                f = _each(f)
+            ns["_f%d" % i] = f
+            args.append("_f%d(o[%d])" % (i, i))
+        convert = None
+        if len(ns) > 2:
+            source = "def convert(o):\n    return _new(_T, (%s,))\n" % ", ".join(args)
+            exec(compile(source, "<vpp_format %s>" % t.name, "exec"), ns)
+            convert = ns["convert"]
+    _converters[key] = convert
+    return convert
+
+
+def convert_messages(msgs, mode="ipaddress"):
+    """Convert a batch of messages decoded with _no_type_conversion=True.
+
+    mode "ipaddress" gives the same values as decoding with type
+    conversion. mode "raw" keeps addresses and prefixes as RawAddress
+    and RawPrefix, which are only formatted when asked for and can be
+    passed back in API calls. Other modes can be added with
+    register_unpacker_mode(). Returns a list of the converted messages.
+    """
+    from .vpp_serializer import types
+
+    result = []
+    append = result.append
+    cls = convert = None
+    for m in msgs:
+        if type(m) is not cls:
+            cls = type(m)
+            t = types.get(cls.__name__)
+            convert = type_converter(t, mode) if t is not None else None
+        append(convert(m) if convert is not None else m)
+    return result
+
+
+def clear_caches():
+    """Drop interned values and converters, e.g. after loading new types."""
+    _mode_tables.clear()
+    _converters.clear()
@@ -0,0 +1,303 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Per-message latency and traffic instrumentation for VPPApiClient.
+
+    inst = Instrumentation()
+    vpp = VPPApiClient(..., instrumentation=inst)
+    ...
+    inst.to_dict()["show_version"]["latency"]["wait"]["p99"]
+    print(inst.prometheus())
+
+Each API call is timed in four phases: pack (encoding the request),
+write (sending it), wait (until each reply is read from the transport)
+and decode (decoding the replies), plus the total. Latencies are kept in
+log-linear (HDR style) histograms in nanoseconds, with a relative error
+below 1 / 2**(precision - 1).
+
+span_hook, if set, is called with the message name when a call starts
+and must return a context manager, e.g. an OpenTelemetry tracer's
+start_as_current_span. It is exited when the call ends. If the object
+it returns has set_attribute(), the byte counts and phases are set on it.
+
+The Prometheus histograms have the fixed bucket bounds 'buckets', in
+seconds, so that every scrape has the same series. A value is counted
+in the first bound above its histogram bucket.
+
+Without an Instrumentation the client does no timing at all.
+"""
+
+import threading
+import time
+
+PHASES = ("pack", "write", "wait", "decode", "total")
+
+# Seconds, 10us to 10s
+PROMETHEUS_BUCKETS = tuple(
+    float(b) for b in """1e-5 2e-5 5e-5 1e-4 2e-4 5e-4 1e-3 2e-3 5e-3
+    0.01 0.02 0.05 0.1 0.2 0.5 1 2 5 10""".split()
+)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of non-negative integer values.
+
+    Values below 2**precision get their own bucket; above that each
+    power of two is split into 2**(precision - 1) buckets.
+    """
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self.half = 1 << (precision - 1)
+        self.counts = {}
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, v):
+        e = v.bit_length() - self.precision
+        if e <= 0:
+            return v
+        return (e << (self.precision - 1)) + (v >> e)
+
+    def lower(self, i):
+        """Smallest value of bucket i."""
+        if i < 2 * self.half:
+            return i
+        e = i // self.half - 1
+        return (i - e * self.half) << e
+
+    def upper(self, i):
+        """Smallest value of the bucket after i."""
+        return self.lower(i + 1)
+
+    def record(self, v):
+        i = self.index(v)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.sum += v
+        if self.min is None or v < self.min:
+            self.min = v
+        if v > self.max:
+            self.max = v
+
+    def percentile(self, q):
+        """Value at or below which q percent of the values are."""
+        if not self.count:
+            return 0
+        rank = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self.upper(i) - 1, self.max)
+        return self.max
+
+    def buckets(self):
+        """[(upper bound, cumulative count)] of the non-empty buckets."""
+        seen = 0
+        result = []
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            result.append((self.upper(i), seen))
+        return result
+
+    def cumulative(self, bounds):
+        """Counts of the values at or below each of the sorted bounds, a
+        bucket being counted under the first bound at or above its
+        largest value."""
+        result = []
+        seen = 0
+        counts = sorted(self.counts.items())
+        j = 0
+        for bound in bounds:
+            while j < len(counts) and self.upper(counts[j][0]) - 1 <= bound:
+                seen += counts[j][1]
+                j += 1
+            result.append(seen)
+        return result
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min or 0,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else 0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+class MessageStats:
+    """Counters and phase histograms of one API message."""
+
+    def __init__(self, precision):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.replies = 0
+        self.latency = {p: LatencyHistogram(precision) for p in PHASES}
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "replies": self.replies,
+            "latency": {p: h.to_dict() for p, h in self.latency.items()},
+        }
+
+
+class CallRecord:
+    """Timing of one call in progress, see Instrumentation.start()."""
+
+    __slots__ = (
+        "inst",
+        "name",
+        "start",
+        "pack",
+        "write",
+        "wait",
+        "decode",
+        "bytes_out",
+        "bytes_in",
+        "replies",
+        "span",
+    )
+
+    def __init__(self, inst, name, start, pack, write, bytes_out, span):
+        self.inst = inst
+        self.name = name
+        self.start = start
+        self.pack = pack
+        self.write = write
+        self.wait = 0
+        self.decode = 0
+        self.bytes_out = bytes_out
+        self.bytes_in = 0
+        self.replies = 0
+        self.span = span
+
+    def reply(self, size, wait, decode):
+        self.bytes_in += size
+        self.replies += 1
+        self.wait += wait
+        self.decode += decode
+
+    def end(self, exc=None):
+        self.inst.finish(self, exc)
+
+
+class Instrumentation:
+    """Collects per-message call statistics, shareable between clients."""
+
+    def __init__(self, span_hook=None, precision=5, buckets=PROMETHEUS_BUCKETS):
+        self.span_hook = span_hook
+        self.precision = precision
+        self.buckets = sorted(buckets)
+        self.messages = {}
+        self.lock = threading.Lock()
+
+    def start(self, name, start, pack, write, bytes_out):
+        """Record a sent call: start time, pack and write durations (ns)."""
+        span = None
+        if self.span_hook is not None:
+            span = self.span_hook(name)
+            span.__enter__()
+        return CallRecord(self, name, start, pack, write, bytes_out, span)
+
+    def finish(self, rec, exc=None):
+        total = time.perf_counter_ns() - rec.start
+        with self.lock:
+            s = self.messages.get(rec.name)
+            if s is None:
+                s = self.messages[rec.name] = MessageStats(self.precision)
+            s.calls += 1
+            if exc is not None:
+                s.errors += 1
+            s.bytes_out += rec.bytes_out
+            s.bytes_in += rec.bytes_in
+            s.replies += rec.replies
+            latency = s.latency
+            latency["pack"].record(rec.pack)
+            latency["write"].record(rec.write)
+            latency["wait"].record(rec.wait)
+            latency["decode"].record(rec.decode)
+            latency["total"].record(total)
+        span = rec.span
+        if span is not None:
+            set_attribute = getattr(span, "set_attribute", None)
+            if set_attribute is not None:
+                set_attribute("vpp.bytes_out", rec.bytes_out)
+                set_attribute("vpp.bytes_in", rec.bytes_in)
+                set_attribute("vpp.replies", rec.replies)
+                for p in PHASES[:-1]:
+                    set_attribute("vpp.%s_ns" % p, getattr(rec, p))
+            if exc is None:
+                span.__exit__(None, None, None)
+            else:
+                span.__exit__(type(exc), exc, exc.__traceback__)
+
+    def reset(self):
+        with self.lock:
+            self.messages = {}
+
+    def to_dict(self):
+        """{message: {calls, errors, bytes_out, bytes_in, replies,
+        latency: {phase: {count, sum, min, max, mean, p50, p90, p99}}}},
+        latencies in nanoseconds."""
+        with self.lock:
+            return {n: s.to_dict() for n, s in self.messages.items()}
+
+    def prometheus(self, prefix="vpp_papi"):
+        """Statistics in the Prometheus text exposition format."""
+        lines = []
+
+        def counter(name, help, attr):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s_%s counter" % (prefix, name))
+            for n, s in messages:
+                lines.append(
+                    '%s_%s{message="%s"} %d' % (prefix, name, n, getattr(s, attr))
+                )
+
+        with self.lock:
+            messages = sorted(self.messages.items())
+            counter("calls_total", "API calls.", "calls")
+            counter("errors_total", "API calls that failed.", "errors")
+            counter("bytes_out_total", "Bytes of requests sent.", "bytes_out")
+            counter("bytes_in_total", "Bytes of replies received.", "bytes_in")
+            name = "%s_call_duration_seconds" % prefix
+            lines.append("# HELP %s API call latency by phase." % name)
+            lines.append("# TYPE %s histogram" % name)
+            bounds = [int(round(b * 1e9)) for b in self.buckets]
+            le = ["%.9g" % b for b in self.buckets]
+            for n, s in messages:
+                for p, h in s.latency.items():
+                    labels = 'message="%s",phase="%s"' % (n, p)
+                    for bound, count in zip(le, h.cumulative(bounds)):
+                        lines.append(
+                            '%s_bucket{%s,le="%s"} %d' % (name, labels, bound, count)
+                        )
+                    lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, h.count))
+                    lines.append("%s_sum{%s} %.9f" % (name, labels, h.sum / 1e9))
+                    lines.append("%s_count{%s} %d" % (name, labels, h.count))
+        return "\n".join(lines) + "\n"
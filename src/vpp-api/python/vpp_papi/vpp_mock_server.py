@@ -0,0 +1,345 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Loopback mock of the VPP binary API socket, for testing and
+benchmarking clients without VPP.
+
+The server speaks the framing of vpp_transport_socket, answers
+sockclnt_create with a message table built from the loaded API
+definitions and replies to every request: with retval 0 by default,
+with canned fields or details, or with whatever a handler returns.
+A request it cannot answer, with an unknown message id or whose
+handler fails, closes the connection, so the client fails at once
+instead of waiting for its read timeout.
+
+    with MockVppServer(apidir="/usr/share/vpp/api") as server:
+        server.set_reply("show_version", version="24.10-mock")
+        server.set_details("sw_interface_dump", [{"sw_if_index": 0}])
+        vpp = VPPApiClient(apidir=..., server_address=server.server_address)
+        vpp.connect("test")
+        vpp.api.show_version()
+        server.send_event("sw_interface_event", sw_if_index=1, flags=1)
+
+Each client connection is served by its own thread, one request at a
+time like VPP's main thread, after waiting latency seconds (or the
+latency set for the message with set_latency()).
+"""
+
+import collections
+import itertools
+import json
+import logging
+import os
+import select
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+import pkg_resources
+
+from .vpp_papi import VPPApiJSONFiles
+from .vpp_transport_socket import RecvBuffer, Wakeup
+
+logger = logging.getLogger("vpp_papi.mock_server")
+logger.addHandler(logging.NullHandler())
+
+_msg_id = struct.Struct(">H")
+
+
+def memclnt_definitions():
+    """(messages, services, names) of the memclnt API shipped with
+    vpp_papi, names in message id order."""
+    memclnt = pkg_resources.resource_string(
+        "vpp_papi", "/".join(("data", "memclnt.api.json"))
+    )
+    messages, services = VPPApiJSONFiles.process_json_str(memclnt)
+    names = [m[0] for m in json.loads(memclnt)["messages"]]
+    return messages, services, names
+
+
+class _Client:
+    """Server side of one client connection."""
+
+    def __init__(self, conn, index):
+        self.conn = conn
+        self.index = index
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def send(self, data):
+        with self.lock:
+            self.conn.sendall(data)
+
+    def close(self):
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class MockVppServer:
+    """Mock VPP API server on a UNIX socket.
+
+    The API definitions are loaded from apifiles or apidir, or given
+    as a (messages, services) pair in definitions. The memclnt API is
+    always included, and its messages get the same ids as in VPP.
+    server_address defaults to a socket in a temporary directory.
+
+    Scripting:
+
+    - set_reply(name, **fields): fields of the reply to request name.
+    - set_details(name, details): list of details fields for a dump.
+    - set_handler(name, handler): handler(request, client_index)
+      returns the messages to send, as a list of (name, fields).
+    - set_latency(name, seconds): reply delay for one message.
+    - send_event(name, **fields): send an event to every client.
+    - disconnect_clients(): drop all connections.
+
+    Decoded requests are counted per message in counts, and the last
+    ones are kept in requests.
+    """
+
+    def __init__(
+        self,
+        server_address=None,
+        apifiles=None,
+        apidir=None,
+        definitions=None,
+        latency=0,
+        history=1000,
+    ):
+        self.messages, self.services, names = memclnt_definitions()
+        if definitions is None:
+            _, messages, services = VPPApiJSONFiles.load_api(apifiles, apidir)
+        else:
+            messages, services = definitions
+        self.messages.update(messages)
+        self.services.update(services)
+
+        # memclnt first, in API order, as VPP numbers them
+        names += sorted(set(self.messages) - set(names))
+        self.ids = {name: i for i, name in enumerate(names, 1)}
+        self.names = {i: name for name, i in self.ids.items()}
+        self.message_table = [
+            {"index": i, "name": name + "_" + self.messages[name].crc[2:]}
+            for name, i in self.ids.items()
+        ]
+
+        self._tmpdir = None
+        if server_address is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="vpp-mock-")
+            server_address = os.path.join(self._tmpdir, "api.sock")
+        self.server_address = server_address
+        self.latency = latency
+        self.latencies = {}
+        self.replies = {}
+        self.details = {}
+        self.handlers = {
+            "sockclnt_create": self._sockclnt_create,
+            "sockclnt_delete": self._sockclnt_delete,
+            "control_ping": self._control_ping,
+        }
+        self.counts = collections.Counter()
+        self.requests = collections.deque(maxlen=history)
+        self.clients = {}
+        self._index = itertools.count(1)
+        self._lock = threading.Lock()
+        self._header = struct.Struct(">QII")
+        self._sock = None
+        self._wakeup = None
+        self._thread = None
+
+    # Scripting
+
+    def set_reply(self, name, **fields):
+        """Reply to request name with fields (besides context)."""
+        self.replies[name] = fields
+
+    def set_details(self, name, details):
+        """Answer dump name with a list of details fields."""
+        self.details[name] = list(details)
+
+    def set_handler(self, name, handler):
+        """Answer request name with handler(request, client_index),
+        a list of (message name, fields). Context is filled in."""
+        self.handlers[name] = handler
+
+    def set_latency(self, name, seconds):
+        self.latencies[name] = seconds
+
+    def pack(self, name, **fields):
+        """Pack message name, framed for the socket."""
+        msg = self.messages[name]
+        fields.setdefault("_vl_msg_id", self.ids[name])
+        b = msg.pack(fields)
+        return self._header.pack(0, len(b), 0) + b
+
+    def send_event(self, name, **fields):
+        """Send event name to every connected client."""
+        with self._lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            b = self.pack(name, **dict(fields, client_index=client.index))
+            try:
+                client.send(b)
+            except OSError:
+                pass
+
+    def disconnect_clients(self):
+        """Close all client connections, as if VPP had restarted."""
+        with self._lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            client.close()
+        for client in clients:
+            client.thread.join()
+
+    # Built-in handlers
+
+    def _sockclnt_create(self, request, client_index):
+        return [
+            (
+                "sockclnt_create_reply",
+                {
+                    "index": client_index,
+                    "count": len(self.message_table),
+                    "message_table": self.message_table,
+                },
+            )
+        ]
+
+    def _sockclnt_delete(self, request, client_index):
+        return [("sockclnt_delete_reply", {})]
+
+    def _control_ping(self, request, client_index):
+        return [("control_ping_reply", {"client_index": client_index})]
+
+    def _default(self, name, request):
+        service = self.services.get(name, {})
+        reply = service.get("reply")
+        if reply not in self.messages:
+            return []
+        msgs = []
+        if "stream" in service:
+            stream_msg = service.get("stream_msg", reply)
+            msgs += [(stream_msg, f) for f in self.details.get(name, [])]
+            if "stream_msg" not in service:
+                # Old style dump, the client's control ping ends it
+                return msgs
+        msgs.append((reply, self.replies.get(name, {})))
+        return msgs
+
+    def handle(self, buf, client_index):
+        """Return the framed replies to request buf. Raises ValueError
+        for an unknown message id."""
+        (i,) = _msg_id.unpack_from(buf)
+        name = self.names.get(i)
+        if name is None:
+            raise ValueError("Unknown message id {}".format(i))
+        request, _ = self.messages[name].unpack(buf)
+        self.counts[name] += 1
+        self.requests.append(request)
+        handler = self.handlers.get(name)
+        if handler is None:
+            msgs = self._default(name, request)
+        else:
+            msgs = handler(request, client_index)
+        context = getattr(request, "context", 0)
+        out = b"".join(
+            self.pack(n, **dict({"context": context}, **fields)) for n, fields in msgs
+        )
+        return out, name
+
+    # Server
+
+    def _serve(self, client):
+        rxbuf = RecvBuffer(self._header)
+        try:
+            while True:
+                msgs = rxbuf.recv(client.conn)
+                if not msgs:
+                    if msgs is None:
+                        break
+                    continue
+                for msg in msgs:
+                    try:
+                        out, name = self.handle(bytes(msg), client.index)
+                    except Exception:
+                        logger.exception(
+                            "Failed to answer request, closing client %d",
+                            client.index,
+                        )
+                        return
+                    delay = self.latencies.get(name, self.latency)
+                    if delay:
+                        time.sleep(delay)
+                    if out:
+                        client.send(out)
+                    if name == "sockclnt_delete":
+                        return
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.clients.pop(client.index, None)
+            client.conn.close()
+
+    def _accept(self):
+        while True:
+            rlist, _, _ = select.select([self._sock, self._wakeup], [], [])
+            if self._wakeup in rlist:
+                return
+            conn, _ = self._sock.accept()
+            client = _Client(conn, next(self._index))
+            client.thread = threading.Thread(target=self._serve, args=(client,))
+            client.thread.daemon = True
+            with self._lock:
+                self.clients[client.index] = client
+            client.thread.start()
+
+    def start(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.server_address)
+        self._sock.listen(64)
+        self._wakeup = Wakeup()
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._wakeup.put(True)
+        self._thread.join()
+        self.disconnect_clients()
+        self._sock.close()
+        self._wakeup.close()
+        self._thread = None
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        self.stop()
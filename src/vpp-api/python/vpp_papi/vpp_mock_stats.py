@@ -0,0 +1,273 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Synthetic VPP statistics segment, for testing and benchmarking
+VPPStats without VPP.
+
+MockStatsSegment lays out a version 2 stats segment in a memfd, the
+way VPP does: the shared header, the directory vector and per-thread
+counter vectors, with pointers relative to a base address. It is
+handed to VPPStats over a socket like VPP's stats.sock:
+
+    seg = MockStatsSegment()
+    seg.add_combined("/if/rx", threads=2, n=4)
+    seg.set_combined("/if/rx", 1, 3, 10, 1000)
+    seg.add_symlink("/interfaces/eth0/rx", "/if/rx", 3)
+    stats = seg.client()        # connected VPPStats
+    stats["/if/rx"][:, 3].sum_packets()
+
+Directory changes (adding, resizing or removing counters) are made
+under the segment lock: in_progress is set while the segment is
+updated and the epoch is bumped at the end, as VPP does.
+"""
+
+import contextlib
+import mmap
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+
+from .vpp_stats import VPPStats
+
+STAT_DIR_TYPE_EMPTY = 0
+STAT_DIR_TYPE_SCALAR_INDEX = 1
+STAT_DIR_TYPE_COUNTER_VECTOR_SIMPLE = 2
+STAT_DIR_TYPE_COUNTER_VECTOR_COMBINED = 3
+STAT_DIR_TYPE_NAME_VECTOR = 4
+STAT_DIR_TYPE_SYMLINK = 6
+
+_entry = struct.Struct(VPPStats.elementfmt)
+_u32 = struct.Struct("I")
+_u64 = struct.Struct("Q")
+_ptr = struct.Struct("P")
+_symlink = struct.Struct("II")
+
+
+class MockStatsSegment:
+    """A writable stats segment of size bytes.
+
+    Memory is handed out by a bump allocator and never reused, so the
+    segment has to be sized for the counters and their resizes.
+    """
+
+    def __init__(self, size=1 << 26, base=0x7F0000000000, directory=64):
+        self.size = size
+        self.base = base
+        self.fd = os.memfd_create("vpp-mock-stats")
+        os.ftruncate(self.fd, size)
+        self.buf = mmap.mmap(self.fd, size)
+        self._top = VPPStats.shared_headerfmt.size
+        self.epoch = 0
+        self.entries = []  # directory index -> name or None
+        self.index = {}  # name -> directory index
+        self.threads = {}  # name -> [counter vector offsets]
+        self._dir = self._vector(_entry.size * directory, 0)
+        self._dir_capacity = directory
+        self._header(in_progress=0)
+        self._server = None
+
+    def _header(self, in_progress):
+        VPPStats.shared_headerfmt.pack_into(
+            self.buf, 0, 2, self.base, self.epoch, in_progress, self._ptr(self._dir), 0
+        )
+
+    def _ptr(self, offset):
+        return self.base + offset
+
+    def _vector(self, nbytes, length):
+        """Allocate a VPP vector, return the offset of its data."""
+        offset = (self._top + 16 + 15) & ~15
+        if offset + nbytes + 64 > self.size:
+            raise ValueError("Stats segment full")
+        self._top = offset + nbytes
+        _u32.pack_into(self.buf, offset - 8, length)
+        return offset
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Update the segment: in_progress while held, new epoch after."""
+        self._header(in_progress=1)
+        try:
+            yield self
+        finally:
+            self.epoch += 1
+            self._header(in_progress=0)
+
+    def _set_entry(self, i, stattype, value, name):
+        _entry.pack_into(
+            self.buf, self._dir + i * _entry.size, stattype, value, name.encode("ascii")
+        )
+
+    def _add(self, name, stattype, value):
+        if name in self.index:
+            raise KeyError("Counter {} exists".format(name))
+        if None in self.entries:
+            i = self.entries.index(None)
+        else:
+            i = len(self.entries)
+            if i == self._dir_capacity:
+                capacity = 2 * self._dir_capacity
+                d = self._vector(_entry.size * capacity, i)
+                self.buf[d : d + _entry.size * i] = self.buf[
+                    self._dir : self._dir + _entry.size * i
+                ]
+                self._dir = d
+                self._dir_capacity = capacity
+            self.entries.append(None)
+            _u32.pack_into(self.buf, self._dir - 8, len(self.entries))
+        self.entries[i] = name
+        self.index[name] = i
+        self._set_entry(i, stattype, value, name)
+        return i
+
+    def _counters(self, threads, n, width, old=None):
+        """Allocate per-thread vectors of n counters of width u64s,
+        copying the values of the old vectors. Return the offset of the
+        thread vector and the counter vector offsets."""
+        vectors = []
+        for t in range(threads):
+            v = self._vector(8 * width * n, n)
+            if old is not None and t < len(old):
+                o, k = old[t]
+                k = min(k, n)
+                self.buf[v : v + 8 * width * k] = self.buf[o : o + 8 * width * k]
+            vectors.append((v, n))
+        tv = self._vector(_ptr.size * threads, threads)
+        for t, (v, _) in enumerate(vectors):
+            _ptr.pack_into(self.buf, tv + t * _ptr.size, self._ptr(v))
+        return tv, vectors
+
+    def add_scalar(self, name, value=0):
+        with self.lock():
+            return self._add(name, STAT_DIR_TYPE_SCALAR_INDEX, value)
+
+    def set_scalar(self, name, value):
+        self._set_entry(self.index[name], STAT_DIR_TYPE_SCALAR_INDEX, value, name)
+
+    def add_simple(self, name, threads, n):
+        with self.lock():
+            tv, self.threads[name] = self._counters(threads, n, 1)
+            return self._add(name, STAT_DIR_TYPE_COUNTER_VECTOR_SIMPLE, self._ptr(tv))
+
+    def add_combined(self, name, threads, n):
+        with self.lock():
+            tv, self.threads[name] = self._counters(threads, n, 2)
+            return self._add(name, STAT_DIR_TYPE_COUNTER_VECTOR_COMBINED, self._ptr(tv))
+
+    def resize(self, name, n, threads=None):
+        """Grow or shrink a counter to n entries (new interfaces)."""
+        i = self.index[name]
+        stattype = _entry.unpack_from(self.buf, self._dir + i * _entry.size)[0]
+        width = 1 if stattype == STAT_DIR_TYPE_COUNTER_VECTOR_SIMPLE else 2
+        old = self.threads[name]
+        with self.lock():
+            tv, self.threads[name] = self._counters(threads or len(old), n, width, old)
+            self._set_entry(i, stattype, self._ptr(tv), name)
+
+    def counters(self, name, thread):
+        """The counter vector of a thread as a writable memoryview of
+        u64, packets and bytes interleaved for combined counters."""
+        offset, n = self.threads[name][thread]
+        width = 1 if self._type(name) == STAT_DIR_TYPE_COUNTER_VECTOR_SIMPLE else 2
+        return memoryview(self.buf)[offset : offset + 8 * width * n].cast("Q")
+
+    def _type(self, name):
+        return _entry.unpack_from(self.buf, self._dir + self.index[name] * _entry.size)[
+            0
+        ]
+
+    def set_simple(self, name, thread, index, value):
+        offset, _ = self.threads[name][thread]
+        _u64.pack_into(self.buf, offset + 8 * index, value)
+
+    def set_combined(self, name, thread, index, packets, octets):
+        offset, _ = self.threads[name][thread]
+        struct.pack_into("QQ", self.buf, offset + 16 * index, packets, octets)
+
+    def add_name(self, name, strings):
+        with self.lock():
+            v = self._vector(_ptr.size * len(strings), len(strings))
+            for i, s in enumerate(strings):
+                b = s.encode("ascii") + b"\x00"
+                o = self._vector(len(b), len(b))
+                self.buf[o : o + len(b)] = b
+                _ptr.pack_into(self.buf, v + i * _ptr.size, self._ptr(o))
+            return self._add(name, STAT_DIR_TYPE_NAME_VECTOR, self._ptr(v))
+
+    def add_symlink(self, name, target, index):
+        value = _u64.unpack(_symlink.pack(self.index[target], index))[0]
+        with self.lock():
+            return self._add(name, STAT_DIR_TYPE_SYMLINK, value)
+
+    def remove(self, name):
+        """Remove a counter, its directory slot is reused."""
+        with self.lock():
+            i = self.index.pop(name)
+            self.entries[i] = None
+            self.threads.pop(name, None)
+            self._set_entry(i, STAT_DIR_TYPE_EMPTY, 0, "")
+
+    # Serving the segment to VPPStats
+
+    def _serve(self, sock):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            socket.send_fds(conn, [b"\x00"], [self.fd])
+            conn.close()
+
+    def serve(self, socketname=None):
+        """Hand the segment to clients connecting to socketname, as
+        VPP's stats.sock does. Return the socket name."""
+        tmpdir = None
+        if socketname is None:
+            tmpdir = tempfile.mkdtemp(prefix="vpp-mock-stats-")
+            socketname = os.path.join(tmpdir, "stats.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        sock.bind(socketname)
+        sock.listen(8)
+        thread = threading.Thread(target=self._serve, args=(sock,), daemon=True)
+        thread.start()
+        self._server = (sock, thread, socketname, tmpdir)
+        return socketname
+
+    def client(self, **kwargs):
+        """Return a VPPStats connected to this segment."""
+        if self._server is None:
+            self.serve()
+        stats = VPPStats(socketname=self._server[2], **kwargs)
+        stats.connect()
+        return stats
+
+    def close(self):
+        if self._server is not None:
+            sock, thread, socketname, tmpdir = self._server
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+            thread.join()
+            os.unlink(socketname)
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            self._server = None
+        if self.buf is not None:
+            self.buf.close()
+            os.close(self.fd)
+            self.buf = None
@@ -21,6 +21,7 @@ import ipaddress
 import multiprocessing as mp
 import os
 import queue
+import struct
 import logging
 import functools
 import json
@@ -33,6 +34,7 @@ import pkg_resources
 from .vpp_format import verify_enum_hint
 from .vpp_serializer import VPPType, VPPEnumType, VPPEnumFlagType, VPPUnionType
 from .vpp_serializer import VPPMessage, vpp_get_type, VPPTypeAlias
+from .vpp_serializer import set_compiled_codecs
 
 try:
     import VppTransport
@@ -46,10 +48,17 @@ except ModuleNotFoundError:
     VppTransport = V
 
 from .vpp_transport_socket import VppTransport
+from .vpp_api_cache import ApiCache, MessageDefinitions
+from .vpp_table import MessageTable
 
 logger = logging.getLogger("vpp_papi")
 logger.addHandler(logging.NullHandler())
 
+# Message id at the start of every message
+_msg_id = struct.Struct(">H")
+# Message id and context at the start of replies
+_reply_header = struct.Struct(">HI")
+
 __all__ = (
     "FuncWrapper",
     "VppApiDynamicMethodHolder",
@@ -60,6 +69,7 @@ __all__ = (
     "VPPRuntimeError",
     "VPPValueError",
     "VPPApiClient",
+    "VPPApiBatch",
 )
 
 
@@ -116,7 +126,33 @@ def add_convenience_methods():
 
 
 class VppApiDynamicMethodHolder:
-    pass
+    """Holds the API methods of a client.
+
+    If resolve is given, methods are created on first attribute access
+    by calling resolve(name), which returns the method or None. names()
+    returns the names that can be resolved, for dir().
+    """
+
+    def __init__(self, resolve=None, names=None):
+        self._resolve = resolve
+        self._names = names
+
+    def __getattr__(self, name):
+        # Only called when name is not set yet
+        resolve = self.__dict__.get("_resolve")
+        if resolve is None or name.startswith("__"):
+            raise AttributeError(name)
+        f = resolve(name)
+        if f is None:
+            raise AttributeError(name)
+        setattr(self, name, f)
+        return f
+
+    def __dir__(self):
+        names = set(super().__dir__())
+        if self.__dict__.get("_names") is not None:
+            names.update(self._names())
+        return sorted(names)
 
 
 class FuncWrapper:
@@ -128,6 +164,10 @@ class FuncWrapper:
     def __call__(self, **kwargs):
         return self._func(**kwargs)
 
+    def iter(self, **kwargs):
+        """Streaming calls: return a generator of the details messages."""
+        return self._func(_stream=True, **kwargs)
+
     def __repr__(self):
         return "<FuncWrapper(func=<%s(%s)>)>" % (self.__name__, self.__doc__)
 
@@ -302,7 +342,13 @@ class VPPApiJSONFiles:
         return messages, services
 
     @staticmethod
-    def _process_json(api):  # -> Tuple[Dict, Dict]
+    def _process_json(api, record=None):  # -> Tuple[Dict, Dict]
+        """Create the types and messages of one API file.
+
+        If record is a dict, the resolved type definitions (in the order
+        they were created), the message definitions and the services are
+        stored in it for the API cache, see _process_record().
+        """
         types = {}
         services = {}
         messages = {}
@@ -343,6 +389,7 @@ class VPPApiJSONFiles:
         except KeyError:
             pass
 
+        resolved = []
         i = 0
         while True:
             unresolved = {}
@@ -352,27 +399,32 @@ class VPPApiJSONFiles:
                     if v["type"] == "enum":
                         try:
                             VPPEnumType(t[0], t[1:])
+                            resolved.append(["enum", k, t])
                         except ValueError:
                             unresolved[k] = v
                 if not vpp_get_type(k):
                     if v["type"] == "enumflag":
                         try:
                             VPPEnumFlagType(t[0], t[1:])
+                            resolved.append(["enumflag", k, t])
                         except ValueError:
                             unresolved[k] = v
                     elif v["type"] == "union":
                         try:
                             VPPUnionType(t[0], t[1:])
+                            resolved.append(["union", k, t])
                         except ValueError:
                             unresolved[k] = v
                     elif v["type"] == "type":
                         try:
                             VPPType(t[0], t[1:])
+                            resolved.append(["type", k, t])
                         except ValueError:
                             unresolved[k] = v
                     elif v["type"] == "alias":
                         try:
                             VPPTypeAlias(k, t)
+                            resolved.append(["alias", k, t])
                         except ValueError:
                             unresolved[k] = v
             if len(unresolved) == 0:
@@ -389,10 +441,44 @@ class VPPApiJSONFiles:
                     logger.error("Not implemented error for {}".format(m[0]))
         except KeyError:
             pass
+        if record is not None:
+            record["types"] = resolved
+            record["messages"] = [
+                m for m in api.get("messages", []) if m[0] in messages
+            ]
+            record["services"] = services
         return messages, services
 
+    _type_classes = {
+        "enum": VPPEnumType,
+        "enumflag": VPPEnumFlagType,
+        "union": VPPUnionType,
+        "type": VPPType,
+    }
+
+    @classmethod
+    def _process_record(cls, record, messages):
+        """Replay the types of a cached API file, in the order they were
+        resolved. Messages are added to the messages mapping unbuilt."""
+        for kind, k, t in record["types"]:
+            if vpp_get_type(k):
+                continue
+            if kind == "alias":
+                VPPTypeAlias(k, t)
+            else:
+                cls._type_classes[kind](t[0], t[1:])
+        for m in record["messages"]:
+            messages.define(m)
+        return record["services"]
+
     @staticmethod
-    def load_api(apifiles=None, apidir=None):
+    def load_api(apifiles=None, apidir=None, cache=None):
+        """Load the API definitions in apifiles, or found in apidir.
+
+        cache enables the on-disk cache of processed definitions (see
+        vpp_api_cache). It is the cache directory, or True for the
+        default one. On a cache hit, messages are built on first use.
+        """
         messages = {}
         services = {}
         if not apifiles:
@@ -407,15 +493,239 @@ class VPPApiJSONFiles:
             except (RuntimeError, VPPApiError):
                 raise VPPRuntimeError
 
+        if cache:
+            cache = ApiCache(None if cache is True else cache)
+            records = cache.load(apifiles)
+            if records is not None:
+                messages = MessageDefinitions()
+                for record in records:
+                    services.update(VPPApiJSONFiles._process_record(record, messages))
+                return apifiles, messages, services
+
+        records = []
         for file in apifiles:
             with open(file) as apidef_file:
-                m, s = VPPApiJSONFiles.process_json_file(apidef_file)
+                api = json.load(apidef_file)
+                record = {} if cache else None
+                m, s = VPPApiJSONFiles._process_json(api, record)
                 messages.update(m)
                 services.update(s)
+                records.append(record)
 
+        if cache:
+            cache.store(apifiles, records)
         return apifiles, messages, services
 
 
+class VPPApiBatch:
+    """Pipelined API calls.
+
+    Calls made through the batch are sent without waiting for their
+    replies, keeping up to 'window' requests in flight. Replies are
+    matched to requests by context. Each call returns its index in
+    'results', which is filled in as the replies arrive:
+
+        with vpp.batch(window=256) as b:
+            for route in routes:
+                b.ip_route_add_del(is_add=True, route=route)
+        for i, r in b.errors:
+            ...
+
+    A result is the reply message, (reply, details) / [details] for
+    streaming calls like _call_vpp returns, or the exception that
+    prevented the reply from being received.
+
+    With transports that provide a send buffer, requests are packed
+    into it and sent together before the batch waits for replies, or
+    once flush_bytes are queued.
+    """
+
+    class _Pending:
+        __slots__ = ("index", "reply", "stream_msg", "modern", "details")
+
+        def __init__(self, index, service):
+            self.index = index
+            self.reply = service["reply"]
+            self.details = None
+            self.stream_msg = None
+            self.modern = False
+            if "stream" in service:
+                self.details = []
+                if "stream_msg" in service:
+                    self.stream_msg = service["stream_msg"]
+                    self.modern = True
+                else:
+                    self.stream_msg = self.reply
+                    self.reply = "control_ping_reply"
+
+    def __init__(
+        self,
+        vpp,
+        window=256,
+        timeout=None,
+        no_type_conversion=False,
+        flush_bytes=65536,
+    ):
+        if window < 1:
+            raise VPPValueError("Batch window must be at least 1")
+        self.vpp = vpp
+        self.window = window
+        self.timeout = timeout
+        self.no_type_conversion = no_type_conversion
+        self.flush_bytes = flush_bytes
+        self.results = []
+        self.pending = {}
+        self._functions = {}
+        self._sendbuf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        if exc_type is None:
+            self.flush()
+        else:
+            # Calls already made are sent, as they are without buffering,
+            # and their replies drained so that they are not taken for
+            # events or for the replies of later calls. The exception of
+            # the block is the one raised.
+            try:
+                self.flush()
+            except VPPIOError:
+                pass
+
+    def __getattr__(self, name):
+        try:
+            return self._functions[name]
+        except KeyError:
+            pass
+        vpp = self.vpp
+        if name not in vpp.services or name not in vpp.messages:
+            raise AttributeError(name)
+        i = vpp._msg_index(name)
+        if i <= 0:
+            raise AttributeError(name)
+        msg = vpp.id_msgdef[i]
+        service = vpp.services[name]
+
+        def f(**kwargs):
+            return self._call(i, msg, service, kwargs)
+
+        f.__name__ = name
+        self._functions[name] = f
+        return f
+
+    def _call(self, i, msg, service, kwargs):
+        vpp = self.vpp
+        if "context" not in kwargs:
+            kwargs["context"] = vpp.get_context()
+        context = kwargs["context"]
+        if context in self.pending:
+            raise VPPValueError("Context {} already in flight".format(context))
+        kwargs["_vl_msg_id"] = i
+        try:
+            if vpp.transport.socket_index:
+                kwargs["client_index"] = vpp.transport.socket_index
+        except AttributeError:
+            pass
+        vpp.validate_args(msg, kwargs)
+        sendbuf = self._send_buffer()
+        if sendbuf is None:
+            b = msg.pack(kwargs)
+
+        if len(self.pending) >= self.window:
+            # With a send buffer, free half the window so that the
+            # requests after this one go out together.
+            low = self.window // 2 if sendbuf is not None else self.window - 1
+            while len(self.pending) > low:
+                self._read_reply()
+
+        pending = self._Pending(len(self.results), service)
+        ping = pending.stream_msg and not pending.modern
+        if sendbuf is None:
+            vpp.transport.write(b)
+            if ping:
+                # Ping after the request, its reply ends the stream.
+                vpp._control_ping(context)
+        else:
+            sendbuf.pack(msg, kwargs)
+            if ping:
+                sendbuf.pack(
+                    vpp.control_ping_msgdef,
+                    {
+                        "_vl_msg_id": vpp.control_ping_index,
+                        "context": context,
+                        "client_index": kwargs.get("client_index", 0),
+                    },
+                )
+        self.results.append(None)
+        self.pending[context] = pending
+        if sendbuf is not None and sendbuf.length >= self.flush_bytes:
+            self._send()
+        return pending.index
+
+    def _send_buffer(self):
+        if self._sendbuf is None:
+            new = getattr(self.vpp.transport, "send_buffer", None)
+            if new is None:
+                return None
+            self._sendbuf = new()
+        return self._sendbuf
+
+    def _send(self):
+        """Send the requests queued in the send buffer."""
+        if self._sendbuf is not None and self._sendbuf.count:
+            self.vpp.transport.write_buffer(self._sendbuf)
+
+    def _read_reply(self):
+        self._send()
+        r = self.vpp.read_blocking(self.no_type_conversion, self.timeout)
+        if r is None:
+            e = VPPIOError(2, "VPP API client: read failed")
+            for pending in self.pending.values():
+                self.results[pending.index] = e
+            self.pending.clear()
+            raise e
+        context = getattr(r, "context", 0)
+        pending = self.pending.get(context) if context else None
+        if pending is None:
+            # Not ours
+            self.vpp.message_queue.put_nowait(r)
+            return
+        msgname = type(r).__name__
+        if pending.details is None:
+            self.results[pending.index] = r
+        elif msgname == pending.reply:
+            if pending.modern:
+                self.results[pending.index] = r, pending.details
+            else:
+                self.results[pending.index] = pending.details
+        else:
+            pending.details.append(r)
+            return
+        del self.pending[context]
+
+    def flush(self):
+        """Wait for all outstanding replies and return the results."""
+        while self.pending:
+            self._read_reply()
+        return self.results
+
+    @property
+    def errors(self):
+        """List of (index, result) for failed calls."""
+        errors = []
+        for i, r in enumerate(self.results):
+            if isinstance(r, Exception):
+                errors.append((i, r))
+                continue
+            if type(r) is tuple:
+                r = r[0]
+            if getattr(r, "retval", 0) != 0:
+                errors.append((i, r))
+        return errors
+
+
 class VPPApiClient:
     """VPP interface.
 
@@ -447,7 +757,14 @@ class VPPApiClient:
         read_timeout=5,
         use_socket=True,
         server_address="/run/vpp/api.sock",
+        transport=None,
         bootstrapapi=False,
+        compiled_codecs=False,
+        typed_arrays=False,
+        lazy_decode=False,
+        api_cache=None,
+        definitions=None,
+        instrumentation=None,
     ):
         """Create a VPP API object.
 
@@ -457,9 +774,40 @@ class VPPApiClient:
         provided this will load the API files from VPP's
         default install location.
 
+        transport selects how to talk to VPP: "socket" (the default)
+        connects to the API socket at server_address, "shmem" attaches
+        to the API shared memory segment through libvppapiclient (see
+        vpp_transport_shmem). use_socket is ignored.
+
         logger, if supplied, is the logging logger object to log to.
         loglevel, if supplied, is the log level this logger is set
         to report at (from the loglevels in the logging module).
+
+        compiled_codecs, if true, switches message packing and unpacking
+        to generated per-message codecs (see vpp_codec). Type definitions
+        are shared, so this applies to every client in the process.
+
+        typed_arrays, if true, decodes numeric arrays in replies
+        (u16/u32/u64/i*/f64 VLAs and fixed lists) as typed buffers instead
+        of lists. With NumPy installed these are read-only big-endian
+        ndarray views into the receive buffer, otherwise array.array copies.
+
+        lazy_decode, if true, returns replies as LazyMessage objects that
+        keep the raw message and decode fields on first access. It can
+        also be set per call with the _lazy keyword argument.
+
+        api_cache, if set, is the directory of the on-disk cache of
+        processed API definitions (True for ~/.cache/vpp_papi), which
+        speeds up loading the API files (see vpp_api_cache).
+
+        definitions, if given, is a (messages, services) pair to use
+        instead of loading API files, e.g. another client's
+        (client.messages, client.services). The definitions are shared.
+
+        instrumentation, if set, is a vpp_instrument.Instrumentation that
+        records per-message latency histograms (pack, write, wait and
+        decode phases) and bytes in and out of each call. It can also
+        be set or cleared later through the instrumentation attribute.
         """
         if logger is None:
             logger = logging.getLogger(
@@ -473,6 +821,7 @@ class VPPApiClient:
         self.services = {}
         self.id_names = []
         self.id_msgdef = []
+        self.id_context = []
         self.header = VPPType("header", [["u16", "msgid"], ["u32", "client_index"]])
         self.apifiles = []
         self.apidir = apidir
@@ -486,14 +835,21 @@ class VPPApiClient:
         self._apifiles = apifiles
         self.stats = {}
         self.bootstrapapi = bootstrapapi
-
-        if not bootstrapapi:
+        if compiled_codecs:
+            set_compiled_codecs(True)
+        self.typed_arrays = typed_arrays
+        self.lazy_decode = lazy_decode
+        self.instrumentation = instrumentation
+
+        if definitions is not None:
+            self.messages, self.services = definitions
+        elif not bootstrapapi:
             if self.apidir is None and hasattr(self.__class__, "apidir"):
                 # Keep supporting the old style of providing apidir.
                 self.apidir = self.__class__.apidir
             try:
                 self.apifiles, self.messages, self.services = VPPApiJSONFiles.load_api(
-                    apifiles, self.apidir
+                    apifiles, self.apidir, cache=api_cache
                 )
             except VPPRuntimeError as e:
                 if testmode:
@@ -517,7 +873,13 @@ class VPPApiClient:
                     "Invalid address family hints. " "Cannot continue."
                 )
 
-        self.transport = VppTransport(
+        if transport in (None, "socket"):
+            transport_class = VppTransport
+        elif transport == "shmem":
+            from .vpp_transport_shmem import VppTransport as transport_class
+        else:
+            raise VPPValueError("Unknown transport {!r}".format(transport))
+        self.transport = transport_class(
             self, read_timeout=read_timeout, server_address=server_address
         )
         # Make sure we allow VPP to clean up the message rings.
@@ -579,24 +941,70 @@ class VPPApiClient:
         return f
 
     def _register_functions(self, do_async=False):
+        """Set up the API methods and message id lookup for a connection.
+
+        Nothing is created per message here: API methods are made on
+        first access by _resolve_function() and id_msgdef / id_names are
+        filled in by _resolve_id() when a message id is first seen.
+        """
         self.id_names = [None] * (self.vpp_dictionary_maxid + 1)
         self.id_msgdef = [None] * (self.vpp_dictionary_maxid + 1)
-        self._api = VppApiDynamicMethodHolder()
-        for name, msg in self.messages.items():
-            n = name + "_" + msg.crc[2:]
-            i = self.transport.get_msg_index(n)
-            if i > 0:
-                self.id_msgdef[i] = msg
-                self.id_names[i] = name
-
-                # Create function for client side messages.
-                if name in self.services:
-                    f = self.make_function(msg, i, self.services[name], do_async)
-                    f_pack = self.make_pack_function(msg, i, self.services[name])
-                    setattr(self._api, name, FuncWrapper(f))
-                    setattr(self._api, name + "_pack", FuncWrapper(f_pack))
-            else:
-                self.logger.debug("No such message type or failed CRC checksum: %s", n)
+        self.id_context = [None] * (self.vpp_dictionary_maxid + 1)
+        self._id_table = None
+        self._do_async = do_async
+        self._api = VppApiDynamicMethodHolder(
+            self._resolve_function, self._function_names
+        )
+
+    def _msg_index(self, name):
+        """Message id of name, registering it in id_msgdef, or 0."""
+        msg = self.messages.get(name)
+        if msg is None:
+            return 0
+        n = name + "_" + msg.crc[2:]
+        i = self.transport.get_msg_index(n)
+        if i > 0:
+            self.id_msgdef[i] = msg
+            self.id_names[i] = name
+        else:
+            self.logger.debug("No such message type or failed CRC checksum: %s", n)
+        return i
+
+    def _resolve_id(self, i):
+        """Look up the definition of message id i in the message table."""
+        if self._id_table is None:
+            self._id_table = {v: k for k, v in self.transport.message_table.items()}
+        n = self._id_table.get(i)
+        if n is None:
+            return None
+        name, _, crc = n.rpartition("_")
+        msg = self.messages.get(name)
+        if msg is None or msg.crc[2:] != crc:
+            return None
+        self.id_msgdef[i] = msg
+        self.id_names[i] = name
+        return msg
+
+    def _resolve_function(self, name):
+        pack = False
+        if name not in self.services and name.endswith("_pack"):
+            name = name[:-5]
+            pack = True
+        if name not in self.services:
+            return None
+        i = self._msg_index(name)
+        if i <= 0:
+            return None
+        msg = self.id_msgdef[i]
+        if pack:
+            return FuncWrapper(self.make_pack_function(msg, i, self.services[name]))
+        return FuncWrapper(
+            self.make_function(msg, i, self.services[name], self._do_async)
+        )
+
+    def _function_names(self):
+        names = [n for n in self.services if n in self.messages]
+        return names + [n + "_pack" for n in names]
 
     def get_api_definitions(self):
         """get_api_definition. Bootstrap from the embedded memclnt.api.json file."""
@@ -627,10 +1035,7 @@ class VPPApiClient:
         self._register_functions(do_async=do_async)
 
         # Initialise control ping
-        crc = self.messages["control_ping"].crc
-        self.control_ping_index = self.transport.get_msg_index(
-            ("control_ping" + "_" + crc[2:])
-        )
+        self.control_ping_index = self._msg_index("control_ping")
         self.control_ping_msgdef = self.messages["control_ping"]
 
         if self.async_thread:
@@ -695,44 +1100,52 @@ class VPPApiClient:
             raise VPPIOError(2, "RPC reply message received in event handler")
 
     def has_context(self, msg):
+        """True if msg is a reply, False if it is an event.
+
+        Called by the transport for every received message, so the
+        answer is cached per message id in id_context.
+        """
         if len(msg) < 10:
             return False
+        (i,) = _msg_id.unpack_from(msg)
+        c = self.id_context[i]
+        if c is None:
+            msgobj = self.id_msgdef[i] or self._resolve_id(i)
+            c = (
+                msgobj is not None
+                and "context" in msgobj.field_by_name
+                and self.id_names[i] != "rx_thread_exit"
+            )
+            self.id_context[i] = c
+        return c
 
-        header = VPPType(
-            "header_with_context",
-            [["u16", "msgid"], ["u32", "client_index"], ["u32", "context"]],
-        )
-
-        (i, ci, context), size = header.unpack(msg, 0)
-
-        if self.id_names[i] == "rx_thread_exit":
-            return
-
-        #
-        # Decode message and returns a tuple.
-        #
-        msgobj = self.id_msgdef[i]
-        if "context" in msgobj.field_by_name and context >= 0:
-            return True
-        return False
-
-    def decode_incoming_msg(self, msg, no_type_conversion=False):
+    def decode_incoming_msg(self, msg, no_type_conversion=False, lazy=None):
         if not msg:
             logger.warning("vpp_api.read failed")
             return
 
-        (i, ci), size = self.header.unpack(msg, 0)
+        (i,) = _msg_id.unpack_from(msg)
+        msgobj = self.id_msgdef[i] or self._resolve_id(i)
         if self.id_names[i] == "rx_thread_exit":
             return
 
         #
         # Decode message and returns a tuple.
         #
-        msgobj = self.id_msgdef[i]
         if not msgobj:
             raise VPPIOError(2, "Reply message undefined")
 
-        r, size = msgobj.unpack(msg, ntc=no_type_conversion)
+        if lazy is None:
+            lazy = self.lazy_decode
+        if (lazy or self.typed_arrays) and type(msg) is memoryview:
+            # The result refers to msg, which must not keep a transport
+            # receive buffer alive.
+            msg = bytes(msg)
+        if lazy:
+            return msgobj.unpack_lazy(
+                msg, ntc=no_type_conversion, arrays=self.typed_arrays
+            )
+        r, size = msgobj.unpack(msg, ntc=no_type_conversion, arrays=self.typed_arrays)
         return r
 
     def msg_handler_async(self, msg):
@@ -800,8 +1213,78 @@ class VPPApiClient:
         The return value is the message or message array containing
         the response.  It will raise an IOError exception if there was
         no response within the timeout window.
+
+        With _stream=True, a streaming call returns a generator of the
+        details messages instead, see _stream_vpp(). With _compact=True
+        the details are returned in a MessageTable, see _table_vpp().
         """
+        if kwargs.pop("_stream", False):
+            if "stream" not in service:
+                raise VPPValueError("{} is not a streaming call".format(msgdef.name))
+            return self._stream_vpp(i, msgdef, service, kwargs)
+        if kwargs.pop("_compact", False):
+            if "stream" not in service:
+                raise VPPValueError("{} is not a streaming call".format(msgdef.name))
+            return self._table_vpp(i, msgdef, service, kwargs)
+
         ts = time.time()
+        call = self._send_call(i, msgdef, service, kwargs)
+        context, no_type_conversion, timeout, lazy = call[:4]
+        msgreply, stream, stream_message, modern, rec = call[4:]
+
+        # Block until we get a reply.
+        rl = []
+        try:
+            while True:
+                if rec is None:
+                    r = self.read_blocking(no_type_conversion, timeout, lazy)
+                else:
+                    r = self._read_instrumented(rec, no_type_conversion, timeout, lazy)
+                if r is None:
+                    raise VPPIOError(2, "VPP API client: read failed")
+                msgname = type(r).__name__
+                r_context = getattr(r, "context", 0)
+                if r_context == 0 or context != r_context:
+                    # Message being queued
+                    self.message_queue.put_nowait(r)
+                    continue
+                if msgname != msgreply and (stream and (msgname != stream_message)):
+                    print("REPLY MISMATCH", msgreply, msgname, stream_message, stream)
+                if not stream:
+                    rl = r
+                    break
+                if msgname == msgreply:
+                    if modern:  # Return both reply and list
+                        rl = r, rl
+                    break
+
+                rl.append(r)
+        except BaseException as e:
+            if rec is not None:
+                rec.end(e)
+            raise
+
+        self.transport.resume()
+        if rec is not None:
+            rec.end()
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            s = "Return value: {!r}".format(r)
+            if len(s) > 80:
+                s = s[:80] + "..."
+            self.logger.debug(s)
+        te = time.time()
+        self._add_stat(msgdef.name, (te - ts) * 1000)
+        return rl
+
+    def _send_call(self, i, msgdef, service, kwargs):
+        """Pack and send a call, with a control ping after old style dumps.
+
+        Returns (context, no_type_conversion, timeout, lazy, reply name,
+        stream, stream message name, modern, instrumentation record)
+        for reading the replies. The record is None unless the client
+        is instrumented.
+        """
         if "context" not in kwargs:
             context = self.get_context()
             kwargs["context"] = context
@@ -811,6 +1294,7 @@ class VPPApiClient:
 
         no_type_conversion = kwargs.pop("_no_type_conversion", False)
         timeout = kwargs.pop("_timeout", None)
+        lazy = kwargs.pop("_lazy", None)
 
         try:
             if self.transport.socket_index:
@@ -819,18 +1303,32 @@ class VPPApiClient:
             pass
         self.validate_args(msgdef, kwargs)
 
-        s = "Calling {}({})".format(
-            msgdef.name, ",".join(["{!r}:{!r}".format(k, v) for k, v in kwargs.items()])
-        )
-        self.logger.debug(s)
-
-        b = msgdef.pack(kwargs)
-        self.transport.suspend()
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "Calling %s(%s)",
+                msgdef.name,
+                ",".join(["{!r}:{!r}".format(k, v) for k, v in kwargs.items()]),
+            )
 
-        self.transport.write(b)
+        inst = self.instrumentation
+        if inst is None:
+            b = msgdef.pack(kwargs)
+            self.transport.suspend()
+            self.transport.write(b)
+            rec = None
+        else:
+            t0 = time.perf_counter_ns()
+            b = msgdef.pack(kwargs)
+            t1 = time.perf_counter_ns()
+            self.transport.suspend()
+            self.transport.write(b)
+            t2 = time.perf_counter_ns()
+            rec = inst.start(msgdef.name, t0, t1 - t0, t2 - t1, len(b))
 
         msgreply = service["reply"]
         stream = True if "stream" in service else False
+        stream_message = None
+        modern = False
         if stream:
             if "stream_msg" in service:
                 # New service['reply'] = _reply and service['stream_message'] = _details
@@ -844,39 +1342,143 @@ class VPPApiClient:
                 # Send a ping after the request - we use its response
                 # to detect that we have seen all results.
                 self._control_ping(context)
+        return (
+            context,
+            no_type_conversion,
+            timeout,
+            lazy,
+            msgreply,
+            stream,
+            stream_message,
+            modern,
+            rec,
+        )
 
-        # Block until we get a reply.
-        rl = []
-        while True:
-            r = self.read_blocking(no_type_conversion, timeout)
-            if r is None:
-                raise VPPIOError(2, "VPP API client: read failed")
-            msgname = type(r).__name__
-            if context not in r or r.context == 0 or context != r.context:
-                # Message being queued
-                self.message_queue.put_nowait(r)
-                continue
-            if msgname != msgreply and (stream and (msgname != stream_message)):
-                print("REPLY MISMATCH", msgreply, msgname, stream_message, stream)
-            if not stream:
-                rl = r
-                break
-            if msgname == msgreply:
-                if modern:  # Return both reply and list
-                    rl = r, rl
-                break
+    def _read_instrumented(self, rec, no_type_conversion, timeout, lazy):
+        """read_blocking() that adds the wait and decode times and the
+        size of the message to instrumentation record rec."""
+        t0 = time.perf_counter_ns()
+        msg = self.transport.read(timeout=timeout)
+        t1 = time.perf_counter_ns()
+        if not msg:
+            rec.wait += t1 - t0
+            return None
+        r = self.decode_incoming_msg(msg, no_type_conversion, lazy)
+        rec.reply(len(msg), t1 - t0, time.perf_counter_ns() - t1)
+        return r
 
-            rl.append(r)
+    def _stream_vpp(self, i, msgdef, service, kwargs):
+        """Generator version of _call_vpp for streaming calls.
 
-        self.transport.resume()
+        The call is sent on the first next(). Details messages are yielded
+        as they are read, so memory use does not grow with the size of
+        the dump. The final reply (the _reply message, or the
+        control_ping_reply of old style dumps) is the return value of
+        the generator, e.g. rv = yield from vpp.api.x_dump(_stream=True).
+        If the generator is closed before the end, the rest of the dump
+        is read and dropped.
+        """
+        ts = time.time()
+        call = self._send_call(i, msgdef, service, kwargs)
+        context, no_type_conversion, timeout, lazy = call[:4]
+        msgreply = call[4]
+        rec = call[8]
+
+        done = False
+        try:
+            while True:
+                if rec is None:
+                    r = self.read_blocking(no_type_conversion, timeout, lazy)
+                else:
+                    r = self._read_instrumented(rec, no_type_conversion, timeout, lazy)
+                if r is None:
+                    done = True
+                    raise VPPIOError(2, "VPP API client: read failed")
+                r_context = getattr(r, "context", 0)
+                if r_context == 0 or context != r_context:
+                    # Message being queued
+                    self.message_queue.put_nowait(r)
+                    continue
+                if type(r).__name__ == msgreply:
+                    done = True
+                    break
+                yield r
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            if rec is not None:
+                rec.end(e)
+                rec = None
+            raise
+        finally:
+            # Drain an abandoned dump so its replies are not mistaken
+            # for events or replies to the next call.
+            while not done:
+                r = self.read_blocking(no_type_conversion, timeout, lazy)
+                if r is None:
+                    done = True
+                elif getattr(r, "context", 0) != context:
+                    self.message_queue.put_nowait(r)
+                elif type(r).__name__ == msgreply:
+                    done = True
+            self.transport.resume()
+            if rec is not None:
+                rec.end()
 
-        s = "Return value: {!r}".format(r)
-        if len(s) > 80:
-            s = s[:80] + "..."
-        self.logger.debug(s)
         te = time.time()
         self._add_stat(msgdef.name, (te - ts) * 1000)
-        return rl
+        return r
+
+    def _table_vpp(self, i, msgdef, service, kwargs):
+        """_call_vpp for streaming calls returning a MessageTable.
+
+        The details messages are not decoded, but stored as received in
+        a MessageTable (see vpp_table), which holds large dumps in a
+        fraction of the memory of a list of decoded messages. Returns
+        the table, or (reply, table) for calls with a _reply message.
+        """
+        ts = time.time()
+        call = self._send_call(i, msgdef, service, kwargs)
+        context, no_type_conversion, timeout, lazy = call[:4]
+        msgreply, _, stream_message, modern, rec = call[4:]
+        table = MessageTable(
+            self.messages[stream_message], no_type_conversion, self.typed_arrays
+        )
+        details = (self._msg_index(stream_message), context)
+
+        try:
+            while True:
+                if rec is not None:
+                    t0 = time.perf_counter_ns()
+                msg = self.transport.read(timeout=timeout)
+                if not msg:
+                    raise VPPIOError(2, "VPP API client: read failed")
+                if rec is not None:
+                    rec.reply(len(msg), time.perf_counter_ns() - t0, 0)
+                if _reply_header.unpack_from(msg) == details:
+                    table.append(msg)
+                    continue
+                r = self.decode_incoming_msg(msg, no_type_conversion, lazy)
+                r_context = getattr(r, "context", 0)
+                if r_context == 0 or context != r_context:
+                    # Message being queued
+                    self.message_queue.put_nowait(r)
+                    continue
+                if type(r).__name__ == msgreply:
+                    break
+        except BaseException as e:
+            if rec is not None:
+                rec.end(e)
+            raise
+
+        self.transport.resume()
+        if rec is not None:
+            rec.end()
+        te = time.time()
+        self._add_stat(msgdef.name, (te - ts) * 1000)
+        if modern:
+            return r, table
+        return table
 
     def _call_vpp_async(self, i, msg, **kwargs):
         """Given a message, send the message and return the context.
@@ -914,7 +1516,7 @@ class VPPApiClient:
         kwargs["context"] = 0
         return msg.pack(kwargs)
 
-    def read_blocking(self, no_type_conversion=False, timeout=None):
+    def read_blocking(self, no_type_conversion=False, timeout=None, lazy=None):
         """Get next received message from transport within timeout, decoded.
 
         Note that notifications have context zero
@@ -933,6 +1535,8 @@ class VPPApiClient:
 
         :param no_type_conversion: If false, type conversions are applied.
         :type no_type_conversion: bool
+        :param lazy: If true, return a LazyMessage. None uses the client default.
+        :type lazy: bool
         :returns: Decoded message, or None if no message (within timeout).
         :rtype: Whatever VPPType.unpack returns, depends on no_type_conversion.
         :raises VppTransportShmemIOError if timed out.
@@ -940,7 +1544,7 @@ class VPPApiClient:
         msg = self.transport.read(timeout=timeout)
         if not msg:
             return None
-        return self.decode_incoming_msg(msg, no_type_conversion)
+        return self.decode_incoming_msg(msg, no_type_conversion, lazy)
 
     def register_event_callback(self, callback):
         """Register a callback for async messages.
@@ -1018,13 +1622,32 @@ class VPPApiClient:
             )
         )
 
+    def batch(self, window=256, timeout=None, no_type_conversion=False, **kwargs):
+        """Return a VPPApiBatch pipelining up to window calls."""
+        return VPPApiBatch(
+            self,
+            window=window,
+            timeout=timeout,
+            no_type_conversion=no_type_conversion,
+            **kwargs,
+        )
+
     def details_iter(self, f, **kwargs):
+        """Iterate over the details of a cursor based dump, page by page.
+
+        With _stream=True, details are yielded as they are read instead
+        of a page at a time, so memory use is constant.
+        """
         cursor = 0
+        stream = kwargs.get("_stream", False)
         while True:
             kwargs["cursor"] = cursor
-            rv, details = f(**kwargs)
-            for d in details:
-                yield d
+            if stream:
+                rv = yield from f(**kwargs)
+            else:
+                rv, details = f(**kwargs)
+                for d in details:
+                    yield d
             if rv.retval == 0 or rv.retval != -165:
                 break
             cursor = rv.cursor
@@ -0,0 +1,534 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+asyncio VPP API client.
+
+Speaks the same UNIX socket protocol as VppTransport, but without any
+threads: a single reader task demultiplexes replies by context into
+futures, so any number of calls can be outstanding at once.
+
+    vpp = AsyncVPPApiClient(apifiles=...)
+    await vpp.connect("my-daemon")
+    rv = await vpp.api.show_version()
+    async for intf in vpp.api.sw_interface_dump():
+        ...
+    async for event in vpp.events():
+        ...
+    await vpp.disconnect()
+"""
+
+import asyncio
+import logging
+import struct
+
+import pkg_resources
+
+from .vpp_papi import (
+    FuncWrapper,
+    VppApiDynamicMethodHolder,
+    VPPApiError,
+    VPPApiJSONFiles,
+    VPPIOError,
+    VPPRuntimeError,
+    VPPValueError,
+)
+
+__all__ = ("AsyncVPPApiClient",)
+
+
+class AsyncStream:
+    """Replies to a streaming (dump) call.
+
+    Iterate with 'async for' to get details as they arrive, or await
+    the object to collect them. Awaiting returns the same shape as the
+    synchronous client: [details] or (reply, [details]).
+
+    A stream left before its end must be closed; the rest of its
+    details are then discarded as they arrive:
+
+        async with vpp.api.sw_interface_dump() as stream:
+            async for intf in stream:
+                if ...:
+                    break
+
+    At most 'maxsize' details are queued. When the queue is full, the
+    client stops reading from VPP until the stream is consumed, and
+    closes the stream if it is not within read_timeout.
+    """
+
+    maxsize = 1024
+
+    def __init__(self, client, i, msg, service, kwargs):
+        self.client = client
+        self.i = i
+        self.msg = msg
+        self.kwargs = kwargs
+        self.reply_name = service["reply"]
+        if "stream_msg" in service:
+            self.modern = True
+        else:
+            self.modern = False
+            self.reply_name = "control_ping_reply"
+        self.reply = None
+        self.queue = None
+        self.context = None
+        self.closed = False
+        self.error = None
+
+    def _feed(self, r):
+        if self.closed:
+            return None
+        if isinstance(r, Exception):
+            self._close(r, drain=False)
+            return None
+        try:
+            self.queue.put_nowait(r)
+        except asyncio.QueueFull:
+            return self._put(r)
+        return None
+
+    async def _put(self, r):
+        try:
+            await asyncio.wait_for(self.queue.put(r), self.client.read_timeout)
+        except asyncio.TimeoutError:
+            self.client.logger.warning(
+                "Closing stream %d, details not consumed", self.context
+            )
+            self._close(VPPIOError(2, "Stream closed, details not consumed"))
+
+    def _close(self, error=None, drain=True):
+        if self.closed:
+            return
+        self.closed = True
+        self.error = error
+        ended = self.reply is not None
+        if self.queue is not None:
+            # Wake up a reader waiting for room in the queue, and the
+            # consumer with the end of the stream.
+            while not self.queue.empty():
+                r = self.queue.get_nowait()
+                if type(r).__name__ == self.reply_name:
+                    ended = True
+            self.queue.put_nowait(None)
+        if self.context is not None:
+            pending = self.client._pending
+            if pending.get(self.context) in (self._feed, None):
+                if drain and not ended:
+                    # Discard the rest of the stream instead of passing
+                    # it on as events, as the synchronous client does.
+                    pending[self.context] = self._drain
+                else:
+                    pending.pop(self.context, None)
+
+    def _drain(self, r):
+        if isinstance(r, Exception) or type(r).__name__ == self.reply_name:
+            pending = self.client._pending
+            if pending.get(self.context) == self._drain:
+                del pending[self.context]
+        return None
+
+    async def aclose(self):
+        """Stop receiving the details of the stream."""
+        self._close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._close()
+
+    async def _start(self):
+        self.queue = asyncio.Queue(self.maxsize)
+        self.context = await self.client._send(
+            self.i, self.msg, self.kwargs, self._feed
+        )
+        if not self.modern:
+            await self.client._send(
+                self.client.control_ping_index,
+                self.client.control_ping_msgdef,
+                {"context": self.context},
+            )
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.error is not None:
+            raise self.error
+        if self.closed or self.reply is not None:
+            raise StopAsyncIteration
+        if self.queue is None:
+            await self._start()
+        try:
+            r = await self.client._wait(self.queue.get(), self.context)
+        except BaseException:
+            # Timed out or cancelled, the stream is abandoned
+            self._close()
+            raise
+        if r is None:
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+        if type(r).__name__ == self.reply_name:
+            self.reply = r
+            self._close()
+            raise StopAsyncIteration
+        return r
+
+    async def _collect(self):
+        async with self:
+            details = [d async for d in self]
+        if self.modern:
+            return self.reply, details
+        return details
+
+    def __await__(self):
+        return self._collect().__await__()
+
+
+class AsyncVPPApiClient:
+    """asyncio VPP interface.
+
+    API methods are coroutines returning the reply message. Methods
+    for streaming services return an AsyncStream. Messages without a
+    matching outstanding request (events) are delivered by events().
+    """
+
+    VPPApiError = VPPApiError
+    VPPRuntimeError = VPPRuntimeError
+    VPPValueError = VPPValueError
+    VPPIOError = VPPIOError
+
+    header = struct.Struct(">QII")
+    msg_id = struct.Struct(">H")
+
+    def __init__(
+        self,
+        *,
+        apifiles=None,
+        apidir=None,
+        testmode=False,
+        logger=None,
+        loglevel=None,
+        read_timeout=5,
+        server_address="/run/vpp/api.sock",
+        bootstrapapi=False,
+        api_cache=None,
+    ):
+        if logger is None:
+            logger = logging.getLogger(
+                "{}.{}".format(__name__, self.__class__.__name__)
+            )
+            if loglevel is not None:
+                logger.setLevel(loglevel)
+        self.logger = logger
+        self.read_timeout = read_timeout if read_timeout > 0 else None
+        self.server_address = server_address
+        self.bootstrapapi = bootstrapapi
+        self.messages = {}
+        self.services = {}
+        self.apifiles = []
+        self.id_names = []
+        self.id_msgdef = []
+        self.message_table = {}
+        self.socket_index = 0
+        self.connected = False
+        self._context = 0
+        self._pending = {}
+        self._events = None
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+
+        if not bootstrapapi:
+            try:
+                self.apifiles, self.messages, self.services = VPPApiJSONFiles.load_api(
+                    apifiles, apidir, cache=api_cache
+                )
+            except VPPRuntimeError as e:
+                if not testmode:
+                    raise e
+        else:
+            resource_path = "/".join(("data", "memclnt.api.json"))
+            file_content = pkg_resources.resource_string("vpp_papi", resource_path)
+            self.messages, self.services = VPPApiJSONFiles.process_json_str(
+                file_content
+            )
+        if len(self.messages) == 0 and not testmode:
+            raise VPPValueError(1, "Missing JSON message definitions")
+
+    @property
+    def api(self):
+        if not hasattr(self, "_api"):
+            raise VPPApiError("Not connected, api definitions not available")
+        return self._api
+
+    def get_context(self):
+        """Next context, unique among this client's outstanding requests."""
+        while True:
+            self._context = (self._context + 1) & 0xFFFFFFFF
+            if self._context and self._context not in self._pending:
+                return self._context
+
+    def _write(self, buf):
+        self._writer.write(self.header.pack(0, len(buf), 0) + buf)
+
+    async def _read_msg(self):
+        hdr = await self._reader.readexactly(self.header.size)
+        _, length, _ = self.header.unpack(hdr)
+        return await self._reader.readexactly(length)
+
+    async def connect(self, name):
+        """Attach to VPP."""
+        if self.connected:
+            raise VPPIOError(1, "Need to disconnect first")
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            self.server_address
+        )
+        self._events = asyncio.Queue()
+
+        sockclnt_create = self.messages["sockclnt_create"]
+        sockclnt_create_reply = self.messages["sockclnt_create_reply"]
+        self._write(
+            sockclnt_create.pack({"_vl_msg_id": 15, "name": name, "context": 124})
+        )
+        msg = await asyncio.wait_for(self._read_msg(), self.read_timeout)
+        if self.msg_id.unpack_from(msg)[0] != 16:
+            raise VPPIOError(2, "Invalid reply message")
+        r, length = sockclnt_create_reply.unpack(msg)
+        self.socket_index = r.index
+        self.message_table = {m.name: m.index for m in r.message_table}
+        self.connected = True
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+        self._register_functions()
+        if self.bootstrapapi:
+            r = await self.api.get_api_json()
+            if r.retval != 0:
+                raise VPPApiError("Failed to load API definitions from VPP")
+            m, s = VPPApiJSONFiles.process_json_array_str(r.json)
+            self.messages.update(m)
+            self.services.update(s)
+            self._register_functions()
+
+        self.control_ping_index = self._msg_index("control_ping")
+        self.control_ping_msgdef = self.messages["control_ping"]
+        return 0
+
+    async def disconnect(self):
+        """Detach from VPP."""
+        rv = 0
+        if self.connected:
+            try:
+                rv = await self.api.sockclnt_delete(index=self.socket_index)
+            except (IOError, asyncio.TimeoutError, VPPApiError):
+                pass
+        self.connected = False
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+        self._fail_pending(VPPIOError(2, "Disconnected"))
+        self.message_table = {}
+        return rv
+
+    def get_msg_index(self, name):
+        return self.message_table.get(name, 0)
+
+    def _register_functions(self):
+        """API methods are created on first access and message ids are
+        looked up when first received, as in VPPApiClient."""
+        maxid = max(self.message_table.values(), default=0)
+        self.id_names = [None] * (maxid + 1)
+        self.id_msgdef = [None] * (maxid + 1)
+        self._id_table = {v: k for k, v in self.message_table.items()}
+        self._api = VppApiDynamicMethodHolder(
+            self._resolve_function,
+            lambda: [n for n in self.services if n in self.messages],
+        )
+
+    def _msg_index(self, name):
+        msg = self.messages.get(name)
+        if msg is None:
+            return 0
+        n = name + "_" + msg.crc[2:]
+        i = self.get_msg_index(n)
+        if i > 0:
+            self.id_msgdef[i] = msg
+            self.id_names[i] = name
+        else:
+            self.logger.debug("No such message type or failed CRC checksum: %s", n)
+        return i
+
+    def _resolve_id(self, i):
+        n = self._id_table.get(i)
+        if n is None:
+            return None
+        name, _, crc = n.rpartition("_")
+        msg = self.messages.get(name)
+        if msg is None or msg.crc[2:] != crc:
+            return None
+        self.id_msgdef[i] = msg
+        self.id_names[i] = name
+        return msg
+
+    def _resolve_function(self, name):
+        if name not in self.services:
+            return None
+        i = self._msg_index(name)
+        if i <= 0:
+            return None
+        msg = self.id_msgdef[i]
+        return FuncWrapper(self._make_function(msg, i, self.services[name]))
+
+    def _make_function(self, msg, i, service):
+        if "stream" in service:
+
+            def f(**kwargs):
+                return AsyncStream(self, i, msg, service, kwargs)
+
+        else:
+
+            async def f(**kwargs):
+                return await self._call(i, msg, kwargs)
+
+        f.__name__ = str(msg.name)
+        f.__doc__ = ", ".join(
+            ["%s %s" % (msg.fieldtypes[j], k) for j, k in enumerate(msg.fields)]
+        )
+        f.msg = msg
+        return f
+
+    async def _send(self, i, msg, kwargs, waiter=None):
+        """Pack and send a request. Return its context."""
+        if not self.connected:
+            raise VPPIOError(1, "Not connected")
+        if "context" not in kwargs:
+            kwargs["context"] = self.get_context()
+        context = kwargs["context"]
+        kwargs["_vl_msg_id"] = i
+        kwargs["client_index"] = self.socket_index
+        d = set(kwargs) - set(msg.field_by_name)
+        if d:
+            raise VPPValueError("Invalid argument {} to {}".format(list(d), msg.name))
+        b = msg.pack(kwargs)
+        if waiter is not None:
+            self._pending[context] = waiter
+        self._write(b)
+        await self._writer.drain()
+        return context
+
+    async def _wait(self, aw, context):
+        try:
+            return await asyncio.wait_for(aw, self.read_timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(context, None)
+            raise VPPIOError(2, "VPP API client: read failed")
+
+    async def _call(self, i, msg, kwargs):
+        future = asyncio.get_running_loop().create_future()
+
+        def waiter(r):
+            if not future.done():
+                if isinstance(r, Exception):
+                    future.set_exception(r)
+                else:
+                    future.set_result(r)
+
+        context = await self._send(i, msg, kwargs, waiter)
+        try:
+            return await self._wait(future, context)
+        finally:
+            self._pending.pop(context, None)
+
+    def _decode(self, msg):
+        (i,) = self.msg_id.unpack_from(msg)
+        msgobj = self.id_msgdef[i] if i < len(self.id_msgdef) else None
+        if msgobj is None:
+            msgobj = self._resolve_id(i)
+            if msgobj is None:
+                raise VPPIOError(2, "Reply message undefined")
+        r, size = msgobj.unpack(msg)
+        return r
+
+    def _dispatch(self, msg):
+        """Hand a message to the waiter of its context. Return an
+        awaitable if the waiter has no room for it yet."""
+        r = self._decode(msg)
+        context = getattr(r, "context", 0)
+        waiter = self._pending.get(context) if context else None
+        if waiter is None:
+            self._events.put_nowait(r)
+            return None
+        return waiter(r)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                msg = await self._read_msg()
+                try:
+                    wait = self._dispatch(msg)
+                except Exception:
+                    self.logger.warning("Dropping undecodable message", exc_info=True)
+                    continue
+                if wait is not None:
+                    await wait
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self.connected = False
+            self._fail_pending(VPPIOError(2, "Connection lost: {!r}".format(e)))
+        except Exception as e:
+            self.logger.exception("API reader failed")
+            self.connected = False
+            self._fail_pending(VPPIOError(2, "Reader failed: {!r}".format(e)))
+
+    def _fail_pending(self, e):
+        pending = list(self._pending.values())
+        self._pending.clear()
+        for waiter in pending:
+            waiter(e)
+        if self._events is not None:
+            self._events.put_nowait(None)
+
+    async def events(self):
+        """Async iterator of messages not matching an outstanding request,
+        such as interface events. Ends when the client disconnects."""
+        while True:
+            r = await self._events.get()
+            if r is None:
+                return
+            yield r
+
+    def __repr__(self):
+        return (
+            "<AsyncVPPApiClient apifiles=%s, read_timeout=%s, server_address='%s'>"
+            % (
+                self.apifiles,
+                self.read_timeout,
+                self.server_address,
+            )
+        )
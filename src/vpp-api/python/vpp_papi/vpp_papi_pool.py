@@ -0,0 +1,272 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Pool of VPP API connections.
+
+A VPPApiClient holds its transport for the whole request / reply
+exchange, so threads sharing one client queue behind each other.
+VPPApiClientPool keeps N connections to the same VPP, sharing one set
+of API definitions, and runs each call on an idle connection:
+
+    pool = VPPApiClientPool(size=4, apidir=...)
+    pool.connect("workers")
+    # From any number of threads
+    rv = pool.api.show_version()
+    pool.disconnect()
+"""
+
+import logging
+import queue
+import time
+
+from .vpp_papi import (
+    FuncWrapper,
+    VPPApiClient,
+    VppApiDynamicMethodHolder,
+    VPPIOError,
+    VPPValueError,
+)
+
+logger = logging.getLogger("vpp_papi.pool")
+logger.addHandler(logging.NullHandler())
+
+__all__ = ("VPPApiClientPool",)
+
+
+class PoolConnection:
+    """One client of the pool and its statistics."""
+
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+        self.calls = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.busy = 0.0
+
+    @property
+    def connected(self):
+        return self.client.transport.connected
+
+    def get_stats(self):
+        return {
+            "index": self.index,
+            "connected": self.connected,
+            "calls": self.calls,
+            "errors": self.errors,
+            "reconnects": self.reconnects,
+            "busy_ms": self.busy * 1000,
+            "api": dict(self.client.stats),
+        }
+
+
+class PoolStream:
+    """Iterator over a streaming call made through the pool.
+
+    Holds the connection until the stream ends, fails, or is closed or
+    garbage collected. Like the generator it wraps, the final reply is
+    the value of StopIteration.
+    """
+
+    def __init__(self, pool, connection, start, gen):
+        self.pool = pool
+        self.connection = connection
+        self.start = start
+        self.gen = gen
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.gen)
+        except StopIteration:
+            self._release(False)
+            raise
+        except VPPIOError:
+            self._release(True)
+            raise
+        except BaseException:
+            self._release(False)
+            raise
+
+    def close(self):
+        try:
+            self.gen.close()
+        finally:
+            self._release(False)
+
+    def _release(self, failed):
+        c, self.connection = self.connection, None
+        if c is not None:
+            self.pool._release(c, self.start, failed)
+
+    def __del__(self):
+        if self.connection is not None:
+            self.close()
+
+
+class VPPApiClientPool:
+    """N VPPApiClient connections to one VPP, safe to call from any thread.
+
+    The keyword arguments are passed to each VPPApiClient. The API
+    definitions are loaded once and shared by all the connections.
+
+    Each call waits up to 'timeout' seconds (None: forever) for an idle
+    connection. A call that fails with VPPIOError is not retried, since
+    it may have been executed, but its connection is reconnected before
+    it is used again.
+    """
+
+    VPPIOError = VPPIOError
+
+    def __init__(self, size=4, timeout=None, **kwargs):
+        if size < 1:
+            raise VPPValueError("Pool size must be at least 1")
+        self.timeout = timeout
+        self.name = None
+        self.connect_args = {}
+        first = VPPApiClient(**kwargs)
+        kwargs["definitions"] = first.messages, first.services
+        clients = [first] + [VPPApiClient(**kwargs) for _ in range(size - 1)]
+        self.connections = [PoolConnection(i, c) for i, c in enumerate(clients)]
+        self._idle = queue.LifoQueue()
+        self._api = VppApiDynamicMethodHolder(
+            self._resolve_function,
+            lambda: [n for n in first.services if n in first.messages],
+        )
+
+    @property
+    def clients(self):
+        return [c.client for c in self.connections]
+
+    @property
+    def api(self):
+        if self.name is None:
+            raise VPPIOError(1, "Not connected")
+        return self._api
+
+    def connect(self, name, **kwargs):
+        """Connect all the clients, named name-0 ... name-N.
+
+        kwargs are passed to VPPApiClient.connect(), except do_async
+        which the pool does not support.
+        """
+        if kwargs.get("do_async"):
+            raise VPPValueError("Pool connections must be synchronous")
+        self.name = name
+        self.connect_args = kwargs
+        for c in self.connections:
+            self._connect(c)
+            self._idle.put(c)
+        return 0
+
+    def _connect(self, c):
+        c.client.connect("{}-{}".format(self.name, c.index), **self.connect_args)
+
+    def disconnect(self):
+        """Disconnect all the clients. Calls in progress are not waited for."""
+        for c in self.connections:
+            if c.connected:
+                try:
+                    c.client.disconnect()
+                except (IOError, VPPIOError):
+                    pass
+        self._idle = queue.LifoQueue()
+        self.name = None
+        return 0
+
+    def reconnect(self, c):
+        """Reconnect connection c."""
+        c.reconnects += 1
+        try:
+            if c.connected:
+                c.client.disconnect()
+        except (IOError, VPPIOError):
+            pass
+        self._connect(c)
+
+    def _acquire(self):
+        try:
+            c = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise VPPIOError(2, "No idle connection in pool")
+        if not c.connected:
+            try:
+                self.reconnect(c)
+            except Exception:
+                self._idle.put(c)
+                raise
+        return c
+
+    def _release(self, c, start, failed):
+        c.busy += time.time() - start
+        if failed:
+            c.errors += 1
+            try:
+                self.reconnect(c)
+            except Exception as e:
+                # Retried by the next _acquire()
+                logger.warning("Reconnect of %s-%s failed: %r", self.name, c.index, e)
+        self._idle.put(c)
+
+    def call(self, name, **kwargs):
+        """Call API function name on an idle connection."""
+        c = self._acquire()
+        start = time.time()
+        c.calls += 1
+        try:
+            r = getattr(c.client.api, name)(**kwargs)
+        except VPPIOError:
+            self._release(c, start, True)
+            raise
+        except BaseException:
+            self._release(c, start, False)
+            raise
+        if kwargs.get("_stream"):
+            return PoolStream(self, c, start, r)
+        self._release(c, start, False)
+        return r
+
+    def _resolve_function(self, name):
+        client = self.connections[0].client
+        if name not in client.services or name not in client.messages:
+            return None
+
+        def f(**kwargs):
+            return self.call(name, **kwargs)
+
+        f.__name__ = name
+        f.__doc__ = getattr(client.api, name).__doc__
+        return FuncWrapper(f)
+
+    def register_event_callback(self, callback):
+        """Register callback on every connection."""
+        for c in self.connections:
+            c.client.register_event_callback(callback)
+
+    def get_stats(self):
+        """Statistics of each connection, a list of dicts."""
+        return [c.get_stats() for c in self.connections]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disconnect()
+
+    def __repr__(self):
+        return "<VPPApiClientPool size=%d name=%s>" % (len(self.connections), self.name)
@@ -12,15 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import array
 import collections
 from enum import IntFlag
 import logging
 import socket
 import struct
 import sys
+import threading
 
 from . import vpp_format
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 #
 # Set log-level in application by doing e.g.:
@@ -29,6 +36,31 @@ from . import vpp_format
 #
 logger = logging.getLogger("vpp_papi.serializer")
 
+#
+# Opt-in compiled codecs (see vpp_codec). When enabled, VPPType and
+# VPPUnionType generate a specialised pack/unpack function on first use.
+#
+_compiled_codecs = False
+
+
+def set_compiled_codecs(enabled=True):
+    """Switch all types between the interpreted and compiled codecs."""
+    global _compiled_codecs
+    _compiled_codecs = bool(enabled)
+
+
+def compiled_codecs_enabled():
+    return _compiled_codecs
+
+
+#
+# Types are shared by all clients and threads in the process and are not
+# modified once built; decoding keeps its state in locals. The only
+# exception are the codecs and lazy classes built on first use, which
+# are created under this lock.
+#
+_build_lock = threading.RLock()
+
 
 def check(d):
     return type(d) is dict or type(d) is bytes
@@ -61,7 +93,7 @@ class Packer:
     def pack(self, data, kwargs):
         raise NotImplementedError
 
-    def unpack(self, data, offset, result=None, ntc=False):
+    def unpack(self, data, offset, result=None, ntc=False, arrays=False):
         raise NotImplementedError
 
     # override as appropriate in subclasses
@@ -107,6 +139,9 @@ class BaseTypes(Packer):
             self.packer = struct.Struct(base_types[type])
         self.size = self.packer.size
         self.options = options
+        # Format for packing / unpacking n elements in one go: '>%dI'
+        fmt = self.packer.format
+        self.array_format = fmt[0] + "%d" + fmt[1:]
 
     def pack(self, data, kwargs=None):
         if data is None:  # Default to zero if not specified
@@ -116,9 +151,29 @@ class BaseTypes(Packer):
                 data = 0
         return self.packer.pack(data)
 
-    def unpack(self, data, offset, result=None, ntc=False):
+    def unpack(self, data, offset, result=None, ntc=False, arrays=False):
         return self.packer.unpack_from(data, offset)[0], self.packer.size
 
+    def pack_array(self, lst):
+        """Pack a list of scalars with a single struct call."""
+        if numpy is not None and isinstance(lst, numpy.ndarray):
+            dtype = typed_array_dtypes.get(self._type)
+            if dtype:
+                return lst.astype(dtype, copy=False).tobytes()
+        try:
+            return struct.pack(self.array_format % len(lst), *lst)
+        except struct.error:
+            # None elements default to zero
+            return b"".join([self.pack(e) for e in lst])
+
+    def unpack_array(self, data, offset, num, arrays=False):
+        """Unpack num scalars with a single struct call.
+        If arrays is true, return a typed buffer instead of a list."""
+        size = num * self.size
+        if arrays and self._type in typed_array_dtypes:
+            return typed_array(self._type, data, offset, num), size
+        return list(struct.unpack_from(self.array_format % num, data, offset)), size
+
     @staticmethod
     def _get_packer_with_options(f_type, options):
         return BaseTypes(f_type, options=options)
@@ -161,7 +216,7 @@ class String(Packer):
             return list.encode("ascii").ljust(self.limit, b"\x00")
         return self.length_field_packer.pack(len(list)) + list.encode("ascii")
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         if self.fixed:
             p = BaseTypes("u8", self.num)
             s = p.unpack(data, offset)
@@ -192,6 +247,91 @@ types = {
 
 class_types = {}
 
+#
+# Numeric arrays can be decoded into typed buffers instead of lists.
+# With NumPy these are read-only views into the receive buffer,
+# otherwise array.array copies.
+#
+typed_array_dtypes = {
+    "i8": "i1",
+    "u16": ">u2",
+    "i16": ">i2",
+    "u32": ">u4",
+    "i32": ">i4",
+    "u64": ">u8",
+    "i64": ">i8",
+    "f64": "=f8",
+}
+
+
+def _array_typecode(signed, size):
+    for c in "bhilq" if signed else "BHILQ":
+        if array.array(c).itemsize == size:
+            return c
+
+
+_typed_array_codes = {
+    t: (_array_typecode(d[-2] == "i", int(d[-1])), d[0] == ">")
+    for t, d in typed_array_dtypes.items()
+    if d[-2] != "f"
+}
+_typed_array_codes["f64"] = ("d", False)
+_byteswap = sys.byteorder == "little"
+
+
+def typed_array(field_type, data, offset, num):
+    """Return num elements of field_type at offset as a typed buffer."""
+    if numpy is not None:
+        return numpy.frombuffer(
+            data, dtype=typed_array_dtypes[field_type], count=num, offset=offset
+        )
+    typecode, bigendian = _typed_array_codes[field_type]
+    a = array.array(typecode)
+    a.frombytes(data[offset : offset + num * a.itemsize])
+    if len(a) != num:
+        raise VPPSerializerValueError(
+            "Invalid array length for {} got {} expected {}".format(
+                field_type, len(a), num
+            )
+        )
+    if bigendian and _byteswap:
+        a.byteswap()
+    return a
+
+
+def is_empty(lst):
+    """Like 'not lst', but also accepts NumPy arrays."""
+    if numpy is not None and isinstance(lst, numpy.ndarray):
+        return lst.size == 0
+    return not lst
+
+
+def is_fixed_size(p):
+    """True if packer p always unpacks the same number of bytes."""
+    if isinstance(p, (VLAList, VLAList_legacy)):
+        return False
+    if isinstance(p, String):
+        return p.fixed
+    if isinstance(p, VPPType):
+        return p.fixed_size
+    if isinstance(p, VPPUnionType):
+        return all(is_fixed_size(a) for a in p.packers.values())
+    if isinstance(p, VPPTypeAlias):
+        return is_fixed_size(p.packer)
+    return True
+
+
+def scalar_packer(p):
+    """Return the BaseTypes packer if p packs plain numbers, else None."""
+    if isinstance(p, BaseTypes) and p._elements == 0 and p._type != "string":
+        return p
+    if isinstance(p, VPPTypeAlias) and not (
+        p.name in vpp_format.conversion_table
+        or p.name in vpp_format.conversion_unpacker_table
+    ):
+        return scalar_packer(p.packer)
+    return None
+
 
 def vpp_get_type(name):
     try:
@@ -231,7 +371,7 @@ class FixedList_u8(Packer):
                 'Packing failed for "{}" {}'.format(self.name, kwargs)
             )
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         if len(data[offset:]) < self.num:
             raise VPPSerializerValueError(
                 'Invalid array length for "{}" got {}'
@@ -251,6 +391,7 @@ class FixedList(Packer):
     def __init__(self, name, field_type, num):
         self.num = num
         self.packer = types[field_type]
+        self.scalar = scalar_packer(self.packer)
         self.size = self.packer.size * num
         self.name = name
         self.field_type = field_type
@@ -262,17 +403,21 @@ class FixedList(Packer):
                     len(list), self.num
                 )
             )
+        if self.scalar:
+            return self.scalar.pack_array(list)
         b = bytearray()
         for e in list:
             b += self.packer.pack(e)
         return bytes(b)
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
+        if self.scalar:
+            return self.scalar.unpack_array(data, offset, self.num, arrays)
         # Return a list of arguments
         result = []
         total = 0
         for e in range(self.num):
-            x, size = self.packer.unpack(data, offset, ntc=ntc)
+            x, size = self.packer.unpack(data, offset, ntc=ntc, arrays=arrays)
             result.append(x)
             offset += size
             total += size
@@ -292,11 +437,12 @@ class VLAList(Packer):
         self.field_type = field_type
         self.index = index
         self.packer = types[field_type]
+        self.scalar = scalar_packer(self.packer)
         self.size = self.packer.size
         self.length_field = len_field_name
 
     def pack(self, lst, kwargs=None):
-        if not lst:
+        if is_empty(lst):
             return b""
         if len(lst) != kwargs[self.length_field]:
             raise VPPSerializerValueError(
@@ -310,12 +456,14 @@ class VLAList(Packer):
                 return b"".join(lst)
             return bytes(lst)
 
+        if self.scalar:
+            return self.scalar.pack_array(lst)
         b = bytearray()
         for e in lst:
             b += self.packer.pack(e)
         return bytes(b)
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         # Return a list of arguments
         total = 0
 
@@ -326,9 +474,12 @@ class VLAList(Packer):
             p = BaseTypes("u8", result[self.index])
             return p.unpack(data, offset, ntc=ntc)
 
+        if self.scalar:
+            return self.scalar.unpack_array(data, offset, result[self.index], arrays)
+
         r = []
         for e in range(result[self.index]):
-            x, size = self.packer.unpack(data, offset, ntc=ntc)
+            x, size = self.packer.unpack(data, offset, ntc=ntc, arrays=arrays)
             r.append(x)
             offset += size
             total += size
@@ -348,18 +499,21 @@ class VLAList_legacy(Packer):
         self.name = name
         self.field_type = field_type
         self.packer = types[field_type]
+        self.scalar = scalar_packer(self.packer)
         self.size = self.packer.size
 
     def pack(self, list, kwargs=None):
         if self.packer.size == 1:
             return bytes(list)
 
+        if self.scalar:
+            return self.scalar.pack_array(list)
         b = bytearray()
         for e in list:
             b += self.packer.pack(e)
         return bytes(b)
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         total = 0
         # Return a list of arguments
         if (len(data) - offset) % self.packer.size:
@@ -367,9 +521,11 @@ class VLAList_legacy(Packer):
                 "Legacy Variable Length Array length mismatch."
             )
         elements = int((len(data) - offset) / self.packer.size)
+        if self.scalar:
+            return self.scalar.unpack_array(data, offset, elements, arrays)
         r = []
         for e in range(elements):
-            x, size = self.packer.unpack(data, offset, ntc=ntc)
+            x, size = self.packer.unpack(data, offset, ntc=ntc, arrays=arrays)
             r.append(x)
             offset += self.packer.size
             total += size
@@ -417,7 +573,7 @@ class VPPEnumType(Packer):
 
         return types[self.enumtype].pack(data)
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         x, size = types[self.enumtype].unpack(data, offset)
         return self.enum(x), size
 
@@ -466,9 +622,53 @@ class VPPUnionType(Packer):
 
         types[name] = self
         self.tuple = collections.namedtuple(name, fields, rename=True)
+        self.arms = list(self.packers.values())
+        self._codec = None
+        self._lazy_class = None
+
+    @property
+    def codec(self):
+        if self._codec is None:
+            from .vpp_codec import compile_union
+
+            with _build_lock:
+                if self._codec is None:
+                    self._codec = compile_union(self)
+        return self._codec
 
-    # Union of variable length?
     def pack(self, data, kwargs=None):
+        if _compiled_codecs:
+            return self.codec.pack(data, kwargs)
+        return self._pack(data, kwargs)
+
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
+        if _compiled_codecs:
+            return self.codec.unpack(data, offset, result, ntc, arrays)
+        return self._unpack(data, offset, result, ntc, arrays)
+
+    @property
+    def lazy_class(self):
+        """LazyUnion subclass for this type, built on first use."""
+        if self._lazy_class is None:
+            with _build_lock:
+                if self._lazy_class is None:
+                    fields = self.tuple._fields
+                    ns = {"__slots__": (), "_type": self, "_fields": fields}
+                    for i, f in enumerate(fields):
+                        ns[f] = _LazyField(i)
+                    self._lazy_class = type(self.name, (LazyUnion,), ns)
+        return self._lazy_class
+
+    def unpack_lazy(self, data, offset=0, ntc=False, arrays=False):
+        """Like unpack(), but return a LazyUnion if the union is fixed size."""
+        if (
+            ntc is False and self.name in vpp_format.conversion_unpacker_table
+        ) or not is_fixed_size(self):
+            return self.unpack(data, offset, ntc=ntc, arrays=arrays)
+        return self.lazy_class(data, offset, ntc, arrays), self.size
+
+    # Union of variable length?
+    def _pack(self, data, kwargs=None):
         if not data:
             return b"\x00" * self.size
 
@@ -480,11 +680,11 @@ class VPPUnionType(Packer):
         r[: len(b)] = b
         return r
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def _unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         r = []
         maxsize = 0
         for k, p in self.packers.items():
-            x, size = p.unpack(data, offset, ntc=ntc)
+            x, size = p.unpack(data, offset, ntc=ntc, arrays=arrays)
             if size > maxsize:
                 maxsize = size
             r.append(x)
@@ -514,7 +714,6 @@ class VPPTypeAlias(Packer):
             self.size = t.size
 
         types[name] = self
-        self.toplevelconversion = False
         self.options = options
 
     def pack(self, data, kwargs=None):
@@ -536,14 +735,13 @@ class VPPTypeAlias(Packer):
     def _get_packer_with_options(f_type, options):
         return VPPTypeAlias(f_type, types[f_type].msgdef, options=options)
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
-        if ntc is False and self.name in vpp_format.conversion_unpacker_table:
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
+        convert = ntc is False and self.name in vpp_format.conversion_unpacker_table
+        if convert:
             # Disable type conversion for dependent types
             ntc = True
-            self.toplevelconversion = True
-        t, size = self.packer.unpack(data, offset, result, ntc=ntc)
-        if self.toplevelconversion:
-            self.toplevelconversion = False
+        t, size = self.packer.unpack(data, offset, result, ntc=ntc, arrays=arrays)
+        if convert:
             return conversion_unpacker(t, self.name), size
         return t, size
 
@@ -619,10 +817,71 @@ class VPPType(Packer):
                 size += p.size
         self.size = size
         self.tuple = collections.namedtuple(name, self.fields, rename=True)
+
+        # Offset of each field, None after the first variable length field
+        self.offsets = []
+        offset = 0
+        for p in self.packers:
+            self.offsets.append(offset)
+            if offset is not None:
+                offset = offset + p.size if is_fixed_size(p) else None
+        self.fixed_size = offset is not None
+
         types[name] = self
-        self.toplevelconversion = False
+        self._codec = None
+        self._lazy_class = None
+
+    @property
+    def codec(self):
+        """Compiled pack/unpack functions for this type, built on first use."""
+        if self._codec is None:
+            from .vpp_codec import compile_type
+
+            with _build_lock:
+                if self._codec is None:
+                    self._codec = compile_type(self)
+        return self._codec
 
     def pack(self, data, kwargs=None):
+        if _compiled_codecs:
+            return self.codec.pack(data, kwargs)
+        return self._pack(data, kwargs)
+
+    def pack_into(self, buf, offset, data, kwargs=None):
+        """Pack data into the writable buffer buf at offset and return
+        the number of bytes written. buf must have room for the message;
+        for fixed size types that is self.size bytes."""
+        if _compiled_codecs:
+            return self.codec.pack_into(buf, offset, data, kwargs)
+        b = self._pack(data, kwargs)
+        buf[offset : offset + len(b)] = b
+        return len(b)
+
+    def unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
+        if _compiled_codecs:
+            return self.codec.unpack(data, offset, result, ntc, arrays)
+        return self._unpack(data, offset, result, ntc, arrays)
+
+    @property
+    def lazy_class(self):
+        """LazyMessage subclass for this type, built on first use."""
+        if self._lazy_class is None:
+            with _build_lock:
+                if self._lazy_class is None:
+                    fields = self.tuple._fields
+                    ns = {"__slots__": (), "_type": self, "_fields": fields}
+                    for i, f in enumerate(fields):
+                        ns[f] = _LazyField(i)
+                    self._lazy_class = type(self.name, (LazyMessage,), ns)
+        return self._lazy_class
+
+    def unpack_lazy(self, data, offset=0, ntc=False, arrays=False):
+        """Return a LazyMessage that decodes fields on first access."""
+        if ntc is False and self.name in vpp_format.conversion_unpacker_table:
+            return self.unpack(data, offset, ntc=ntc, arrays=arrays)[0]
+        return self.lazy_class(data, offset, ntc, arrays)
+
+    def _pack(self, data, kwargs=None):
         if not kwargs:
             kwargs = data
         b = bytearray()
@@ -656,17 +915,17 @@ class VPPType(Packer):
 
         return bytes(b)
 
-    def unpack(self, data, offset=0, result=None, ntc=False):
+    def _unpack(self, data, offset=0, result=None, ntc=False, arrays=False):
         # Return a list of arguments
         result = []
         total = 0
-        if ntc is False and self.name in vpp_format.conversion_unpacker_table:
+        convert = ntc is False and self.name in vpp_format.conversion_unpacker_table
+        if convert:
             # Disable type conversion for dependent types
             ntc = True
-            self.toplevelconversion = True
 
         for p in self.packers:
-            x, size = p.unpack(data, offset, result, ntc)
+            x, size = p.unpack(data, offset, result, ntc, arrays)
             if type(x) is tuple and len(x) == 1:
                 x = x[0]
             result.append(x)
@@ -674,8 +933,7 @@ class VPPType(Packer):
             total += size
         t = self.tuple._make(result)
 
-        if self.toplevelconversion:
-            self.toplevelconversion = False
+        if convert:
             t = conversion_unpacker(t, self.name)
         return t, total
 
@@ -689,3 +947,138 @@ class VPPType(Packer):
 
 class VPPMessage(VPPType):
     pass
+
+
+_NOTSET = object()
+
+
+class _LazyField:
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        v = obj._values[self.index]
+        if v is _NOTSET:
+            v = obj._decode(self.index)
+        return v
+
+
+class _LazyTuple:
+    """Namedtuple-like behaviour of LazyMessage and LazyUnion, on top of
+    _get(i) and _materialize()."""
+
+    __slots__ = ()
+    _type = None
+    _fields = ()
+
+    def _get(self, i):
+        v = self._values[i]
+        if v is _NOTSET:
+            v = self._decode(i)
+        return v
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self)[i]
+        return self._get(range(len(self._fields))[i])
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __iter__(self):
+        for i in range(len(self._fields)):
+            yield self._get(i)
+
+    def __contains__(self, value):
+        return any(v == value for v in self)
+
+    def _materialize(self):
+        return self._type.tuple._make(
+            v._materialize() if isinstance(v, _LazyTuple) else v for v in self
+        )
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def _replace(self, **kwargs):
+        return self._materialize()._replace(**kwargs)
+
+    def __eq__(self, other):
+        if isinstance(other, _LazyTuple):
+            other = other._materialize()
+        return self._materialize() == other
+
+    def __hash__(self):
+        return hash(self._materialize())
+
+    def __repr__(self):
+        return repr(self._materialize())
+
+
+class LazyMessage(_LazyTuple):
+    """Decoded message that keeps the raw bytes and decodes each field
+    only when accessed. Behaves like the namedtuple VPPType.unpack
+    returns; _materialize() returns that namedtuple. Fixed size unions
+    in it are returned as LazyUnion."""
+
+    __slots__ = ("_data", "_offset", "_ntc", "_arrays", "_values", "_ends")
+
+    def __init__(self, data, offset=0, ntc=False, arrays=False):
+        self._data = data
+        self._offset = offset
+        self._ntc = ntc
+        self._arrays = arrays
+        self._values = [_NOTSET] * len(self._fields)
+        self._ends = [None] * len(self._fields)
+
+    def _field_offset(self, i):
+        offset = self._type.offsets[i]
+        if offset is not None:
+            return self._offset + offset
+        self._get(i - 1)
+        return self._ends[i - 1]
+
+    def _decode(self, i):
+        offset = self._field_offset(i)
+        p = self._type.packers[i]
+        if type(p) is VPPUnionType:
+            x, size = p.unpack_lazy(self._data, offset, self._ntc, self._arrays)
+        else:
+            x, size = p.unpack(self._data, offset, self, self._ntc, self._arrays)
+        if type(x) is tuple and len(x) == 1:
+            x = x[0]
+        self._values[i] = x
+        self._ends[i] = offset + size
+        return x
+
+    def _size(self):
+        """Number of bytes the message occupies in the buffer."""
+        if not self._fields:
+            return 0
+        self._get(len(self._fields) - 1)
+        return self._ends[-1] - self._offset
+
+
+class LazyUnion(_LazyTuple):
+    """Decoded union that only decodes the arms that are accessed.
+    Behaves like the namedtuple VPPUnionType.unpack returns."""
+
+    __slots__ = ("_data", "_offset", "_ntc", "_arrays", "_values")
+
+    def __init__(self, data, offset=0, ntc=False, arrays=False):
+        self._data = data
+        self._offset = offset
+        self._ntc = ntc
+        self._arrays = arrays
+        self._values = [_NOTSET] * len(self._fields)
+
+    def _decode(self, i):
+        x, _ = self._type.arms[i].unpack(
+            self._data, self._offset, ntc=self._ntc, arrays=self._arrays
+        )
+        self._values[i] = x
+        return x
@@ -39,17 +39,38 @@ stat['/if/rx'][:, 1].sum_packets() - returns the sum of packet counters for
                                      interface 1 on all threads
 stat['/if/rx-miss'][:, 1].sum() - returns the sum of packet counters for
                                   interface 1 on all threads for simple counters
+
+With VPPStats(typed_arrays=True), simple and combined counters are
+copied out of the segment in bulk, into a threads x index matrix
+(a NumPy array, or rows of array.array if NumPy is not installed):
+stat['/if/rx'].sum_packets(axis=0) - returns the packet counters of all
+                                     interfaces summed over threads
+stat['/if/rx'].array - returns the threads x index x (packets, octets)
+                       matrix
+stat['/if/rx'].tolist() - returns the 2D lists
+
+stat.snapshot(['^/if/rx$', '^/err/']) - returns the matching counters,
+                                        all read in one lock epoch
+StatsPoller(stat, ['^/if/']).poll() - returns the non-zero changes and
+                                      rates since the previous poll
 """
 
+import collections
 import os
 import socket
 import array
 import mmap
 from struct import Struct
+import threading
 import time
 import unittest
 import re
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def recv_fd(sock):
     """Get file descriptor for memory map"""
@@ -114,6 +135,129 @@ class StatsVector:
             )
 
 
+COUNTER_TYPECODE = "Q"
+POINTER_FMT = Struct("P")
+DIRECTORY_ENTRY = Struct("IQ128s")
+
+
+def counter_vectors(stats, ptr, width):
+    """(offset, length) of the per-thread vectors of a counter of width
+    u64s, checked against the segment size"""
+    statseg = stats.statseg
+    base = stats.base
+    start = ptr - base
+    end = start + get_vec_len(stats, start) * POINTER_FMT.size
+    if end >= stats.size:
+        raise IOError("Vector overruns stats segment")
+    vectors = []
+    for (thread,) in POINTER_FMT.iter_unpack(statseg[start:end]):
+        offset = thread - base
+        (length,) = VEC_LEN_FMT.unpack_from(statseg, offset - 8)
+        if offset + length * width * 8 >= stats.size:
+            raise IOError("Vector overruns stats segment")
+        vectors.append((offset, length))
+    return vectors
+
+
+def counter_matrix(stats, ptr, width):
+    """Copy the per-thread vectors of a counter of width u64s out of
+    the segment, with stats.lock held. Returns a threads x index x width
+    NumPy array, or a list of array.array rows of index * width u64s
+    without NumPy. Shorter vectors are padded with zeros."""
+    vectors = counter_vectors(stats, ptr, width)
+    n = max((length for _, length in vectors), default=0)
+    statseg = stats.statseg
+    if numpy is not None:
+        matrix = numpy.zeros((len(vectors), n * width), dtype=numpy.uint64)
+        for row, (offset, length) in zip(matrix, vectors):
+            row[: length * width] = numpy.frombuffer(
+                statseg, dtype=numpy.uint64, count=length * width, offset=offset
+            )
+        return matrix.reshape(len(vectors), n, width)
+    rows = []
+    for offset, length in vectors:
+        row = array.array(COUNTER_TYPECODE)
+        row.frombytes(statseg[offset : offset + length * width * 8])
+        row.extend([0] * ((n - length) * width))
+        rows.append(row)
+    return rows
+
+
+REGEX_SPECIAL = frozenset(".^$*+?{}[]\\|()")
+
+
+def literal_prefix(pattern):
+    """Literal text that all names matching pattern with re.match()
+    start with, possibly empty"""
+    if "|" in pattern:
+        return ""
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    prefix = []
+    for c in pattern:
+        if c in "*?{":
+            # The previous character may not be there
+            prefix = prefix[:-1]
+            break
+        if c in REGEX_SPECIAL:
+            break
+        prefix.append(c)
+    return "".join(prefix)
+
+
+class PathTrie:
+    """Counter names by path segment
+
+    Each node is a dict of child nodes by segment, the name ending at
+    the node is stored under None."""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, name):
+        node = self.root
+        for segment in name.split("/"):
+            node = node.setdefault(segment, {})
+        node[None] = name
+
+    def remove(self, name):
+        segments = name.split("/")
+        path = [self.root]
+        for segment in segments:
+            node = path[-1].get(segment)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop(None, None)
+        # Prune the nodes left empty
+        for i in range(len(segments), 0, -1):
+            if path[i]:
+                break
+            del path[i - 1][segments[i - 1]]
+
+    def prefixed(self, prefix):
+        """Names starting with prefix, in time proportional to their
+        number"""
+        *segments, partial = prefix.split("/")
+        node = self.root
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                return
+        stack = [
+            child
+            for segment, child in node.items()
+            if segment is not None and segment.startswith(partial)
+        ]
+        while stack:
+            node = stack.pop()
+            for segment, child in node.items():
+                if segment is None:
+                    yield child
+                else:
+                    stack.append(child)
+
+
 class VPPStats:
     """Main class implementing Python access to the VPP statistics segment"""
 
@@ -121,10 +265,22 @@ class VPPStats:
     shared_headerfmt = Struct("QPQQPP")
     default_socketname = "/run/vpp/stats.sock"
 
-    def __init__(self, socketname=default_socketname, timeout=10):
+    def __init__(self, socketname=default_socketname, timeout=10, typed_arrays=False):
+        """typed_arrays, if true, returns simple and combined counters
+        as StatsSimpleArray and StatsCombinedArray matrices instead of
+        lists."""
         self.socketname = socketname
         self.timeout = timeout
+        self.typed_arrays = typed_arrays
         self.directory = {}
+        self.directory_by_idx = {}
+        self._slots = {}  # name -> directory index
+        self._trie = PathTrie()  # names by path segment, for ls()
+        self._ls_cache = {}  # pattern -> directory indexes of matches
+        self._directory_raw = b""
+        # Serializes the in place updates of the directory and its
+        # indexes by threads sharing this VPPStats
+        self._directory_lock = threading.Lock()
         self.lock = StatsLock(self)
         self.connected = False
         self.size = 0
@@ -157,6 +313,7 @@ class VPPStats:
         if self.version != 2:
             raise Exception("Incompatbile stat segment version {}".format(self.version))
 
+        self._directory_raw = b""
         self.refresh()
         self.connected = True
 
@@ -194,27 +351,80 @@ class VPPStats:
     elementfmt = "IQ128s"
 
     def refresh(self, blocking=True):
-        """Refresh directory vector cache (epoch changed)"""
-        directory = {}
-        directory_by_idx = {}
+        """Refresh directory vector cache (epoch changed)
+
+        The directory vector is copied and compared with the previous
+        copy, only the entries of slots that changed are decoded."""
         while True:
             try:
                 with self.lock:
-                    self.last_epoch = self.epoch
-                    for i, direntry in enumerate(
-                        StatsVector(self, self.directory_vector, self.elementfmt)
-                    ):
-                        path_raw = direntry[2].find(b"\x00")
-                        path = direntry[2][:path_raw].decode("ascii")
-                        directory[path] = StatsEntry(direntry[0], direntry[1])
-                        directory_by_idx[i] = path
-                    self.directory = directory
-                    self.directory_by_idx = directory_by_idx
-                    return
+                    start = self.directory_vector - self.base
+                    end = start + get_vec_len(self, start) * DIRECTORY_ENTRY.size
+                    if end >= self.size:
+                        raise IOError("Vector overruns stats segment")
+                    raw = self.statseg[start:end]
+                with self._directory_lock:
+                    self._update_directory(raw)
+                    self.last_epoch = self.lock.epoch
+                return
             except IOError:
                 if not blocking:
                     raise
 
+    def _changed_slots(self, raw):
+        """Directory slots that differ between the last copy and raw"""
+        old = self._directory_raw
+        size = DIRECTORY_ENTRY.size
+        common = min(len(old), len(raw)) // size
+        if numpy is not None:
+            words = size // 8
+            a = numpy.frombuffer(old, dtype=numpy.uint64, count=common * words)
+            b = numpy.frombuffer(raw, dtype=numpy.uint64, count=common * words)
+            changed = numpy.flatnonzero(
+                (a != b).reshape(common, words).any(axis=1)
+            ).tolist()
+        else:
+            changed = [
+                i
+                for i in range(common)
+                if old[i * size : (i + 1) * size] != raw[i * size : (i + 1) * size]
+            ]
+        return changed + list(range(common, len(raw) // size))
+
+    def _remove_slot(self, i):
+        name = self.directory_by_idx.pop(i, None)
+        if name is not None and self._slots.get(name) == i:
+            del self.directory[name]
+            del self._slots[name]
+            return name
+        return None
+
+    def _update_directory(self, raw):
+        size = DIRECTORY_ENTRY.size
+        removed = []
+        added = []
+        for i in range(len(raw) // size, len(self._directory_raw) // size):
+            removed.append((self._remove_slot(i), i))
+        for i in self._changed_slots(raw):
+            removed.append((self._remove_slot(i), i))
+            stattype, value, path = DIRECTORY_ENTRY.unpack_from(raw, i * size)
+            path = path[: path.find(b"\x00")].decode("ascii")
+            if not path:
+                continue  # empty slot
+            self.directory[path] = StatsEntry(stattype, value)
+            self.directory_by_idx[i] = path
+            self._slots[path] = i
+            added.append((path, i))
+        self._directory_raw = raw
+        removed = [(name, i) for name, i in removed if name is not None]
+        for name, _ in removed:
+            self._trie.remove(name)
+        for name, _ in added:
+            self._trie.add(name)
+        if set(removed) != set(added):
+            # Names changed, not only the counters they point to
+            self._ls_cache.clear()
+
     def __getitem__(self, item, blocking=True):
         if not self.connected:
             self.connect()
@@ -231,20 +441,46 @@ class VPPStats:
     def __iter__(self):
         return iter(self.directory.items())
 
-    def set_errors(self, blocking=True):
-        """Return dictionary of error counters > 0"""
+    def _read(self, names, typed_arrays=None):
+        """Read counters names under one lock, raises IOError if the
+        segment changed underneath"""
+        with self.lock:
+            if self.lock.epoch != self.last_epoch:
+                raise IOError("Directory changed, retry")
+            return {
+                name: self.directory[name].get_counter(self, typed_arrays)
+                for name in names
+            }
+
+    def snapshot(self, patterns, blocking=True, typed_arrays=None):
+        """Return a consistent StatsSnapshot of the counters matching
+        patterns (see ls()).
+
+        All counters are copied under a single optimistic lock: if the
+        segment changes while they are read, the whole set is read
+        again. typed_arrays overrides the VPPStats setting."""
         if not self.connected:
             self.connect()
+        while True:
+            try:
+                names = self.ls(patterns)
+                timestamp = time.time()
+                monotonic = time.monotonic()
+                counters = self._read(names, typed_arrays)
+                return StatsSnapshot(counters, timestamp, monotonic, self.lock.epoch)
+            except IOError:
+                if not blocking:
+                    raise
 
-        errors = {k: v for k, v in self.directory.items() if k.startswith("/err/")}
+    def set_errors(self, blocking=True):
+        """Return dictionary of error counters > 0"""
+        errors = self.snapshot("^/err/", blocking, typed_arrays=True)
         result = {}
-        for k in errors:
-            try:
-                total = self[k].sum()
+        for k, counter in errors.items():
+            if isinstance(counter, StatsSimpleArray):
+                total = counter.sum()
                 if total:
                     result[k] = total
-            except KeyError:
-                pass
         return result
 
     def set_errors_str(self, blocking=True):
@@ -264,38 +500,87 @@ class VPPStats:
         return self.__getitem__(name, blocking).sum()
 
     def ls(self, patterns):
-        """Returns list of counters matching pattern"""
+        """Returns list of counters matching pattern
+
+        The literal prefix of each pattern is looked up in a path
+        segment trie, and only the names under it are matched. Results
+        are cached until counters are added or removed."""
         # pylint: disable=invalid-name
         if not self.connected:
             self.connect()
         if not isinstance(patterns, list):
             patterns = [patterns]
-        regex = [re.compile(i) for i in patterns]
         if self.last_epoch != self.epoch:
             self.refresh()
 
-        return [
-            k
-            for k, v in self.directory.items()
-            if any(re.match(pattern, k) for pattern in regex)
-        ]
+        with self._directory_lock:
+            if len(patterns) == 1:
+                indexes = self._ls_match(patterns[0])
+            else:
+                indexes = sorted(set().union(*map(self._ls_match, patterns)))
+            return [self.directory_by_idx[i] for i in indexes]
+
+    LS_CACHE_SIZE = 4096
+
+    def _ls_match(self, pattern):
+        """Directory indexes of the names matching pattern, memoized
+        until names are added, removed or moved"""
+        indexes = self._ls_cache.get(pattern)
+        if indexes is None:
+            regex = re.compile(pattern)
+            prefix = literal_prefix(pattern) if isinstance(pattern, str) else ""
+            indexes = sorted(
+                self._slots[k] for k in self._trie.prefixed(prefix) if regex.match(k)
+            )
+            if len(self._ls_cache) >= self.LS_CACHE_SIZE:
+                self._ls_cache.clear()
+            self._ls_cache[pattern] = indexes
+        return indexes
 
     def dump(self, counters, blocking=True):
-        """Given a list of counters return a dictionary of results"""
+        """Given a list of counters return a dictionary of results,
+        read consistently as in snapshot()"""
         if not self.connected:
             self.connect()
-        result = {}
-        for cnt in counters:
-            result[cnt] = self.__getitem__(cnt, blocking)
-        return result
+        while True:
+            try:
+                if self.last_epoch != self.epoch:
+                    self.refresh(blocking)
+                return self._read(counters)
+            except IOError:
+                if not blocking:
+                    raise
 
 
 class StatsLock:
-    """Stat segment optimistic locking"""
+    """Stat segment optimistic locking
+
+    The lock is reentrant: nested acquires keep the epoch of the
+    outermost one, which checks it on release. Nesting depth and epoch
+    are per thread, so threads sharing a VPPStats lock independently;
+    the directory updates of refresh() are serialized by a lock of
+    their own."""
 
     def __init__(self, stats):
         self.stats = stats
-        self.epoch = 0
+        self._local = threading.local()
+
+    @property
+    def epoch(self):
+        """Epoch recorded by the outermost acquire of this thread"""
+        return getattr(self._local, "epoch", 0)
+
+    @epoch.setter
+    def epoch(self, epoch):
+        self._local.epoch = epoch
+
+    @property
+    def depth(self):
+        return getattr(self._local, "depth", 0)
+
+    @depth.setter
+    def depth(self, depth):
+        self._local.depth = depth
 
     def __enter__(self):
         acquired = self.acquire(blocking=True)
@@ -307,6 +592,9 @@ class StatsLock:
 
     def acquire(self, blocking=True, timeout=-1):
         """Acquire the lock. Await in progress to go false. Record epoch."""
+        self.depth += 1
+        if self.depth > 1:
+            return True
         self.epoch = self.stats.epoch
         if timeout > 0:
             start = time.monotonic()
@@ -315,11 +603,15 @@ class StatsLock:
                 time.sleep(0.01)
                 if timeout > 0:
                     if start + time.monotonic() > timeout:
+                        self.depth -= 1
                         return False
         return True
 
     def release(self):
         """Check if data read while locked is valid"""
+        self.depth -= 1
+        if self.depth:
+            return
         if self.stats.in_progress or self.stats.epoch != self.epoch:
             raise IOError("Optimistic lock failed, retry")
 
@@ -393,6 +685,141 @@ class SimpleList(list):
         return sum(self)
 
 
+def _column_sums(rows, width, field):
+    """Per index sums over threads of rows of array.array"""
+    if not rows:
+        return array.array(COUNTER_TYPECODE)
+    return array.array(
+        COUNTER_TYPECODE, map(sum, zip(*(row[field::width] for row in rows)))
+    )
+
+
+class StatsSimpleArray:
+    """Simple counters as a threads x index matrix
+
+    array is a NumPy array of shape (threads, index), or without NumPy
+    a list of array.array rows. Indexing a thread returns its row, and
+    [:, index] a SimpleList like StatsSimpleList does."""
+
+    def __init__(self, matrix):
+        if numpy is not None:
+            matrix = matrix.reshape(matrix.shape[:2])
+        self.array = matrix
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self.array[item]
+        return SimpleList(int(row[item[1]]) for row in self.array)
+
+    def sum(self, axis=None):
+        """Sum of all counters, or per index over threads (axis=0), or
+        per thread (axis=1)"""
+        if numpy is not None:
+            s = self.array.sum(axis=axis, dtype=numpy.uint64)
+            return int(s) if axis is None else s
+        if axis is None:
+            return sum(map(sum, self.array))
+        if axis == 0:
+            return _column_sums(self.array, 1, 0)
+        return array.array(COUNTER_TYPECODE, map(sum, self.array))
+
+    def tolist(self):
+        """The counters as StatsSimpleList"""
+        if numpy is not None:
+            return StatsSimpleList(self.array.tolist())
+        return StatsSimpleList(row.tolist() for row in self.array)
+
+
+class StatsCombinedArray:
+    """Combined counters as a threads x index x (packets, octets) matrix
+
+    array is a NumPy array of shape (threads, index, 2), or without
+    NumPy a list of array.array rows of interleaved packets and octets.
+    Indexing a thread returns its row, and [:, index] a CombinedList
+    like StatsCombinedList does."""
+
+    def __init__(self, matrix):
+        self.array = matrix
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self.array[item]
+        i = item[1]
+        if numpy is not None:
+            return CombinedList(StatsTuple(c) for c in self.array[:, i].tolist())
+        return CombinedList(StatsTuple(row[2 * i : 2 * i + 2]) for row in self.array)
+
+    def _field(self, field):
+        if numpy is not None:
+            return self.array[:, :, field]
+        return [row[field::2] for row in self.array]
+
+    def packets(self):
+        """Packet counters, threads x index"""
+        return self._field(0)
+
+    def octets(self):
+        """Octet counters, threads x index"""
+        return self._field(1)
+
+    def _sum(self, field, axis):
+        if numpy is not None:
+            s = self.array[:, :, field].sum(axis=axis, dtype=numpy.uint64)
+            return int(s) if axis is None else s
+        rows = self.array
+        if axis is None:
+            return sum(sum(row[field::2]) for row in rows)
+        if axis == 0:
+            return _column_sums(rows, 2, field)
+        return array.array(COUNTER_TYPECODE, (sum(row[field::2]) for row in rows))
+
+    def sum_packets(self, axis=None):
+        """Sum of all packet counters, or per index over threads
+        (axis=0), or per thread (axis=1)"""
+        return self._sum(0, axis)
+
+    def sum_octets(self, axis=None):
+        """Sum of all octet counters, or per index over threads
+        (axis=0), or per thread (axis=1)"""
+        return self._sum(1, axis)
+
+    def tolist(self):
+        """The counters as StatsCombinedList"""
+        if numpy is not None:
+            return StatsCombinedList(
+                [StatsTuple(c) for c in row] for row in self.array.tolist()
+            )
+        return StatsCombinedList(
+            [StatsTuple(c) for c in zip(row[0::2], row[1::2])] for row in self.array
+        )
+
+
+class StatsSnapshot(dict):
+    """Counters read at the same instant, by name
+
+    timestamp is the wall clock time of the read, monotonic the
+    time.monotonic() time for computing rates, and epoch the directory
+    epoch the counters were read in."""
+
+    def __init__(self, counters, timestamp, monotonic, epoch):
+        super().__init__(counters)
+        self.timestamp = timestamp
+        self.monotonic = monotonic
+        self.epoch = epoch
+
+
 class StatsEntry:
     """An individual stats entry"""
 
@@ -425,19 +852,11 @@ class StatsEntry:
 
     def simple(self, stats):
         """Simple counter"""
-        counter = StatsSimpleList()
-        for threads in StatsVector(stats, self.value, "P"):
-            clist = [v[0] for v in StatsVector(stats, threads[0], "Q")]
-            counter.append(clist)
-        return counter
+        return StatsSimpleArray(counter_matrix(stats, self.value, 1))
 
     def combined(self, stats):
         """Combined counter"""
-        counter = StatsCombinedList()
-        for threads in StatsVector(stats, self.value, "P"):
-            clist = [StatsTuple(cnt) for cnt in StatsVector(stats, threads[0], "QQ")]
-            counter.append(clist)
-        return counter
+        return StatsCombinedArray(counter_matrix(stats, self.value, 2))
 
     def name(self, stats):
         """Name counter"""
@@ -450,17 +869,242 @@ class StatsEntry:
     SYMLINK_FMT1 = Struct("II")
     SYMLINK_FMT2 = Struct("Q")
 
+    SYMLINK_COUNTERS = {2: Struct("Q"), 3: Struct("QQ")}
+
     def symlink(self, stats):
-        """Symlink counter"""
+        """Symlink counter, reads only the linked index of each thread"""
         b = self.SYMLINK_FMT2.pack(self.value)
         index1, index2 = self.SYMLINK_FMT1.unpack(b)
         name = stats.directory_by_idx[index1]
-        return stats[name][:, index2]
+        entry = stats.directory[name]
+        if entry.type not in self.SYMLINK_COUNTERS:
+            return stats[name][:, index2]
+        fmt = self.SYMLINK_COUNTERS[entry.type]
+        values = [
+            fmt.unpack_from(stats.statseg, offset + index2 * fmt.size)
+            for offset, length in counter_vectors(stats, entry.value, fmt.size // 8)
+            if index2 < length
+        ]
+        if entry.type == 2:
+            return SimpleList(v[0] for v in values)
+        return CombinedList(StatsTuple(v) for v in values)
 
-    def get_counter(self, stats):
-        """Return a list of counters"""
+    def get_counter(self, stats, typed_arrays=None):
+        """Return a list of counters, or typed arrays if typed_arrays
+        (default stats.typed_arrays)"""
         if stats:
-            return self.function(stats)
+            counter = self.function(stats)
+            if typed_arrays is None:
+                typed_arrays = stats.typed_arrays
+            if not typed_arrays and isinstance(
+                counter, (StatsSimpleArray, StatsCombinedArray)
+            ):
+                return counter.tolist()
+            return counter
+
+
+StatsDelta = collections.namedtuple("StatsDelta", "index delta rate")
+StatsDelta.__doc__ = """Non-zero changes of a counter since the previous poll
+
+index lists the changed indexes (typically sw_if_index), delta their
+change summed over threads, (packets, octets) pairs for combined
+counters, and rate the change per second."""
+
+
+class StatsChanges(dict):
+    """StatsDelta of the changed counters, by name
+
+    timestamp is the wall clock time of the poll, and interval the
+    seconds since the previous one."""
+
+    def __init__(self, changes, timestamp, interval):
+        super().__init__(changes)
+        self.timestamp = timestamp
+        self.interval = interval
+
+
+def _counter_totals(counter):
+    """Per index totals over threads of a counter as a flat u64 array,
+    packets and octets interleaved, and their width. None for types
+    without deltas."""
+    if isinstance(counter, StatsCombinedArray):
+        if numpy is not None:
+            return counter.array.sum(axis=0, dtype=numpy.uint64).reshape(-1), 2
+        return _column_sums(counter.array, 1, 0), 2
+    if isinstance(counter, StatsSimpleArray):
+        return counter.sum(axis=0), 1
+    # Symlinks, a column of per-thread values
+    if isinstance(counter, CombinedList):
+        totals = [counter.sum_packets(), counter.sum_octets()]
+        width = 2
+    elif isinstance(counter, SimpleList):
+        totals = [counter.sum()]
+        width = 1
+    else:
+        return None, 0
+    if numpy is not None:
+        return numpy.array(totals, dtype=numpy.uint64), width
+    return array.array(COUNTER_TYPECODE, totals), width
+
+
+def _u64_zeros(n):
+    if numpy is not None:
+        return numpy.zeros(n, dtype=numpy.uint64)
+    return array.array(COUNTER_TYPECODE, bytes(8 * n))
+
+
+class _PolledCounter:
+    """Previous totals and sample ring of a polled counter"""
+
+    __slots__ = ("width", "prev", "ring", "first")
+
+    def __init__(self, totals, width, history, slot, first):
+        self.width = width
+        self.first = first
+        self.prev = _u64_zeros(len(totals))
+        self.prev[:] = totals
+        self.ring = [_u64_zeros(len(totals)) for _ in range(history)]
+        if numpy is not None:
+            self.ring = numpy.array(self.ring)
+        self.ring[slot][:] = totals
+
+    def resize(self, totals):
+        """Follow a counter that grew or shrank. New indexes start from
+        their current values, so they have no delta."""
+        m = min(len(totals), len(self.prev))
+        prev = _u64_zeros(len(totals))
+        prev[:] = totals
+        prev[:m] = self.prev[:m]
+        ring = [_u64_zeros(len(totals)) for _ in range(len(self.ring))]
+        if numpy is not None:
+            ring = numpy.array(ring)
+        for new, old in zip(ring, self.ring):
+            new[:] = totals
+            new[:m] = old[:m]
+        self.prev = prev
+        self.ring = ring
+
+    def deltas(self, totals):
+        """Changes since prev, taking a lower value as a counter reset"""
+        if numpy is not None:
+            return numpy.where(totals >= self.prev, totals - self.prev, totals)
+        return array.array(
+            COUNTER_TYPECODE,
+            (c - p if c >= p else c for c, p in zip(totals, self.prev)),
+        )
+
+    def changes(self, delta, interval):
+        """StatsDelta of the non-zero deltas, None if none"""
+        width = self.width
+        if numpy is not None:
+            if not delta.any():
+                return None
+            rows = delta.reshape(-1, width)
+            index = numpy.flatnonzero(rows.any(axis=1))
+            rows = rows[index]
+            if width == 1:
+                rows = rows.reshape(-1)
+            rate = rows / interval if interval else None
+            return StatsDelta(index, rows, rate)
+        index = []
+        rows = []
+        for i in range(len(delta) // width):
+            row = delta[i * width : (i + 1) * width]
+            if any(row):
+                index.append(i)
+                rows.append(row[0] if width == 1 else tuple(row))
+        if not index:
+            return None
+        rate = None
+        if interval:
+            if width == 1:
+                rate = [v / interval for v in rows]
+            else:
+                rate = [tuple(v / interval for v in row) for row in rows]
+        return StatsDelta(index, rows, rate)
+
+
+class StatsPoller:
+    """Deltas and rates of counters between polls
+
+    Each poll() takes a snapshot of the simple and combined counters
+    (and symlinks to them) matching patterns, and returns StatsChanges
+    with the non-zero changes since the previous poll, summed over
+    threads. The totals of the last history polls are kept in a ring
+    of preallocated arrays, see samples().
+
+        poller = StatsPoller(stats, ["^/if/", "^/err/", "^/nodes/"])
+        while True:
+            for name, change in poller.poll().items():
+                export(name, change.index, change.rate)
+            time.sleep(1)
+
+    A counter that goes down is taken as reset, and its value as the
+    delta. New counters and new indexes of resized counters start
+    without a delta. A counter missing from a poll, removed or no
+    longer matching patterns, is forgotten with its samples, so
+    samples() never returns totals older than the latest poll.
+    """
+
+    def __init__(self, stats, patterns, history=60):
+        self.stats = stats
+        self.patterns = patterns
+        self.history = history
+        self.counters = {}
+        self.times = [0.0] * history
+        self.count = 0
+        self.last = None
+
+    def poll(self, blocking=True):
+        """Take a sample, return the changes since the previous one"""
+        snapshot = self.stats.snapshot(self.patterns, blocking, typed_arrays=True)
+        now = snapshot.monotonic
+        interval = now - self.last if self.last is not None else None
+        slot = self.count % self.history
+        self.times[slot] = now
+        changes = {}
+        seen = set()
+        for name, counter in snapshot.items():
+            totals, width = _counter_totals(counter)
+            if totals is None:
+                continue
+            seen.add(name)
+            state = self.counters.get(name)
+            if state is None or state.width != width:
+                self.counters[name] = _PolledCounter(
+                    totals, width, self.history, slot, self.count
+                )
+                continue
+            if len(totals) != len(state.prev):
+                state.resize(totals)
+            change = state.changes(state.deltas(totals), interval)
+            if change is not None:
+                changes[name] = change
+            state.prev[:] = totals
+            state.ring[slot][:] = totals
+        if len(seen) != len(self.counters):
+            for name in self.counters.keys() - seen:
+                del self.counters[name]
+        self.count += 1
+        self.last = now
+        return StatsChanges(changes, snapshot.timestamp, interval)
+
+    def samples(self, name):
+        """(times, totals) of counter name in the kept samples, oldest
+        first. times are time.monotonic() values."""
+        state = self.counters[name]
+        n = min(self.history, self.count - state.first)
+        slots = [(self.count - n + i) % self.history for i in range(n)]
+        times = [self.times[slot] for slot in slots]
+        if numpy is not None:
+            totals = state.ring[slots]
+            if state.width == 2:
+                totals = totals.reshape(n, -1, 2)
+            return times, totals
+        rows = [state.ring[slot] for slot in slots]
+        if state.width == 2:
+            rows = [list(zip(row[0::2], row[1::2])) for row in rows]
+        return times, rows
 
 
 class TestStats(unittest.TestCase):
@@ -0,0 +1,154 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Compact container for large dumps.
+
+A decoded details message is a namedtuple of Python objects: every
+integer, address and nested struct is an object of its own, so a dump
+of a million NAT sessions takes gigabytes once decoded. MessageTable
+keeps the messages of a dump as they came off the wire, back to back
+in one buffer, and decodes on access:
+
+    sessions = vpp.api.nat44_user_session_v3_dump(..., _compact=True)
+    len(sessions)
+    sessions[10].inside_port         # LazyMessage, decodes one field
+    sessions.column("total_bytes")   # one field of every row
+"""
+
+import array
+import struct
+
+from .vpp_serializer import (
+    _typed_array_codes,
+    numpy,
+    scalar_packer,
+    typed_array_dtypes,
+)
+
+
+class MessageTable:
+    """Messages of type msg (a VPPMessage), stored in one buffer.
+
+    Rows are returned as LazyMessage objects, decoded with the
+    ntc and arrays options of VPPType.unpack.
+    """
+
+    def __init__(self, msg, ntc=False, arrays=False):
+        self.msg = msg
+        self.ntc = ntc
+        self.arrays = arrays
+        self._data = bytearray()
+        self._offsets = array.array("Q")
+        # Size of every row while they all have the same, else None
+        self._stride = None
+
+    def append(self, buf):
+        """Add one packed message."""
+        if not self._offsets:
+            self._stride = len(buf)
+        elif len(buf) != self._stride:
+            self._stride = None
+        self._offsets.append(len(self._data))
+        self._data += buf
+
+    def extend(self, bufs):
+        for buf in bufs:
+            self.append(buf)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _row(self, i):
+        start = self._offsets[i]
+        if i + 1 < len(self._offsets):
+            end = self._offsets[i + 1]
+        else:
+            end = len(self._data)
+        # One copy: the row must not keep a view of the buffer, which
+        # could then not grow.
+        row = bytes(memoryview(self._data)[start:end])
+        return self.msg.unpack_lazy(row, 0, self.ntc, self.arrays)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(j) for j in range(*i.indices(len(self)))]
+        return self._row(range(len(self))[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def materialize(self):
+        """All the rows as the namedtuples VPPType.unpack returns."""
+        return [row._materialize() for row in self]
+
+    def column(self, name):
+        """Field name of every row, as a list.
+
+        Numeric fields at a fixed offset are read straight from the
+        buffer, in one go when the rows have the same size (a strided
+        NumPy view, or struct.iter_unpack without NumPy). With arrays
+        set they are returned as a NumPy array or array.array instead
+        of a list.
+        """
+        i = self.msg.fields.index(name)
+        offset = self.msg.offsets[i]
+        p = scalar_packer(self.msg.packers[i])
+        if offset is None or p is None:
+            return [row[i] for row in self]
+        typed = self.arrays and p._type in typed_array_dtypes
+        fmt = p.packer.format
+        stride = self._stride
+        if stride is not None and numpy is not None:
+            column = numpy.ndarray(
+                (len(self),),
+                dtype=numpy.dtype(fmt),
+                buffer=self._data,
+                offset=offset,
+                strides=(stride,),
+            )
+            column = column.astype(column.dtype.newbyteorder("="))
+            return column if typed else column.tolist()
+        if stride is not None:
+            record = struct.Struct(
+                "%s%dx%s%dx" % (fmt[0], offset, fmt[1:], stride - offset - p.size)
+            )
+            values = [v for (v,) in record.iter_unpack(self._data)]
+        else:
+            unpack_from = p.packer.unpack_from
+            data = self._data
+            values = [unpack_from(data, o + offset)[0] for o in self._offsets]
+        if typed:
+            if numpy is not None:
+                dtype = numpy.dtype(typed_array_dtypes[p._type])
+                return numpy.array(values, dtype=dtype.newbyteorder("="))
+            return array.array(_typed_array_codes[p._type][0], values)
+        return values
+
+    @property
+    def nbytes(self):
+        """Memory used by the buffer and the row index."""
+        return len(self._data) + self._offsets.itemsize * len(self._offsets)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "<MessageTable %s: %d rows, %d bytes>" % (
+            self.msg.name,
+            len(self),
+            self.nbytes,
+        )
@@ -0,0 +1,240 @@
+#
+# Copyright (c) 2024 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+VPP shared memory transport.
+
+Attaches to the VPP API shared memory segment through libvppapiclient,
+VPP's C API client library (src/vpp-api/client), loaded with ctypes.
+Requests and replies go through the svm message queues of the segment
+instead of the API socket:
+
+    vpp = VPPApiClient(apidir=..., transport="shmem")
+    vpp.connect("papi", chroot_prefix=None)
+
+server_address is not used: the library maps the "/vpe-api" region,
+under chroot_prefix if VPP runs with an api-segment prefix. The
+process needs access to the segment, as for any C API client.
+
+The library keeps its connection state in globals, so one process has
+at most one shared memory connection at a time.
+
+With connect(), the library's receive thread hands events to the
+client through a callback and is suspended for the duration of each
+call, whose replies are read with vac_read(). With connect_sync()
+there is no receive thread and everything is read with read().
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import math
+import threading
+
+logger = logging.getLogger("vpp_papi.transport")
+logger.addHandler(logging.NullHandler())
+
+# vac_errno_t
+VAC_NOT_CONNECTED = -3
+VAC_SHM_NOT_READY = -4
+VAC_TIMEOUT = -5
+
+vac_callback_t = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_int)
+vac_error_callback_t = ctypes.CFUNCTYPE(
+    None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int
+)
+
+# Prototypes of vppapiclient.h, (restype, argtypes)
+PROTOTYPES = {
+    "vac_connect": (
+        ctypes.c_int,
+        [ctypes.c_char_p, ctypes.c_char_p, vac_callback_t, ctypes.c_int],
+    ),
+    "vac_disconnect": (ctypes.c_int, []),
+    "vac_read": (
+        ctypes.c_int,
+        [
+            ctypes.POINTER(ctypes.c_void_p),
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.c_ushort,
+        ],
+    ),
+    "vac_write": (ctypes.c_int, [ctypes.c_char_p, ctypes.c_int]),
+    "vac_free": (None, [ctypes.c_void_p]),
+    "vac_get_msg_index": (ctypes.c_int, [ctypes.c_char_p]),
+    "vac_msg_table_max_index": (ctypes.c_int, []),
+    "vac_rx_suspend": (None, []),
+    "vac_rx_resume": (None, []),
+    "vac_set_error_handler": (None, [vac_error_callback_t]),
+}
+
+_lib = None
+_lock = threading.Lock()
+# The connected transport, which the library callbacks are for
+_transport = None
+
+
+class VppTransportShmemIOError(IOError):
+    pass
+
+
+@vac_callback_t
+def _vac_callback_sync(data, length):
+    _transport.parent.msg_handler_sync(ctypes.string_at(data, length))
+
+
+@vac_callback_t
+def _vac_callback_async(data, length):
+    _transport.parent.msg_handler_async(ctypes.string_at(data, length))
+
+
+@vac_error_callback_t
+def _vac_error_handler(arg, msg, length):
+    logger.warning("vppapiclient: %s", ctypes.string_at(msg, length))
+
+
+def load_library(name=None):
+    """Load libvppapiclient, once per process. name defaults to the
+    library ctypes.util.find_library finds."""
+    global _lib
+    with _lock:
+        if _lib is not None:
+            return _lib
+        path = name or ctypes.util.find_library("vppapiclient")
+        path = path or "libvppapiclient.so"
+        try:
+            lib = ctypes.CDLL(path)
+        except OSError as e:
+            raise VppTransportShmemIOError(1, "Cannot load {}: {}".format(path, e))
+        for fn, (restype, argtypes) in PROTOTYPES.items():
+            f = getattr(lib, fn)
+            f.restype = restype
+            f.argtypes = argtypes
+        try:
+            # Not exported by every version of the library, which then
+            # sets up its heap itself.
+            mem_init = lib.vac_mem_init
+        except AttributeError:
+            pass
+        else:
+            mem_init.restype = None
+            mem_init.argtypes = [ctypes.c_size_t]
+            mem_init(0)
+        lib.vac_set_error_handler(_vac_error_handler)
+        _lib = lib
+        return lib
+
+
+class VppTransport:
+    VppTransportShmemIOError = VppTransportShmemIOError
+
+    def __init__(self, parent, read_timeout, server_address):
+        self.connected = False
+        self.read_timeout = read_timeout if read_timeout > 0 else None
+        self.parent = parent
+        self.server_address = server_address
+        self.vac = load_library()
+        self._message_table = None
+
+    def connect(self, name, pfx, msg_handler, rx_qlen, do_async=False):
+        global _transport
+        with _lock:
+            if _transport is not None and _transport is not self:
+                raise VppTransportShmemIOError(
+                    1, "A shared memory client is already connected"
+                )
+            _transport = self
+        if msg_handler is None:
+            # No receive thread
+            msg_handler = vac_callback_t()
+        rv = self.vac.vac_connect(name.encode("utf-8"), pfx, msg_handler, rx_qlen)
+        if rv != 0:
+            with _lock:
+                _transport = None
+            return rv
+        self.connected = True
+        self._message_table = None
+        return 0
+
+    def disconnect(self):
+        global _transport
+        rv = 0
+        if self.connected:
+            rv = self.vac.vac_disconnect()
+        self.connected = False
+        with _lock:
+            if _transport is self:
+                _transport = None
+        return rv
+
+    def suspend(self):
+        self.vac.vac_rx_suspend()
+
+    def resume(self):
+        self.vac.vac_rx_resume()
+
+    def get_callback(self, do_async):
+        return _vac_callback_async if do_async else _vac_callback_sync
+
+    def get_msg_index(self, name):
+        i = self.vac.vac_get_msg_index(name.encode("utf-8"))
+        # ~0 for unknown messages
+        return i if i > 0 else 0
+
+    def msg_table_max_index(self):
+        return self.vac.vac_msg_table_max_index()
+
+    @property
+    def message_table(self):
+        """name_crc to message id of the messages the client has
+        definitions for. The library only looks names up, it does not
+        list its table."""
+        if self._message_table is None:
+            table = {}
+            for name, msg in self.parent.messages.items():
+                n = name + "_" + msg.crc[2:]
+                i = self.get_msg_index(n)
+                if i > 0:
+                    table[n] = i
+            self._message_table = table
+        return self._message_table
+
+    def write(self, buf):
+        """Send a binary-packed message to VPP."""
+        if not self.connected:
+            raise VppTransportShmemIOError(1, "Not connected")
+        rv = self.vac.vac_write(bytes(buf), len(buf))
+        if rv != 0:
+            raise VppTransportShmemIOError(rv, "vac_write failed")
+
+    def read(self, timeout=None):
+        """Return the next message, or None on timeout. The library
+        counts the timeout in whole seconds, 0 waiting forever."""
+        if not self.connected:
+            raise VppTransportShmemIOError(1, "Not connected")
+        if timeout is None:
+            timeout = self.read_timeout
+        seconds = 0 if timeout is None else min(max(math.ceil(timeout), 1), 65535)
+        data = ctypes.c_void_p()
+        length = ctypes.c_int()
+        rv = self.vac.vac_read(ctypes.byref(data), ctypes.byref(length), seconds)
+        if rv == VAC_TIMEOUT:
+            return None
+        if rv != 0:
+            raise VppTransportShmemIOError(rv, "vac_read failed")
+        try:
+            return ctypes.string_at(data.value, length.value)
+        finally:
+            self.vac.vac_free(data.value)
@@ -1,6 +1,8 @@
 #
 # VPP Unix Domain Socket Transport.
 #
+import collections
+import os
 import socket
 import struct
 import threading
@@ -18,30 +20,257 @@ class VppTransportSocketIOError(IOError):
     pass
 
 
+class Wakeup:
+    """Shutdown signal for the reader thread, an eventfd or a self-pipe.
+
+    Implements the subset of the multiprocessing.Queue interface used
+    by VppTransport for its shutdown queue.
+    """
+
+    def __init__(self):
+        if hasattr(os, "eventfd"):
+            self._r = self._w = os.eventfd(0, os.EFD_CLOEXEC)
+        else:
+            self._r, self._w = os.pipe()
+
+    def fileno(self):
+        return self._r
+
+    def put(self, obj):
+        if self._r == self._w:
+            os.eventfd_write(self._w, 1)
+        else:
+            os.write(self._w, b"\x01")
+
+    def close(self):
+        if self._r is None:
+            return
+        os.close(self._r)
+        if self._w != self._r:
+            os.close(self._w)
+        self._r = self._w = None
+
+    def join_thread(self):
+        pass
+
+    def __del__(self):
+        self.close()
+
+
+class SendBuffer:
+    """Framed messages, back to back in one reusable buffer.
+
+    Messages of fixed size are packed in place with VPPType.pack_into,
+    so a batch of requests is sent with a single system call and no
+    per message copies:
+
+        sb = transport.send_buffer()
+        for route in routes:
+            sb.pack(msg, {"_vl_msg_id": i, "route": route, ...})
+        transport.write_buffer(sb)
+    """
+
+    def __init__(self, header, size=65536):
+        self.header = header
+        self.length = 0
+        self.count = 0
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, size):
+        need = self.length + size
+        if need > len(self._buf):
+            buf = bytearray(max(need, 2 * len(self._buf)))
+            buf[: self.length] = self._view[: self.length]
+            self._view.release()
+            self._buf = buf
+            self._view = memoryview(buf)
+
+    def _frame(self, size):
+        self.header.pack_into(self._view, self.length, 0, size, 0)
+        self.length += self.header.size + size
+        self.count += 1
+
+    def pack(self, msg, data, kwargs=None):
+        """Pack a msg (VPPMessage) from data, return its size."""
+        offset = self.length + self.header.size
+        if msg.fixed_size:
+            self._reserve(self.header.size + msg.size)
+            size = msg.pack_into(self._view, offset, data, kwargs)
+        else:
+            b = msg.pack(data, kwargs)
+            size = len(b)
+            self._reserve(self.header.size + size)
+            self._view[offset : offset + size] = b
+        self._frame(size)
+        return size
+
+    def add(self, buf):
+        """Append an already packed message."""
+        self._reserve(self.header.size + len(buf))
+        offset = self.length + self.header.size
+        self._view[offset : offset + len(buf)] = buf
+        self._frame(len(buf))
+
+    def getbuffer(self):
+        """The framed messages, as a memoryview."""
+        return self._view[: self.length]
+
+    def clear(self):
+        self.length = 0
+        self.count = 0
+
+
+class RecvBuffer:
+    """Receive ring for framed messages.
+
+    One recv_into() reads as much as the socket has ready into a large
+    buffer, and every complete message in it is returned as a
+    memoryview slice of that buffer, without copying. Buffers are only
+    ever appended to: when one is full, the partial message at its end
+    is carried over to the next buffer and the full one is retired.
+    A retired buffer is reused once no message slice of it is alive
+    any more, which a bytearray tells by refusing to resize while
+    views of it exist.
+
+    A retained message keeps its whole buffer alive, so messages that
+    outlive their decoding (events, lazily decoded replies and typed
+    arrays) are copied with bytes() before they are handed out.
+    """
+
+    # Switch buffers when less than this is left to receive into.
+    min_recv = 4096
+
+    def __init__(self, header, size=262144, pool=4):
+        self.header = header
+        self.size = size
+        self.pool = pool
+        self._free = []
+        self._retired = []
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first unparsed byte
+        self._end = 0  # end of received data
+        self._need = header.size  # bytes of the next message from _start
+
+    @staticmethod
+    def _in_use(buf):
+        try:
+            buf.append(0)
+        except BufferError:
+            return True
+        buf.pop()
+        return False
+
+    def _get(self, size):
+        retired = []
+        for buf in self._retired:
+            if self._in_use(buf):
+                retired.append(buf)
+            elif len(self._free) < self.pool:
+                self._free.append(buf)
+        self._retired = retired
+        for i, buf in enumerate(self._free):
+            if len(buf) >= size:
+                return self._free.pop(i)
+        return bytearray(max(size, self.size))
+
+    def _switch(self):
+        pending = self._end - self._start
+        buf = self._get(max(self._need, pending + self.min_recv))
+        view = memoryview(buf)
+        view[:pending] = self._view[self._start : self._end]
+        self._view.release()
+        self._retired.append(self._buf)
+        self._buf = buf
+        self._view = view
+        self._start = 0
+        self._end = pending
+
+    def recv(self, sock):
+        """Receive from sock, return the list of complete messages or
+        None when the peer has closed the connection."""
+        size = len(self._buf)
+        if size - self._end < self.min_recv or size - self._start < self._need:
+            self._switch()
+        got = sock.recv_into(self._view[self._end :])
+        if got <= 0:
+            return None
+        self._end += got
+
+        msgs = []
+        view = self._view
+        hdrlen = self.header.size
+        unpack_from = self.header.unpack_from
+        start = self._start
+        end = self._end
+        while end - start >= hdrlen:
+            _, length, _ = unpack_from(view, start)
+            if end - start < hdrlen + length:
+                self._need = hdrlen + length
+                break
+            msgs.append(view[start + hdrlen : start + hdrlen + length])
+            start += hdrlen + length
+        else:
+            self._need = hdrlen
+        self._start = start
+        return msgs
+
+
 class VppTransport:
     VppTransportSocketIOError = VppTransportSocketIOError
 
-    def __init__(self, parent, read_timeout, server_address):
+    def __init__(self, parent, read_timeout, server_address, mp_queues=False):
+        """mp_queues selects multiprocessing queues between the reader
+        thread and read(). They are only needed when the transport is
+        read from another process. By default an in-process SimpleQueue
+        is used, with a Wakeup to stop the reader thread, which avoids
+        pickling every message through a pipe and feeder thread."""
         self.connected = False
         self.read_timeout = read_timeout if read_timeout > 0 else None
         self.parent = parent
         self.server_address = server_address
         self.header = struct.Struct(">QII")
         self.message_table = {}
+        self.mp_queues = mp_queues
         # These queues can be accessed async.
         # They are always up, but replaced on connect.
-        # TODO: Use multiprocessing.Pipe instead of multiprocessing.Queue
-        # if possible.
-        self.sque = multiprocessing.Queue()
-        self.q = multiprocessing.Queue()
+        self.sque, self.q = self._new_queues()
         # The following fields are set in connect().
         self.message_thread = None
         self.socket = None
+        # Receive ring, and received messages not yet handed out.
+        self.rxbuf = RecvBuffer(self.header)
+        self.frames = collections.deque()
+
+    def _new_queues(self):
+        if self.mp_queues:
+            return multiprocessing.Queue(), multiprocessing.Queue()
+        return Wakeup(), queue.SimpleQueue()
 
     def msg_thread_func(self):
+        if self.mp_queues:
+            wakeup = self.sque._reader
+        else:
+            wakeup = self.sque
         while True:
+            while self.frames:
+                msg = self.frames.popleft()
+                if self.mp_queues:
+                    msg = bytes(msg)
+                # Put either to local queue or if context == 0
+                # callback queue
+                if not self.do_async and self.parent.has_context(msg):
+                    self.q.put(msg)
+                else:
+                    # Events may be kept by the client, copy them out
+                    # of the receive buffer.
+                    self.parent.msg_handler_async(bytes(msg))
             try:
-                rlist, _, _ = select.select([self.socket, self.sque._reader], [], [])
+                rlist, _, _ = select.select([self.socket, wakeup], [], [])
             except (socket.error, ValueError):
                 # Terminate thread
                 logging.error("select failed")
@@ -49,26 +278,19 @@ class VppTransport:
                 return
 
             for r in rlist:
-                if r == self.sque._reader:
+                if r == wakeup:
                     # Terminate
                     self.q.put(None)
                     return
 
                 elif r == self.socket:
                     try:
-                        msg = self._read()
-                        if not msg:
+                        if not self._recv():
                             self.q.put(None)
                             return
                     except socket.error:
                         self.q.put(None)
                         return
-                    # Put either to local queue or if context == 0
-                    # callback queue
-                    if not self.do_async and self.parent.has_context(msg):
-                        self.q.put(msg)
-                    else:
-                        self.parent.msg_handler_async(msg)
                 else:
                     raise VppTransportSocketIOError(2, "Unknown response from select")
 
@@ -84,6 +306,8 @@ class VppTransport:
         # Create a UDS socket
         self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self.socket.settimeout(self.read_timeout)
+        self.rxbuf = RecvBuffer(self.header)
+        self.frames.clear()
 
         # Connect the socket to the port where the server is listening
         try:
@@ -97,12 +321,12 @@ class VppTransport:
         # Queues' feeder threads from previous connect may still be sending.
         # Close and join to avoid any errors.
         self.sque.close()
-        self.q.close()
         self.sque.join_thread()
-        self.q.join_thread()
+        if self.mp_queues:
+            self.q.close()
+            self.q.join_thread()
         # Finally safe to replace.
-        self.sque = multiprocessing.Queue()
-        self.q = multiprocessing.Queue()
+        self.sque, self.q = self._new_queues()
         self.message_thread = threading.Thread(target=self.msg_thread_func)
 
         # Initialise sockclnt_create
@@ -184,45 +408,48 @@ class VppTransport:
         if not self.connected:
             raise VppTransportSocketIOError(1, "Not connected")
 
-        # Send header
+        # Send header and message in one system call
         header = self.header.pack(0, len(buf), 0)
         try:
-            self.socket.sendall(header)
-            self.socket.sendall(buf)
+            sent = self.socket.sendmsg((header, buf))
+            if sent < len(header) + len(buf):
+                self.socket.sendall(memoryview(header + bytes(buf))[sent:])
         except socket.error as err:
             raise VppTransportSocketIOError(1, "Sendall error: {err!r}".format(err=err))
 
-    def _read_fixed(self, size):
-        """Repeat receive until fixed size is read. Return empty on error."""
-        buf = bytearray(size)
-        view = memoryview(buf)
-        left = size
-        while 1:
-            got = self.socket.recv_into(view, left)
-            if got <= 0:
-                # Read error.
-                return ""
-            if got >= left:
-                # TODO: Raise if got > left?
-                break
-            left -= got
-            view = view[got:]
-        return buf
+    def send_buffer(self, size=65536):
+        """Return a SendBuffer framing messages for this transport."""
+        return SendBuffer(self.header, size)
 
-    def _read(self):
-        """Read single complete message, return it or empty on error."""
-        hdr = self._read_fixed(16)
-        if not hdr:
-            return
-        (_, hdrlen, _) = self.header.unpack(hdr)  # If at head of message
+    def write_buffer(self, sendbuf):
+        """Send all messages in a SendBuffer and clear it."""
+        if not self.connected:
+            raise VppTransportSocketIOError(1, "Not connected")
+        try:
+            self.socket.sendall(sendbuf.getbuffer())
+        except socket.error as err:
+            raise VppTransportSocketIOError(1, "Sendall error: {err!r}".format(err=err))
+        sendbuf.clear()
+
+    def _recv(self):
+        """Receive into the ring and queue the complete messages.
+        Return False when the connection is closed."""
+        msgs = self.rxbuf.recv(self.socket)
+        if msgs is None:
+            return False
+        self.frames.extend(msgs)
+        return True
 
-        # Read rest of message
-        msg = self._read_fixed(hdrlen)
-        if hdrlen == len(msg):
-            return msg
-        raise VppTransportSocketIOError(1, "Unknown socket read error")
+    def _read(self):
+        """Read single complete message, return it or None on error."""
+        while not self.frames:
+            if not self._recv():
+                return None
+        return self.frames.popleft()
 
     def read(self, timeout=None):
+        """Return the next reply, a memoryview into the receive buffer
+        to decode right away, or None on timeout."""
         if not self.connected:
             raise VppTransportSocketIOError(1, "Not connected")
         if timeout is None: